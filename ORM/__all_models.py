@@ -5,5 +5,15 @@ from .models import (
     Question,
     Option,
     Answer,
-    AnswerOption
+    AnswerOption,
+    Job,
+    ArchivedAnswer,
+    SurveySnapshot,
+    TextStat,
+    TextLengthBucket,
+    TextTerm,
+    TextResponseHash,
+    RespondentSketch,
+    Respondent,
+    OptionBitmap,
 )
\ No newline at end of file
@@ -1,5 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime, Enum, VARCHAR
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, Boolean, ForeignKey, DateTime, Enum, VARCHAR, Index, DDL, event,
+    LargeBinary,
+)
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin
 from db import SqlAlchemyBase
@@ -19,6 +22,11 @@ class QuestionType(enum.Enum):
     FILE = "file"
 
 
+# Questions answered by picking options and by typing text
+CHOICE_TYPES = (QuestionType.SINGLE_CHOICE, QuestionType.MULTIPLE_CHOICE, QuestionType.LIMITED_CHOICE)
+TEXT_TYPES = (QuestionType.TEXT, QuestionType.WORD, QuestionType.STRING)
+
+
 class User(SqlAlchemyBase, UserMixin):
     """
     ORM Class of user
@@ -31,7 +39,8 @@ class User(SqlAlchemyBase, UserMixin):
     password_hash = Column(VARCHAR(162))
     created_at = Column(DateTime, default=datetime.now)
     is_admin = Column(Boolean, default=False)
-    surveys = relationship("Survey", backref="author")
+    # Children are removed by deletion.py or ON DELETE (migrations/v0004_cascade_foreign_keys.py), not by the ORM
+    surveys = relationship("Survey", backref="author", passive_deletes=True)
 
 
 class Survey(SqlAlchemyBase):
@@ -43,11 +52,12 @@ class Survey(SqlAlchemyBase):
     id = Column(Integer, primary_key=True)
     title = Column(VARCHAR(100))
     description = Column(Text)
-    author_id = Column(Integer, ForeignKey("users.id"))
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
-    questions = relationship("Question", backref="survey")
+    questions = relationship("Question", backref="survey", passive_deletes=True)
     require_login = Column(Boolean, default=False)  # Новое поле
+    version = Column(Integer, default=1)  # Bumped on every change of the survey or its answers, used in ETags
 
 
 class Question(SqlAlchemyBase):
@@ -57,13 +67,13 @@ class Question(SqlAlchemyBase):
     __tablename__ = "questions"
 
     id = Column(Integer, primary_key=True)
-    survey_id = Column(Integer, ForeignKey("surveys.id"))
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"))
     type = Column(Enum(QuestionType))
     text = Column(VARCHAR(500))
     is_required = Column(Boolean, default=False)
     choice_limit = Column(Integer, nullable=True)
-    options = relationship("Option", backref="question")
-    answers = relationship("Answer", backref="question")
+    options = relationship("Option", backref="question", passive_deletes=True)
+    answers = relationship("Answer", backref="question", passive_deletes=True)
 
 
 class Option(SqlAlchemyBase):
@@ -73,7 +83,7 @@ class Option(SqlAlchemyBase):
     __tablename__ = "options"
 
     id = Column(Integer, primary_key=True)
-    question_id = Column(Integer, ForeignKey("questions.id"))
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"))
     text = Column(VARCHAR(200))
 
 
@@ -82,10 +92,20 @@ class Answer(SqlAlchemyBase):
     ORM Class of answer
     """
     __tablename__ = "answers"
+    # Created by migrations/v0003_answers_indexes.py, v0007_answers_fulltext.py, v0008_answers_keyset_index.py
+    # and v0013_answers_analyzed.py on existing databases
+    __table_args__ = (
+        Index("ix_answers_question_id", "question_id", "id"),
+        Index("ix_answers_question_user", "question_id", "user_id"),
+        Index("ix_answers_question_ip", "question_id", "ip_address"),
+        Index("ix_answers_question_created", "question_id", "created_at"),
+        Index("ix_answers_analyzed", "analyzed", "id"),
+        Index("ft_answers_text_response", "text_response", mysql_prefix="FULLTEXT").ddl_if(dialect=("mysql", "mariadb")),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    question_id = Column(Integer, ForeignKey("questions.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"))
     text_response = Column(Text, nullable=True)
     file_path = Column(VARCHAR(300), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -96,14 +116,176 @@ class Answer(SqlAlchemyBase):
     os = Column(VARCHAR(50))
     language = Column(VARCHAR(10))
     timezone = Column(VARCHAR(50))
+    # Added to text analytics, respondent sketches and option bitmaps (see analytics.py)
+    analyzed = Column(Boolean, default=False, nullable=False)
     options = relationship("Option", secondary="answer_options")
 
 
+# SQLite full-text search over answers.text_response (see search.py): FTS5 table mirrored by triggers
+ANSWERS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(text_response, content='answers', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_insert AFTER INSERT ON answers BEGIN "
+    "INSERT INTO answers_fts (rowid, text_response) VALUES (new.id, new.text_response); END",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_delete AFTER DELETE ON answers BEGIN "
+    "INSERT INTO answers_fts (answers_fts, rowid, text_response) VALUES ('delete', old.id, old.text_response); END",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_update AFTER UPDATE OF text_response ON answers BEGIN "
+    "INSERT INTO answers_fts (answers_fts, rowid, text_response) VALUES ('delete', old.id, old.text_response); "
+    "INSERT INTO answers_fts (rowid, text_response) VALUES (new.id, new.text_response); END",
+]
+for statement in ANSWERS_FTS_DDL:
+    event.listen(Answer.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Answer.__table__, "before_drop", DDL("DROP TABLE IF EXISTS answers_fts").execute_if(dialect="sqlite"))
+
+
 class AnswerOption(SqlAlchemyBase):
     """
     ORM Class of option for answer
     """
     __tablename__ = "answer_options"
 
-    answer_id = Column(Integer, ForeignKey("answers.id"), primary_key=True)
-    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True)
+    answer_id = Column(Integer, ForeignKey("answers.id", ondelete="CASCADE"), primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id", ondelete="CASCADE"), primary_key=True)
+
+
+class Job(SqlAlchemyBase):
+    """
+    ORM Class of background job (see jobs.py)
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(VARCHAR(50))
+    target_id = Column(Integer)
+    status = Column(VARCHAR(20), default="pending")  # pending, running, done, failed
+    created_by = Column(Integer, nullable=True)  # Not a foreign key, jobs outlive deleted users
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedAnswer(SqlAlchemyBase):
+    """
+    ORM Class of answer moved out of the answers table by archive.py (no foreign keys, compressed on MariaDB)
+    """
+    __tablename__ = "answers_archive"
+    __table_args__ = (
+        Index("ix_answers_archive_survey", "survey_id"),
+        {"mysql_row_format": "COMPRESSED"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Id in the answers table
+    survey_id = Column(Integer)
+    user_id = Column(Integer, nullable=True)
+    question_id = Column(Integer)
+    text_response = Column(Text, nullable=True)
+    file_path = Column(VARCHAR(300), nullable=True)
+    created_at = Column(DateTime)
+    ip_address = Column(VARCHAR(46))
+    user_agent = Column(VARCHAR(200))
+    browser = Column(VARCHAR(200))
+    device_type = Column(VARCHAR(50))
+    os = Column(VARCHAR(50))
+    language = Column(VARCHAR(10))
+    timezone = Column(VARCHAR(50))
+    option_ids = Column(Text, nullable=True)  # answer_options rows, comma separated
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SurveySnapshot(SqlAlchemyBase):
+    """
+    ORM Class of stats frozen when answers of the survey were archived
+    """
+    __tablename__ = "survey_snapshots"
+
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True)
+    stats = Column(Text)  # JSON of stats.compute_stats()
+    answers_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TextStat(SqlAlchemyBase):
+    """
+    ORM Class of incremental analytics of a text question (see text_analytics.py)
+    """
+    __tablename__ = "text_stats"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    responses = Column(Integer, default=0)
+    total_length = Column(BigInteger, default=0)
+    tokens = Column(BigInteger, default=0)
+    distinct_responses = Column(Integer, default=0)
+
+
+class TextLengthBucket(SqlAlchemyBase):
+    """
+    ORM Class of response length histogram bucket (text_analytics.LENGTH_BUCKETS)
+    """
+    __tablename__ = "text_length_buckets"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, default=0)
+
+
+class TextTerm(SqlAlchemyBase):
+    """
+    ORM Class of space-saving term counter, count overestimates the term frequency by at most error
+    """
+    __tablename__ = "text_terms"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    term = Column(VARCHAR(64), primary_key=True)
+    count = Column(Integer, default=0)
+    error = Column(Integer, default=0)
+
+
+class TextResponseHash(SqlAlchemyBase):
+    """
+    ORM Class of distinct response of a text question by its 64-bit digest, count > 1 means duplicates
+    """
+    __tablename__ = "text_response_hashes"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    digest = Column(BigInteger, primary_key=True, autoincrement=False)
+    count = Column(Integer, default=0)
+
+
+class RespondentSketch(SqlAlchemyBase):
+    """
+    ORM Class of HyperLogLog sketch of respondents of a survey (see sketches.py)
+    """
+    __tablename__ = "respondent_sketches"
+
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(VARCHAR(20), primary_key=True)  # survey, question, day or a segment column (browser, os, ...)
+    key = Column(VARCHAR(200), primary_key=True)  # question id, date, segment value, empty for the survey
+    registers = Column(LargeBinary)  # precision byte + zlib compressed registers
+
+
+class Respondent(SqlAlchemyBase):
+    """
+    ORM Class of respondent of a survey numbered in order of first submission (see bitmaps.py)
+    """
+    __tablename__ = "respondents"
+    # Created by migrations/v0011_option_bitmaps.py on existing databases
+    __table_args__ = (Index("ix_respondents_survey_key", "survey_id", "key", unique=True),)
+
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True)
+    ordinal = Column(Integer, primary_key=True, autoincrement=False)
+    key = Column(VARCHAR(60))  # submissions.dedup_key: user:<id> or ip:<address>
+    user_id = Column(Integer, nullable=True)
+    ip_address = Column(VARCHAR(46))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OptionBitmap(SqlAlchemyBase):
+    """
+    ORM Class of chunk of the bitmap of respondents who picked an option (see bitmaps.py)
+    """
+    __tablename__ = "option_bitmaps"
+
+    option_id = Column(Integer, ForeignKey("options.id", ondelete="CASCADE"), primary_key=True)
+    chunk = Column(Integer, primary_key=True, autoincrement=False)  # ordinal >> 16
+    container = Column(LargeBinary)  # kind byte + sorted uint16 array, runs or bitset of ordinal & 0xFFFF
@@ -0,0 +1,181 @@
+# analytics.py
+"""
+Analytics consumer module.
+Submissions only insert answers (answers.analyzed is false), text analytics, respondent sketches and option bitmaps
+are updated off the request by a consumer thread of every process. It claims the oldest answers not analyzed yet with
+SELECT ... FOR UPDATE SKIP LOCKED, so consumers of different processes take different answers, updates analytics
+once per batch (a few statements per question and survey, however many answers the batch has) and marks the answers
+analyzed in the same transaction. Stats lag behind submissions by about ANALYTICS_INTERVAL seconds.
+
+Edits and deletions take answers back out of analytics only if they were analyzed (see api.update_answer).
+
+Example (without workers, e.g. after seeding):
+    python analytics.py run
+"""
+import os
+import atexit
+import logging
+import argparse
+import threading
+
+import sqlalchemy as sa
+from flask import current_app
+
+from db import create_session
+from ORM.models import Question, Answer
+import bitmaps
+import sketches
+import text_analytics
+
+logger = logging.getLogger("questionnaire.analytics")
+
+BATCH_SIZE = 1000
+COLUMNS = (
+    Answer.id, Answer.question_id, Answer.user_id, Answer.ip_address, Answer.text_response, Answer.created_at,
+    Answer.browser, Answer.os, Answer.device_type, Answer.language,
+)
+
+
+def analyze(db_session, rows):
+    """
+    Adds answer rows (mappings of Answer columns) to analytics. Commit is up to the caller.
+    """
+    selected = bitmaps.selected_options(db_session, Answer, rows)
+    rows = [{**row, "option_ids": selected.get(row["id"], [])} for row in rows]
+    text_analytics.record(db_session, rows)
+    sketches.record(db_session, rows)
+    bitmaps.record(db_session, rows)
+
+
+def process(db_session, batch_size=BATCH_SIZE, survey_id=None):
+    """
+    Analyzes the oldest pending answers (of the survey) in one transaction, returns their number
+    """
+    query = (
+        sa.select(*COLUMNS)
+        .where(Answer.analyzed == sa.false())
+        .order_by(Answer.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    if survey_id is not None:
+        query = query.where(Answer.question_id.in_(sa.select(Question.id).where(Question.survey_id == survey_id)))
+    rows = db_session.execute(query).mappings().all()
+    if rows:
+        analyze(db_session, rows)
+        db_session.execute(
+            sa.update(Answer).where(Answer.id.in_([row["id"] for row in rows])).values(analyzed=True),
+            execution_options={"synchronize_session": False},
+        )
+    db_session.commit()
+    return len(rows)
+
+
+def run_pending(db_session, batch_size=BATCH_SIZE, survey_id=None):
+    """
+    Analyzes pending answers (of the survey) until there are none, returns their number.
+    Answers claimed by other consumers are skipped.
+    """
+    count = 0
+    while (processed := process(db_session, batch_size, survey_id)):
+        count += processed
+    return count
+
+
+def pending(db_session, survey_id):
+    """
+    True if some answers of the survey aren't analyzed yet
+    """
+    return db_session.execute(
+        sa.select(Answer.id)
+        .join(Question, Question.id == Answer.question_id)
+        .where(Question.survey_id == survey_id, Answer.analyzed == sa.false())
+        .limit(1),
+    ).first() is not None
+
+
+class AnalyticsConsumer:
+    """
+    Analyzes pending answers in a thread
+    """
+    def __init__(self, batch_size=BATCH_SIZE, interval=1.0):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            db_session = create_session()
+            try:
+                run_pending(db_session, self.batch_size)
+            except Exception:
+                db_session.rollback()
+                logger.exception("Failed to analyze answers, retrying in %s s", self.interval)
+            finally:
+                db_session.close()
+            self._stopped.wait(self.interval)
+
+    def start(self):
+        """
+        Starts the thread once per process (threads don't survive forking of workers)
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-consumer", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+
+def _start_consumer():
+    # Started by the first request, so importing the app doesn't touch the database
+    if current_app.config["ANALYTICS_WORKER"]:
+        current_app.extensions["analytics"].start()
+
+
+def init_app(app):
+    """
+    Creates the analytics consumer. Configuration:
+    ANALYTICS_WORKER - analyze answers in a thread of this process, started by the first request
+        (env ANALYTICS_WORKER, default on)
+    ANALYTICS_BATCH_SIZE - answers per transaction (env ANALYTICS_BATCH_SIZE)
+    ANALYTICS_INTERVAL - seconds between checks for new answers (env ANALYTICS_INTERVAL)
+    """
+    app.config.setdefault("ANALYTICS_WORKER", os.environ.get("ANALYTICS_WORKER", "1") == "1")
+    app.config.setdefault("ANALYTICS_BATCH_SIZE", int(os.environ.get("ANALYTICS_BATCH_SIZE", BATCH_SIZE)))
+    app.config.setdefault("ANALYTICS_INTERVAL", float(os.environ.get("ANALYTICS_INTERVAL", 1)))
+
+    app.extensions["analytics"] = AnalyticsConsumer(
+        batch_size=app.config["ANALYTICS_BATCH_SIZE"], interval=app.config["ANALYTICS_INTERVAL"],
+    )
+    app.before_request(_start_consumer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics of submitted answers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="analyze pending answers")
+    run.add_argument("--survey", type=int, help="only answers of this survey")
+    run.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="answers per transaction")
+    args = parser.parse_args()
+
+    db_session = create_session()
+    try:
+        print(f"{run_pending(db_session, args.batch_size, args.survey)} answers analyzed")
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,43 @@
 """
 API module.
 """
-from flask import Blueprint, request, jsonify
+import io
+import csv
+import datetime
+
+from flask import (
+    Blueprint, Response, request, jsonify, current_app, send_from_directory, url_for, stream_with_context,
+)
 from flask_jwt_extended import (
     create_access_token, create_refresh_token, jwt_required,
     get_jwt_identity, get_jwt, verify_jwt_in_request,
 )
+from flask_login import current_user
 from werkzeug.security import check_password_hash
 from functools import wraps
+import sqlalchemy as sa
 from db import create_session
-from ORM.models import User, Survey, Question, Option, Answer, AnswerOption
+from ORM.models import (
+    User, Survey, Question, QuestionType, TEXT_TYPES, Option, Answer, AnswerOption, Job, SurveySnapshot,
+)
+import profiling
+import jobs
+import bitmaps
+import crosstab
+import sketches
+import timeseries
+import text_analytics
+from serializers import USER, SURVEY, ANSWER, dump_answers, dump_survey_graph, selected_options
+from caching import conditional, make_etag, survey_version, bump_survey_version
+from survey_definitions import parse_survey_json, create_surveys
+from search import MAX_PER_PAGE, search_responses
+import stats
 
 api_bp = Blueprint("api", __name__ )
 
+# Exported CSV is streamed in pieces of about this many characters
+EXPORT_CHUNK_SIZE = 65536
+
 # Custom decorators for access control
 def admin_required():
     def wrapper(fn):
@@ -160,18 +185,14 @@ def refresh():
 @api_bp.route("/users", methods=["GET"])
 @admin_required()
 def get_users():
+    try:
+        fields = USER.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
     db_session = create_session()
-    users = db_session.query(User).all()
-    result = [
-        {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "created_at": user.created_at.isoformat(),
-            "is_admin": user.is_admin,
-        } for user in users
-    ]
-    return jsonify(result), 200
+    users = db_session.execute(USER.select(fields).order_by(User.id))
+    return jsonify(USER.dump_rows(users, fields)), 200
 
 @api_bp.route("/users/<int:id>", methods=["GET"])
 @admin_required()
@@ -182,14 +203,7 @@ def get_user(id):
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    result = {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "created_at": user.created_at.isoformat(),
-        "is_admin": user.is_admin,
-    }
-    return jsonify(result), 200
+    return jsonify(USER.dump(user)), 200
 
 @api_bp.route("/users/<int:id>", methods=["PUT"])
 @admin_required()
@@ -210,14 +224,7 @@ def update_user(id):
 
     db_session.commit()
 
-    result = {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "created_at": user.created_at.isoformat(),
-        "is_admin": user.is_admin,
-    }
-    return jsonify(result), 200
+    return jsonify(USER.dump(user)), 200
 
 @api_bp.route("/users/<int:id>", methods=["DELETE"])
 @admin_required()
@@ -228,97 +235,114 @@ def delete_user(id):
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    db_session.delete(user)
-    db_session.commit()
+    # Surveys of the user are deleted in batches, big ones in the background
+    job = jobs.run_or_submit(db_session, "delete_user", id, int(get_jwt_identity()))
+    if job is not None:
+        return job_accepted(job, "User deletion started")
 
     return jsonify({"msg": "User deleted"}), 200
 
+def job_accepted(job, message):
+    response = jsonify({"msg": message, "job": jobs.dump_job(job)})
+    response.headers["Location"] = url_for("api.get_job", id=job.id)
+    return response, 202
+
+@api_bp.route("/jobs/<int:id>", methods=["GET"])
+@jwt_required()
+def get_job(id):
+    db_session = create_session()
+    job = db_session.get(Job, id)
+
+    # Jobs are visible to whoever started them and to admins
+    if not job or (str(job.created_by) != str(get_jwt_identity()) and not get_jwt().get("is_admin")):
+        return jsonify({"msg": "Job not found"}), 404
+
+    return jsonify(jobs.dump_job(job)), 200
+
+# Profiles of slow requests (admin only)
+@api_bp.route("/profiles", methods=["GET"])
+@admin_required()
+def get_profiles():
+    return jsonify(profiling.list_profiles(limit=request.args.get("limit", 50, type=int))), 200
+
+@api_bp.route("/profiles/<name>", methods=["GET"])
+@admin_required()
+def get_profile(name):
+    if not name.endswith(profiling.PROFILE_EXTENSION):
+        return jsonify({"msg": "Profile not found"}), 404
+    return send_from_directory(current_app.config["PROFILE_DIR"], name, as_attachment=True)
+
 # Survey API endpoints
 @api_bp.route("/surveys", methods=["GET"])
 @jwt_required()
 def get_surveys():
+    try:
+        fields = SURVEY.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
     db_session = create_session()
-    surveys = db_session.query(Survey).all()
-    result = [
-        {
-            "id": survey.id,
-            "title": survey.title,
-            "description": survey.description,
-            "author_id": survey.author_id,
-            "created_at": survey.created_at.isoformat(),
-            "is_active": survey.is_active,
-            "require_login": survey.require_login,
-        } for survey in surveys
-    ]
-    return jsonify(result), 200
+    surveys = db_session.execute(SURVEY.select(fields).order_by(Survey.id))
+    return jsonify(SURVEY.dump_rows(surveys, fields)), 200
+
+def survey_etag(db_session, id):
+    version = survey_version(db_session, id)
+    return make_etag("survey", id, version.version) if version else None
 
 @api_bp.route("/surveys/<int:id>", methods=["GET"])
 @jwt_required()
+@conditional(survey_etag)
 def get_survey(id):
     db_session = create_session()
-    survey = db_session.query(Survey).get(id)
+    result = dump_survey_graph(db_session, id)
 
-    if not survey:
+    if not result:
         return jsonify({"msg": "Survey not found"}), 404
 
-    result = {
-        "id": survey.id,
-        "title": survey.title,
-        "description": survey.description,
-        "author_id": survey.author_id,
-        "created_at": survey.created_at.isoformat(),
-        "is_active": survey.is_active,
-        "require_login": survey.require_login,
-        "questions": [],
-    }
-
-    for question in survey.questions:
-        q = {
-            "id": question.id,
-            "type": question.type.value,
-            "text": question.text,
-            "is_required": question.is_required,
-            "choice_limit": question.choice_limit,
-            "options": [],
-        }
-
-        for option in question.options:
-            q["options"].append({
-                "id": option.id,
-                "text": option.text,
-            })
-
-        result["questions"].append(q)
-
     return jsonify(result), 200
 
 @api_bp.route("/surveys", methods=["POST"])
 @jwt_required()
 def create_survey():
     current_user_id = get_jwt_identity()
+    try:
+        survey = parse_survey_json(request.get_json(silent=True), "survey")
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
     db_session = create_session()
+    survey_id, = create_surveys(db_session, int(current_user_id), [survey])
+    db_session.commit()
 
-    data = request.json
-    new_survey = Survey(
-        title=data["title"],
-        description=data.get("description", ""),
-        author_id=current_user_id,
-        is_active=data.get("is_active", True),
-        require_login=data.get("require_login", False),
-    )
+    return jsonify(dump_survey_graph(db_session, survey_id)), 201
 
-    db_session.add(new_survey)
+@api_bp.route("/surveys/import", methods=["POST"])
+@jwt_required()
+def import_surveys():
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("surveys")
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "List of surveys expected"}), 400
+    if len(data) > current_app.config["SURVEY_IMPORT_MAX"]:
+        return jsonify({"msg": f"At most {current_app.config['SURVEY_IMPORT_MAX']} surveys per request"}), 413
+
+    # Everything is validated first, nothing is imported if any survey is invalid
+    surveys, errors = [], []
+    for index, item in enumerate(data):
+        try:
+            surveys.append(parse_survey_json(item, f"surveys[{index}]"))
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        return jsonify({"msg": "Invalid surveys", "errors": errors[:100]}), 400
+
+    db_session = create_session()
+    survey_ids = create_surveys(db_session, int(current_user_id), surveys)
     db_session.commit()
 
-    return jsonify({
-        "id": new_survey.id,
-        "title": new_survey.title,
-        "description": new_survey.description,
-        "author_id": new_survey.author_id,
-        "created_at": new_survey.created_at.isoformat(),
-        "is_active": new_survey.is_active,
-        "require_login": new_survey.require_login,
-    }), 201
+    return jsonify({"count": len(survey_ids), "ids": survey_ids}), 201
 
 @api_bp.route("/surveys/<int:id>", methods=["PUT"])
 @jwt_required()
@@ -332,11 +356,14 @@ def update_survey(id):
     if not survey:
         return jsonify({"msg": "Survey not found"}), 404
 
-    # Only allow survey author or admin to update
-    if survey.author_id != current_user_id and not claims.get("is_admin"):
+    # Only allow survey author or admin to update (JWT identity is a string)
+    if str(survey.author_id) != str(current_user_id) and not claims.get("is_admin"):
         return jsonify({"msg": "Access denied"}), 403
 
     data = request.json
+    if data.get("is_active") and not survey.is_active and db_session.get(SurveySnapshot, id) is not None:
+        # Stats of an archived survey are frozen, answers given after reopening it would never show up
+        return jsonify({"msg": "Answers of the survey are archived, restore them before reopening it"}), 409
     if "title" in data:
         survey.title = data["title"]
     if "description" in data:
@@ -346,17 +373,10 @@ def update_survey(id):
     if "require_login" in data:
         survey.require_login = data["require_login"]
 
+    bump_survey_version(db_session, survey.id)
     db_session.commit()
 
-    return jsonify({
-        "id": survey.id,
-        "title": survey.title,
-        "description": survey.description,
-        "author_id": survey.author_id,
-        "created_at": survey.created_at.isoformat(),
-        "is_active": survey.is_active,
-        "require_login": survey.require_login,
-    }), 200
+    return jsonify(SURVEY.dump(survey)), 200
 
 @api_bp.route("/surveys/<int:id>", methods=["DELETE"])
 @jwt_required()
@@ -370,15 +390,205 @@ def delete_survey(id):
     if not survey:
         return jsonify({"msg": "Survey not found"}), 404
 
-    # Only allow survey author or admin to delete
-    if survey.author_id != current_user_id and not claims.get("is_admin"):
+    # Only allow survey author or admin to delete (JWT identity is a string)
+    if str(survey.author_id) != str(current_user_id) and not claims.get("is_admin"):
         return jsonify({"msg": "Access denied"}), 403
 
-    db_session.delete(survey)
-    db_session.commit()
+    job = jobs.run_or_submit(db_session, "delete_survey", id, int(current_user_id))
+    if job is not None:
+        return job_accepted(job, "Survey deletion started")
 
     return jsonify({"msg": "Survey deleted"}), 200
 
+def session_or_jwt_identity():
+    """
+    Returns (user id, is admin) of the caller authenticated by JWT or by the session cookie (pages call it by AJAX),
+    None if not authenticated
+    """
+    verify_jwt_in_request(optional=True)
+    identity = get_jwt_identity()
+    if identity is not None:
+        return int(identity), bool(get_jwt().get("is_admin"))
+    if current_user.is_authenticated:
+        return current_user.id, bool(current_user.is_admin)
+    return None
+
+@api_bp.route("/surveys/<int:id>/questions/<int:question_id>/responses", methods=["GET"])
+def get_question_responses(id, question_id):
+    caller = session_or_jwt_identity()
+    if caller is None:
+        return jsonify({"msg": "Authentication required"}), 401
+
+    db_session = create_session()
+    version = survey_version(db_session, id)
+    # Only the survey author or admin can read responses
+    if not version or (version.author_id != caller[0] and not caller[1]):
+        return jsonify({"msg": "Survey not found"}), 404
+    question = db_session.execute(
+        sa.select(Question.type).where(Question.id == question_id, Question.survey_id == id),
+    ).first()
+    if question is None or question.type not in TEXT_TYPES + (QuestionType.FILE,):
+        return jsonify({"msg": "Text or file question not found"}), 404
+
+    query = request.args.get("q", "")
+    per_page = max(1, min(request.args.get("per_page", stats.RESPONSES_PAGE, type=int), MAX_PER_PAGE))
+    archived = db_session.get(SurveySnapshot, id) is not None
+    if query.strip():
+        if question.type == QuestionType.FILE:
+            return jsonify({"msg": "File responses can't be searched"}), 400
+        page = request.args.get("page", 1, type=int)
+        rows, has_more = search_responses(
+            db_session, question_id, query, page, per_page, survey_id=id, archived=archived,
+        )
+        return jsonify({
+            "query": query,
+            "page": page,
+            "has_more": has_more,
+            "items": [
+                {"id": answer_id, "text": text, "created_at": created_at, "rank": rank}
+                for answer_id, text, created_at, rank in rows
+            ],
+        }), 200
+
+    # Without a query responses are listed by id, the client passes next_after back as ?after=
+    files = question.type == QuestionType.FILE
+    rows, next_after = stats.list_responses(
+        db_session, question_id, request.args.get("after", type=int), per_page,
+        files=files, survey_id=id, archived=archived,
+    )
+    key = "file_path" if files else "text"
+    return jsonify({
+        "query": query,
+        "next_after": next_after,
+        "has_more": next_after is not None,
+        "items": [{"id": answer_id, key: value, "created_at": created_at} for answer_id, value, created_at in rows],
+    }), 200
+
+@api_bp.route("/surveys/<int:id>/respondents", methods=["GET"])
+def get_survey_respondents(id):
+    caller = session_or_jwt_identity()
+    if caller is None:
+        return jsonify({"msg": "Authentication required"}), 401
+
+    db_session = create_session()
+    version = survey_version(db_session, id)
+    if not version or (version.author_id != caller[0] and not caller[1]):
+        return jsonify({"msg": "Survey not found"}), 404
+
+    by = request.args.get("by", "survey")
+    if by not in ("survey",) + sketches.KINDS:
+        return jsonify({"msg": f"by must be one of: {', '.join(sketches.KINDS)}"}), 400
+    exact = {"1": True, "0": False}.get(request.args.get("exact"))
+    if exact and db_session.get(SurveySnapshot, id) is not None:
+        return jsonify({"msg": "Answers of the survey are archived, only estimates are available"}), 400
+
+    counts, exact = sketches.count_respondents(db_session, id, by, exact)
+    return jsonify({
+        "by": by,
+        "exact": exact,
+        "error": 0 if exact else sketches.ERROR,
+        "respondents": counts.get("", 0) if by == "survey" else counts,
+    }), 200
+
+@api_bp.route("/surveys/<int:id>/timeseries", methods=["GET"])
+def get_survey_timeseries(id):
+    caller = session_or_jwt_identity()
+    if caller is None:
+        return jsonify({"msg": "Authentication required"}), 401
+
+    db_session = create_session()
+    version = survey_version(db_session, id)
+    if not version or (version.author_id != caller[0] and not caller[1]):
+        return jsonify({"msg": "Survey not found"}), 404
+
+    bucket = request.args.get("bucket", "hour")
+    if bucket not in timeseries.BUCKETS:
+        return jsonify({"msg": f"bucket must be one of: {', '.join(timeseries.BUCKETS)}"}), 400
+    now = datetime.datetime.utcnow()
+    try:
+        until = timeseries.parse_time(request.args["until"]) if "until" in request.args else now
+        since = (
+            timeseries.parse_time(request.args["since"]) if "since" in request.args
+            else until - timeseries.DEFAULT_SPANS[bucket]
+        )
+    except ValueError:
+        return jsonify({"msg": "since and until must be ISO 8601 dates"}), 400
+    if since > until or (until - since).total_seconds() / timeseries.BUCKETS[bucket] >= timeseries.MAX_BUCKETS:
+        return jsonify({"msg": f"At most {timeseries.MAX_BUCKETS} buckets can be requested"}), 400
+
+    archived = db_session.get(SurveySnapshot, id) is not None
+    points = timeseries.series(db_session, id, version.version, bucket, since, until, archived=archived, now=now)
+    return jsonify({
+        "bucket": bucket,
+        "points": [
+            {"start": start, "answers": answers, "respondents": respondents}
+            for start, answers, respondents in points
+        ],
+    }), 200
+
+@api_bp.route("/surveys/<int:id>/crosstab", methods=["GET"])
+def get_survey_crosstab(id):
+    caller = session_or_jwt_identity()
+    if caller is None:
+        return jsonify({"msg": "Authentication required"}), 401
+
+    db_session = create_session()
+    version = survey_version(db_session, id)
+    if not version or (version.author_id != caller[0] and not caller[1]):
+        return jsonify({"msg": "Survey not found"}), 404
+
+    row_question_id = request.args.get("rows", type=int)
+    column_question_id = request.args.get("columns", type=int)
+    if row_question_id is None or column_question_id is None:
+        return jsonify({"msg": "rows and columns question ids are required"}), 400
+    archived = db_session.get(SurveySnapshot, id) is not None
+    matrix = crosstab.survey_matrix(db_session, id, version.version, archived=archived)
+    try:
+        result = crosstab.crosstab(
+            matrix, row_question_id, column_question_id, crosstab.parse_filter(request.args.get("filter")),
+        )
+    except KeyError:
+        return jsonify({"msg": "Choice question not found"}), 404
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    return jsonify(result), 200
+
+@api_bp.route("/surveys/<int:id>/respondents/export", methods=["GET"])
+def export_survey_respondents(id):
+    caller = session_or_jwt_identity()
+    if caller is None:
+        return jsonify({"msg": "Authentication required"}), 401
+
+    db_session = create_session()
+    version = survey_version(db_session, id)
+    if not version or (version.author_id != caller[0] and not caller[1]):
+        return jsonify({"msg": "Survey not found"}), 404
+
+    try:
+        respondents = bitmaps.matching(db_session, id, crosstab.parse_filter(request.args.get("filter")))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    archived = db_session.get(SurveySnapshot, id) is not None
+
+    def generate():
+        export_session = create_session()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        try:
+            for row in bitmaps.export_rows(export_session, id, respondents, archived):
+                writer.writerow(row)
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            export_session.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/csv", headers={
+        "Content-Disposition": f"attachment; filename=survey_{id}_respondents.csv",
+    })
+
 # Answer API endpoints with access control
 @api_bp.route("/answers", methods=["GET"])
 @jwt_required()
@@ -387,54 +597,25 @@ def get_answers():
     claims = get_jwt()
     is_admin = claims.get("is_admin", False)
 
+    try:
+        fields = ANSWER.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+
     db_session = create_session()
-    query = db_session.query(Answer)
+    query = ANSWER.select(fields).order_by(Answer.id)
 
     # Filter based on access rights
     if not is_admin:
-        # Get surveys where the user is the author
-        authored_surveys = db_session.query(Survey).filter(Survey.author_id == current_user_id).all()
-        authored_survey_ids = [s.id for s in authored_surveys]
-
-        # Get questions from those surveys
-        questions_from_authored_surveys = db_session.query(Question).filter(
-            Question.survey_id.in_(authored_survey_ids),
-        ).all()
-        questions_ids = [q.id for q in questions_from_authored_surveys]
+        # Questions of surveys where the user is the author
+        questions_ids = sa.select(Question.id).join(Survey).where(Survey.author_id == current_user_id)
 
         # User can see their own answers or answers to their surveys
-        query = query.filter(
+        query = query.where(
             (Answer.user_id == current_user_id) | (Answer.question_id.in_(questions_ids)),
         )
 
-    answers = query.all()
-    result = []
-
-    for answer in answers:
-        answer_data = {
-            "id": answer.id,
-            "user_id": answer.user_id,
-            "question_id": answer.question_id,
-            "text_response": answer.text_response,
-            "file_path": answer.file_path,
-            "created_at": answer.created_at.isoformat(),
-            "ip_address": answer.ip_address,
-            "browser": answer.browser,
-            "device_type": answer.device_type,
-            "os": answer.os,
-            "selected_options": [],
-        }
-
-        # Get the selected options for this answer
-        for option in answer.options:
-            answer_data["selected_options"].append({
-                "id": option.id,
-                "text": option.text,
-            })
-
-        result.append(answer_data)
-
-    return jsonify(result), 200
+    return jsonify(dump_answers(db_session, query, fields)), 200
 
 @api_bp.route("/answers/<int:id>", methods=["GET"])
 @check_answer_access()
@@ -445,26 +626,8 @@ def get_answer(id):
     if not answer:
         return jsonify({"msg": "Answer not found"}), 404
 
-    answer_data = {
-        "id": answer.id,
-        "user_id": answer.user_id,
-        "question_id": answer.question_id,
-        "text_response": answer.text_response,
-        "file_path": answer.file_path,
-        "created_at": answer.created_at.isoformat(),
-        "ip_address": answer.ip_address,
-        "browser": answer.browser,
-        "device_type": answer.device_type,
-        "os": answer.os,
-        "selected_options": [],
-    }
-
-    # Get the selected options for this answer
-    for option in answer.options:
-        answer_data["selected_options"].append({
-            "id": option.id,
-            "text": option.text,
-        })
+    answer_data = ANSWER.dump(answer)
+    answer_data["selected_options"] = selected_options(db_session, [answer.id])[answer.id]
 
     return jsonify(answer_data), 200
 
@@ -473,38 +636,58 @@ def get_answer(id):
 def update_answer(id):
     current_user_id = get_jwt_identity()
 
+    data = request.json
+    if "text_response" in data and not isinstance(data["text_response"], (str, type(None))):
+        return jsonify({"msg": "text_response must be a string or null"}), 400
+
     db_session = create_session()
-    answer = db_session.query(Answer).get(id)
+    # Locked, so the analytics consumer doesn't analyze the answer while it changes
+    answer = db_session.get(Answer, id, with_for_update=True)
 
     if not answer:
         return jsonify({"msg": "Answer not found"}), 404
 
-    data = request.json
-
     if "text_response" in data:
+        row = {
+            "question_id": answer.question_id,
+            "text_response": answer.text_response,
+            "user_id": answer.user_id,
+            "ip_address": answer.ip_address,
+        }
+        # Answers not analyzed yet are analyzed as they are when the consumer gets to them
+        if answer.analyzed:
+            text_analytics.record(db_session, [row], sign=-1)
         answer.text_response = data["text_response"]
+        if answer.analyzed:
+            text_analytics.record(db_session, [{**row, "text_response": answer.text_response}])
 
     if "selected_options" in data:
-        # Clear existing option associations
-        db_session.query(AnswerOption).filter(AnswerOption.answer_id == id).delete()
-
-        # Add new option associations
-        for option_id in data["selected_options"]:
-            option = db_session.query(Option).get(option_id)
-            if option and option.question_id == answer.question_id:
-                answer.options.append(option)
-
+        picked = sa.select(AnswerOption.option_id).where(AnswerOption.answer_id == id)
+        row = {
+            "question_id": answer.question_id,
+            "user_id": answer.user_id,
+            "ip_address": answer.ip_address,
+            "option_ids": db_session.scalars(picked).all(),
+        }
+        if answer.analyzed:
+            bitmaps.record(db_session, [row], sign=-1)
+        # Replace option associations, options of other questions are ignored
+        db_session.execute(sa.delete(AnswerOption).where(AnswerOption.answer_id == id))
+        option_ids = db_session.scalars(sa.select(Option.id).where(
+            Option.id.in_(data["selected_options"]), Option.question_id == answer.question_id,
+        )).all()
+        if option_ids:
+            db_session.execute(
+                sa.insert(AnswerOption), [{"answer_id": id, "option_id": option_id} for option_id in option_ids],
+            )
+        if answer.analyzed:
+            bitmaps.record(db_session, [{**row, "option_ids": option_ids}])
+
+    bump_survey_version(db_session, answer.question.survey_id)
     db_session.commit()
 
-    answer_data = {
-        "id": answer.id,
-        "user_id": answer.user_id,
-        "question_id": answer.question_id,
-        "text_response": answer.text_response,
-        "file_path": answer.file_path,
-        "created_at": answer.created_at.isoformat(),
-        "selected_options": [{"id": o.id, "text": o.text} for o in answer.options],
-    }
+    answer_data = ANSWER.dump(answer, ("id", "user_id", "question_id", "text_response", "file_path", "created_at"))
+    answer_data["selected_options"] = selected_options(db_session, [answer.id])[answer.id]
 
     return jsonify(answer_data), 200
 
@@ -512,15 +695,25 @@ def update_answer(id):
 @check_answer_access()
 def delete_answer(id):
     db_session = create_session()
-    answer = db_session.query(Answer).get(id)
+    answer = db_session.get(Answer, id, with_for_update=True)
 
     if not answer:
         return jsonify({"msg": "Answer not found"}), 404
 
-    # First delete answer_options relationships
-    db_session.query(AnswerOption).filter(AnswerOption.answer_id == id).delete()
+    row = {
+        "question_id": answer.question_id,
+        "text_response": answer.text_response,
+        "user_id": answer.user_id,
+        "ip_address": answer.ip_address,
+        "option_ids": db_session.scalars(sa.select(AnswerOption.option_id).where(AnswerOption.answer_id == id)).all(),
+    }
+    if answer.analyzed:
+        text_analytics.record(db_session, [row], sign=-1)
+        bitmaps.record(db_session, [row], sign=-1)
 
-    # Then delete the answer
+    # First delete answer_options relationships, then the answer
+    db_session.query(AnswerOption).filter(AnswerOption.answer_id == id).delete()
+    bump_survey_version(db_session, answer.question.survey_id)
     db_session.delete(answer)
     db_session.commit()
 
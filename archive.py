@@ -0,0 +1,162 @@
+# archive.py
+"""
+Survey archival module.
+Answers of long-closed surveys (is_active=False and no answers for --days) are moved from answers to answers_archive
+in batches with short transactions. Their stats are frozen into survey_snapshots first, so stats pages keep working
+(see stats.survey_stats). Archiving and restoring are idempotent: an interrupted run is simply repeated.
+
+Example:
+    python archive.py run --days 180
+    python archive.py restore --survey 42
+"""
+import sys
+import json
+import argparse
+import datetime
+
+import sqlalchemy as sa
+
+from db import create_session
+from ORM.models import Survey, Question, Answer, AnswerOption, ArchivedAnswer, SurveySnapshot
+from caching import bump_survey_version
+from deletion import DELETE_BATCH_SIZE, delete_answers
+import stats
+import analytics
+
+# Archived answers are always analyzed, the flag isn't archived
+ANSWER_COLUMNS = [column.name for column in Answer.__table__.columns if column.name != "analyzed"]
+
+
+def archivable_surveys(db_session, days):
+    """
+    Ids of inactive, not yet archived surveys whose last answer is older than `days`
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    survey_answers = sa.select(Answer.id).join(Question, Question.id == Answer.question_id).where(
+        Question.survey_id == Survey.id,
+    )
+    return db_session.scalars(
+        sa.select(Survey.id)
+        .outerjoin(SurveySnapshot, SurveySnapshot.survey_id == Survey.id)
+        .where(
+            Survey.is_active.is_(False),
+            SurveySnapshot.survey_id.is_(None),
+            survey_answers.exists(),
+            ~survey_answers.where(Answer.created_at >= cutoff).exists(),
+        )
+        .order_by(Survey.id),
+    ).all()
+
+
+def archive_survey(db_session, survey_id, batch_size=DELETE_BATCH_SIZE):
+    """
+    Freezes stats of the survey and moves its answers to answers_archive, returns number of moved answers
+    """
+    # Stats are frozen with all answers analyzed
+    analytics.run_pending(db_session, survey_id=survey_id)
+    if db_session.get(SurveySnapshot, survey_id) is None:
+        snapshot = stats.compute_stats(db_session, survey_id)
+        db_session.add(SurveySnapshot(
+            survey_id=survey_id, stats=json.dumps(snapshot), answers_count=snapshot["answers"],
+        ))
+        bump_survey_version(db_session, survey_id)
+        db_session.commit()
+
+    question_ids = db_session.scalars(sa.select(Question.id).where(Question.survey_id == survey_id)).all()
+    moved = 0
+    while question_ids:
+        answers = db_session.execute(
+            sa.select(Answer.__table__).where(Answer.question_id.in_(question_ids)).order_by(Answer.id).limit(batch_size),
+        ).mappings().all()
+        if not answers:
+            break
+        pending = [answer for answer in answers if not answer["analyzed"]]
+        if pending:
+            # Claimed by a consumer during the catch-up or written since
+            analytics.analyze(db_session, pending)
+        answer_ids = [answer["id"] for answer in answers]
+        option_ids = {}
+        for answer_id, option_id in db_session.execute(
+            sa.select(AnswerOption.answer_id, AnswerOption.option_id).where(AnswerOption.answer_id.in_(answer_ids)),
+        ):
+            option_ids.setdefault(answer_id, []).append(str(option_id))
+
+        db_session.execute(sa.insert(ArchivedAnswer), [{
+            **{column: answer[column] for column in ANSWER_COLUMNS},
+            "survey_id": survey_id,
+            "option_ids": ",".join(option_ids[answer["id"]]) if answer["id"] in option_ids else None,
+        } for answer in answers])
+        delete_answers(db_session, answer_ids)
+        db_session.commit()
+        moved += len(answers)
+    return moved
+
+
+def restore_survey(db_session, survey_id, batch_size=DELETE_BATCH_SIZE):
+    """
+    Moves archived answers of the survey back and drops its snapshot, returns number of restored answers
+    """
+    restored = 0
+    while True:
+        archived = db_session.execute(
+            sa.select(ArchivedAnswer.__table__)
+            .where(ArchivedAnswer.survey_id == survey_id)
+            .order_by(ArchivedAnswer.id)
+            .limit(batch_size),
+        ).mappings().all()
+        if not archived:
+            break
+        db_session.execute(sa.insert(Answer), [
+            {**{column: row[column] for column in ANSWER_COLUMNS}, "analyzed": True} for row in archived
+        ])
+        answer_options = [
+            {"answer_id": row["id"], "option_id": int(option_id)}
+            for row in archived if row["option_ids"] for option_id in row["option_ids"].split(",")
+        ]
+        if answer_options:
+            db_session.execute(sa.insert(AnswerOption), answer_options)
+        db_session.execute(sa.delete(ArchivedAnswer).where(ArchivedAnswer.id.in_([row["id"] for row in archived])))
+        db_session.commit()
+        restored += len(archived)
+
+    db_session.execute(sa.delete(SurveySnapshot).where(SurveySnapshot.survey_id == survey_id))
+    bump_survey_version(db_session, survey_id)
+    db_session.commit()
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive answers of closed surveys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="archive inactive surveys without recent answers")
+    run.add_argument("--days", type=int, default=180, help="days since the last answer")
+    run.add_argument("--survey", type=int, help="archive only this survey (it must be inactive)")
+    run.add_argument("--dry-run", action="store_true", help="only list surveys to archive")
+    restore = commands.add_parser("restore", help="move archived answers of a survey back")
+    restore.add_argument("--survey", type=int, required=True)
+    for command in (run, restore):
+        command.add_argument("--batch-size", type=int, default=DELETE_BATCH_SIZE, help="answers per transaction")
+    args = parser.parse_args()
+
+    db_session = create_session()
+    try:
+        if args.command == "restore":
+            print(f"Survey {args.survey}: {restore_survey(db_session, args.survey, args.batch_size)} answers restored")
+            return
+
+        survey_ids = archivable_surveys(db_session, args.days)
+        if args.survey is not None:
+            if args.survey not in survey_ids:
+                sys.exit(f"Survey {args.survey} is active, archived or has recent answers")
+            survey_ids = [args.survey]
+        for survey_id in survey_ids:
+            if args.dry_run:
+                print(f"Survey {survey_id} would be archived")
+                continue
+            print(f"Survey {survey_id}: {archive_survey(db_session, survey_id, args.batch_size)} answers archived")
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmarks use their own database file, it is recreated on every run
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["DB_FILE_PATH"] = os.environ.get("BENCH_DB_PATH", "/tmp/questionnaire_bench.sqlite3")
+if os.path.exists(os.environ["DB_FILE_PATH"]):
+    os.remove(os.environ["DB_FILE_PATH"])
+
+from app import app as flask_app
+from benchmarks.datasets import BENCH_SIZES, BENCH_PASSWORD, seed_survey
+
+
+@pytest.fixture(scope="session")
+def app():
+    flask_app.config.update({
+        "TESTING": True,
+        "JWT_SECRET_KEY": "bench_key",
+        "JWT_ACCESS_TOKEN_EXPIRES": datetime.timedelta(hours=1),
+        "RATELIMIT_ENABLED": False,
+        "JOB_WORKER": False,
+    })
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture(scope="session", params=BENCH_SIZES, ids=lambda size: f"{size}_answers")
+def dataset(request, app):
+    """Seeded survey of the requested size, with a logged in client and JWT headers of its author."""
+    data = seed_survey(request.param)
+
+    client = app.test_client()
+    client.post("/auth/login", data={"username": data["username"], "password": BENCH_PASSWORD})
+    token = client.post("/api/token", json={
+        "username": data["username"],
+        "password": BENCH_PASSWORD,
+    }).json["access_token"]
+
+    data["client"] = client
+    data["headers"] = {"Authorization": f"Bearer {token}"}
+    return data
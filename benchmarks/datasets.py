@@ -0,0 +1,41 @@
+"""
+Seeded datasets for benchmarks
+"""
+import os
+
+from db import create_session
+from ORM.models import User, QuestionType
+from seed import generate
+
+# Dataset sizes (total answers per survey), e.g. BENCH_SIZES=1000,100000,1000000
+BENCH_SIZES = [int(size) for size in os.environ.get("BENCH_SIZES", "1000").split(",") if size.strip()]
+
+BENCH_PASSWORD = "bench_password"
+
+BENCH_QUESTIONS = {
+    QuestionType.TEXT: 1,
+    QuestionType.SINGLE_CHOICE: 1,
+    QuestionType.MULTIPLE_CHOICE: 1,
+}
+
+
+def seed_survey(size):
+    """
+    Creates an author and a survey with text, single and multiple choice questions and ~size answers
+    """
+    db_session = create_session()
+    result = generate(
+        db_session,
+        users=1,
+        surveys=1,
+        questions=BENCH_QUESTIONS,
+        options=5,
+        answers=size,
+        seed=size,
+        password=BENCH_PASSWORD,
+    )
+    author = db_session.get(User, result["user_ids"][0])
+
+    data = {"survey_id": result["survey_ids"][0], "username": author.username, "size": size}
+    db_session.close()
+    return data
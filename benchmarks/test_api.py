@@ -0,0 +1,24 @@
+"""
+Benchmarks of API serialization
+"""
+
+
+def test_get_survey(benchmark, dataset):
+    """GET /api/surveys/<id> (survey graph serialization)."""
+    client = dataset["client"]
+    url = f"/api/surveys/{dataset['survey_id']}"
+
+    response = benchmark(client.get, url, headers=dataset["headers"])
+
+    assert response.status_code == 200
+    assert len(response.json["questions"]) == 3
+
+
+def test_get_answers(benchmark, dataset):
+    """GET /api/answers (answer serialization) for the survey author."""
+    client = dataset["client"]
+
+    response = benchmark(client.get, "/api/answers", headers=dataset["headers"])
+
+    assert response.status_code == 200
+    assert len(response.json) >= dataset["size"]
@@ -0,0 +1,53 @@
+"""
+Benchmarks of request-independent hot helpers
+"""
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import generate_password_hash, check_password_hash
+from user_agents import parse
+
+from survey import parse_questions_form
+from seed import USER_AGENTS
+
+
+def make_survey_form(questions_count):
+    form = MultiDict({"survey_title": "Benchmark", "survey_description": "Benchmark"})
+    for index in range(questions_count):
+        form[f"questions[{index}][text]"] = f"Question {index}"
+        if index % 2:
+            form[f"questions[{index}][type]"] = "limited_choice"
+            form[f"questions[{index}][limit]"] = "2"
+            form.setlist(f"questions[{index}][options][]", [f"Option {i}" for i in range(10)])
+        else:
+            form[f"questions[{index}][type]"] = "text"
+            form[f"questions[{index}][required]"] = "on"
+    return form
+
+
+def test_parse_survey_form(benchmark):
+    """Form parsing used by survey.create / survey.edit (50 questions)."""
+    form = make_survey_form(50)
+
+    questions = benchmark(parse_questions_form, form)
+
+    assert len(questions) == 50
+
+
+def test_user_agent_parsing(benchmark):
+    """user_agents.parse, called on every survey submission."""
+    result = benchmark(lambda: [parse(user_agent) for _, user_agent in USER_AGENTS])
+
+    assert result[0].browser.family == "Chrome"
+
+
+def test_password_hashing(benchmark):
+    """generate_password_hash, called on registration."""
+    password_hash = benchmark(generate_password_hash, "password123")
+
+    assert check_password_hash(password_hash, "password123")
+
+
+def test_password_check(benchmark):
+    """check_password_hash, called on every login and token request."""
+    password_hash = generate_password_hash("password123")
+
+    assert benchmark(check_password_hash, password_hash, "password123")
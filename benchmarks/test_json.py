@@ -0,0 +1,44 @@
+"""
+Benchmarks of JSON encoding of API payloads
+"""
+import json
+import datetime
+
+import pytest
+
+from ORM.models import QuestionType
+
+
+def make_answers_payload(size):
+    """Payload shaped like GET /api/answers."""
+    created_at = datetime.datetime(2025, 1, 1)
+    return [{
+        "id": index,
+        "user_id": None,
+        "question_id": index % 10,
+        "text_response": "lorem ipsum dolor sit amet",
+        "file_path": None,
+        "created_at": created_at + datetime.timedelta(seconds=index),
+        "ip_address": "10.0.0.1",
+        "browser": "Chrome",
+        "device_type": "Other",
+        "os": "Windows",
+        "type": QuestionType.TEXT,
+        "selected_options": [],
+    } for index in range(size)]
+
+
+@pytest.mark.parametrize("size", [10, 1000, 100000])
+@pytest.mark.parametrize("encoder", ["provider", "stdlib"])
+def test_encode_answers(benchmark, app, encoder, size):
+    """Encoding cost per payload size: app JSON provider (orjson) vs stdlib json."""
+    payload = make_answers_payload(size)
+    if encoder == "provider":
+        encode = app.json.dumps_bytes
+    else:
+        encode = lambda obj: json.dumps(obj, default=app.json.default, separators=(",", ":")).encode()  # noqa: E731
+
+    benchmark.extra_info["payload_size"] = size
+    result = benchmark(encode, payload)
+
+    assert len(json.loads(result)) == size
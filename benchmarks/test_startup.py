@@ -0,0 +1,44 @@
+"""
+Cold start benchmark: fresh interpreter importing the app, creating it and serving the first requests
+"""
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({"TESTING": True, "RATELIMIT_ENABLED": False})
+created = time.perf_counter()
+client = app.test_client()
+assert client.get("/").status_code == 200
+first_request = time.perf_counter()
+assert client.post("/api/token", json={"username": "nobody", "password": "x"}).status_code == 401
+first_db_request = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": first_request - created,
+    "first_db_request": first_db_request - first_request,
+}))
+"""
+
+
+def start_app():
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_to_first_request(benchmark):
+    """Import of app.py, create_app() and the first requests (without and with database) in a new process."""
+    timings = benchmark.pedantic(start_app, rounds=5, iterations=1)
+
+    benchmark.extra_info.update({phase: round(seconds, 4) for phase, seconds in timings.items()})
@@ -0,0 +1,24 @@
+"""
+Benchmarks of survey statistics computation
+"""
+
+
+def test_survey_stats_data(benchmark, dataset):
+    """GET /api/survey/<id>/stats-data (get_survey_stats_data)."""
+    client = dataset["client"]
+    url = f"/api/survey/{dataset['survey_id']}/stats-data"
+
+    response = benchmark(client.get, url)
+
+    assert response.status_code == 200
+    assert response.json["total_responses"] > 0
+
+
+def test_survey_stats_page(benchmark, dataset):
+    """GET /survey/<id>/stats (survey_stats, including template rendering)."""
+    client = dataset["client"]
+    url = f"/survey/{dataset['survey_id']}/stats"
+
+    response = benchmark(client.get, url)
+
+    assert response.status_code == 200
@@ -0,0 +1,527 @@
+# bitmaps.py
+"""
+Option bitmaps module.
+Respondents of a survey (told apart like repeated submissions: by user if logged in, by IP address otherwise) are
+numbered 0, 1, 2... on their first submission (respondents table). For every choice option a roaring-style bitmap
+of the ordinals of respondents who picked it is kept in option_bitmaps: ordinals are split into chunks of 65536,
+each chunk stored as the smallest of a sorted uint16 array, a list of runs or a 8 KB bitset. Bitmaps are updated
+by the analytics consumer (see analytics.py) and on answer edits, so segment filters like "picked A and not B" are
+bitmap operations over a few KB per option instead of scanning answers; they feed filtered stats and exports.
+NumPy is imported by the functions using it, so importing the app stays fast. Like sketches, bitmaps keep
+respondents of answers deleted with their user until the survey is rebuilt.
+
+Bitmaps of surveys are rebuilt from their answers with:
+    python bitmaps.py rebuild
+    python bitmaps.py rebuild --survey 42
+"""
+import argparse
+import datetime
+from functools import reduce
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from db import create_session
+from ORM.models import (
+    Survey, Question, CHOICE_TYPES, Option, Answer, AnswerOption, ArchivedAnswer, SurveySnapshot,
+    Respondent, OptionBitmap,
+)
+import submissions
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Container kinds, first byte of option_bitmaps.container
+ARRAY, RUNS, BITSET = 0, 1, 2
+EXPORT_BATCH_SIZE = 500
+REBUILD_BATCH_SIZE = 5000
+
+
+def _pack(bits):
+    """
+    Bitset words (1024 uint64) of a chunk from its 65536 booleans
+    """
+    import numpy as np
+
+    return np.packbits(bits, bitorder="little").view("<u8").astype(np.uint64)
+
+
+def _unpack(words):
+    import numpy as np
+
+    return np.unpackbits(words.astype("<u8").view(np.uint8), bitorder="little").astype(bool)
+
+
+def encode(words):
+    """
+    Smallest container of a chunk: sorted values, runs (start, length - 1) or the bitset itself
+    """
+    import numpy as np
+
+    bits = _unpack(words)
+    edges = np.diff(np.concatenate(([0], bits.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    runs = np.column_stack((starts, np.flatnonzero(edges == -1) - starts - 1))
+    kind, data = min(
+        (ARRAY, np.flatnonzero(bits).astype("<u2").tobytes()),
+        (RUNS, runs.astype("<u2").tobytes()),
+        (BITSET, words.astype("<u8").tobytes()),
+        key=lambda container: len(container[1]),
+    )
+    return bytes([kind]) + data
+
+
+def decode(container):
+    import numpy as np
+
+    kind, data = container[0], container[1:]
+    if kind == BITSET:
+        return np.frombuffer(data, dtype="<u8").astype(np.uint64)
+    bits = np.zeros(CHUNK_SIZE, dtype=bool)
+    if kind == ARRAY:
+        bits[np.frombuffer(data, dtype="<u2")] = True
+    else:
+        runs = np.frombuffer(data, dtype="<u2").reshape(-1, 2).astype(np.int64)
+        # Runs don't overlap: +1 at each start, -1 after each end
+        edges = np.zeros(CHUNK_SIZE + 1, dtype=np.int32)
+        edges[runs[:, 0]] += 1
+        edges[runs[:, 0] + runs[:, 1] + 1] -= 1
+        bits = np.cumsum(edges[:-1]) > 0
+    return _pack(bits)
+
+
+class Bitmap:
+    """
+    Set of respondent ordinals: {chunk: 1024 uint64 words with the bits of ordinals chunk * 65536 + 0..65535}
+    """
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_ordinals(cls, ordinals):
+        import numpy as np
+
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        chunks = {}
+        for chunk in np.unique(ordinals >> CHUNK_BITS):
+            bits = np.zeros(CHUNK_SIZE, dtype=bool)
+            bits[ordinals[(ordinals >> CHUNK_BITS) == chunk] & (CHUNK_SIZE - 1)] = True
+            chunks[int(chunk)] = _pack(bits)
+        return cls(chunks)
+
+    @classmethod
+    def universe(cls, size):
+        """
+        Ordinals 0 to size - 1
+        """
+        import numpy as np
+
+        chunks = {}
+        for chunk in range(0, (size + CHUNK_SIZE - 1) >> CHUNK_BITS):
+            bits = np.zeros(CHUNK_SIZE, dtype=bool)
+            bits[:size - (chunk << CHUNK_BITS)] = True
+            chunks[chunk] = _pack(bits)
+        return cls(chunks)
+
+    def __and__(self, other):
+        return Bitmap({
+            chunk: words & other.chunks[chunk] for chunk, words in self.chunks.items() if chunk in other.chunks
+        })
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for chunk, words in other.chunks.items():
+            chunks[chunk] = chunks[chunk] | words if chunk in chunks else words
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        return Bitmap({
+            chunk: words & ~other.chunks[chunk] if chunk in other.chunks else words
+            for chunk, words in self.chunks.items()
+        })
+
+    def __len__(self):
+        import numpy as np
+
+        return int(sum(np.unpackbits(words.view(np.uint8)).sum() for words in self.chunks.values()))
+
+    def ordinals(self):
+        import numpy as np
+
+        return np.concatenate([
+            (chunk << CHUNK_BITS) + np.flatnonzero(_unpack(self.chunks[chunk])) for chunk in sorted(self.chunks)
+        ] or [np.zeros(0, dtype=np.int64)])
+
+
+def _ordinals(db_session, survey_id, respondents, create=True):
+    """
+    Ordinals of respondents {key: answer row} of the survey,
+    new ones are numbered after the last unless create is False
+    """
+    # Locking reads see respondents numbered by transactions committed in the meantime
+    query = (
+        sa.select(Respondent.key, Respondent.ordinal)
+        .where(Respondent.survey_id == survey_id, Respondent.key.in_(respondents))
+        .with_for_update()
+    )
+    ordinals = dict(db_session.execute(query).all())
+    new = [key for key in respondents if key not in ordinals]
+    while create and new:
+        last = db_session.scalar(
+            sa.select(sa.func.max(Respondent.ordinal)).where(Respondent.survey_id == survey_id).with_for_update(),
+        )
+        start = -1 if last is None else last
+        added = [
+            {
+                "survey_id": survey_id,
+                "ordinal": start + number,
+                "key": key,
+                "user_id": respondents[key].get("user_id"),
+                "ip_address": respondents[key].get("ip_address"),
+                "created_at": respondents[key].get("created_at") or datetime.datetime.utcnow(),
+            }
+            for number, key in enumerate(new, 1)
+        ]
+        try:
+            with db_session.begin_nested():
+                db_session.execute(sa.insert(Respondent), added)
+        except IntegrityError:
+            # Another consumer numbered some of them or took the ordinals, numbered again after its ones
+            ordinals.update(db_session.execute(query).all())
+            new = [key for key in respondents if key not in ordinals]
+            continue
+        ordinals.update((row["key"], row["ordinal"]) for row in added)
+        break
+    return ordinals
+
+
+def _update(db_session, changes, picked):
+    """
+    Sets (picked) or clears bits {(option_id, chunk): [ordinal & 0xFFFF]}: one locking read of the bitmap rows,
+    then one insert, update and delete of the changed ones
+    """
+    import numpy as np
+
+    keys = sorted(changes)
+    query = (
+        sa.select(OptionBitmap.option_id, OptionBitmap.chunk, OptionBitmap.container)
+        .where(sa.tuple_(OptionBitmap.option_id, OptionBitmap.chunk).in_(keys))
+        .with_for_update()
+    )
+    stored = {(option_id, chunk): container for option_id, chunk, container in db_session.execute(query)}
+    if picked:
+        added = []
+        for option_id, chunk in keys:
+            if (option_id, chunk) not in stored:
+                bits = np.zeros(CHUNK_SIZE, dtype=bool)
+                bits[changes[option_id, chunk]] = True
+                added.append({"option_id": option_id, "chunk": chunk, "container": encode(_pack(bits))})
+        if added:
+            try:
+                with db_session.begin_nested():
+                    db_session.execute(sa.insert(OptionBitmap), added)
+            except IntegrityError:
+                # Some were created by a concurrent transaction, their rows are locked now
+                stored = {(option_id, chunk): container for option_id, chunk, container in db_session.execute(query)}
+                added = [row for row in added if (row["option_id"], row["chunk"]) not in stored]
+                if added:
+                    db_session.execute(sa.insert(OptionBitmap), added)
+
+    changed, emptied = [], []
+    for (option_id, chunk), container in stored.items():
+        bits = _unpack(decode(container))
+        bits[changes[option_id, chunk]] = picked
+        if bits.any():
+            changed.append({"b_option_id": option_id, "b_chunk": chunk, "b_container": encode(_pack(bits))})
+        else:
+            emptied.append((option_id, chunk))
+    if changed:
+        db_session.execute(
+            sa.update(OptionBitmap.__table__)
+            .where(OptionBitmap.option_id == sa.bindparam("b_option_id"), OptionBitmap.chunk == sa.bindparam("b_chunk"))
+            .values(container=sa.bindparam("b_container")),
+            changed,
+        )
+    if emptied:
+        db_session.execute(
+            sa.delete(OptionBitmap).where(sa.tuple_(OptionBitmap.option_id, OptionBitmap.chunk).in_(emptied)),
+        )
+
+
+def record(db_session, rows, sign=1):
+    """
+    Numbers respondents of answer rows (dicts of Answer columns) and sets bits of the options they picked
+    ("option_ids" of choice answers), sign=-1 clears bits of deleted or edited choice answers.
+    Commit is up to the caller.
+    """
+    rows = [row for row in rows if row.get("user_id") is not None or row.get("ip_address")]
+    if not rows:
+        return
+    surveys = dict(db_session.execute(
+        sa.select(Question.id, Question.survey_id).where(Question.id.in_({row["question_id"] for row in rows})),
+    ).all())
+    changes = {}
+    # Same lock order in every transaction
+    for survey_id in sorted(set(surveys.values())):
+        survey_rows = [
+            (submissions.dedup_key(row.get("user_id"), row.get("ip_address")), row)
+            for row in rows if surveys.get(row["question_id"]) == survey_id
+        ]
+        respondents = {}
+        for key, row in survey_rows:
+            respondents.setdefault(key, row)
+        ordinals = _ordinals(db_session, survey_id, respondents, create=sign > 0)
+        for key, row in survey_rows:
+            if key not in ordinals:
+                continue
+            for option_id in row.get("option_ids") or ():
+                changes.setdefault((option_id, ordinals[key] >> CHUNK_BITS), []).append(
+                    ordinals[key] & (CHUNK_SIZE - 1),
+                )
+    if changes:
+        _update(db_session, changes, sign > 0)
+
+
+def forget_options(db_session, option_ids):
+    """
+    Deletes bitmaps of the options
+    """
+    db_session.execute(sa.delete(OptionBitmap).where(OptionBitmap.option_id.in_(option_ids)))
+
+
+def forget(db_session, survey_id):
+    """
+    Deletes respondents and option bitmaps of the survey
+    """
+    forget_options(db_session, sa.select(Option.id).join(Question, Question.id == Option.question_id).where(
+        Question.survey_id == survey_id,
+    ).scalar_subquery())
+    db_session.execute(sa.delete(Respondent).where(Respondent.survey_id == survey_id))
+
+
+def load(db_session, option_ids):
+    """
+    Bitmaps of the options: {option_id: Bitmap}
+    """
+    bitmaps = {option_id: Bitmap() for option_id in option_ids}
+    for option_id, chunk, container in db_session.execute(
+        sa.select(OptionBitmap.option_id, OptionBitmap.chunk, OptionBitmap.container)
+        .where(OptionBitmap.option_id.in_(option_ids)),
+    ):
+        bitmaps[option_id].chunks[chunk] = decode(container)
+    return bitmaps
+
+
+def respondent_count(db_session, survey_id):
+    last = db_session.scalar(sa.select(sa.func.max(Respondent.ordinal)).where(Respondent.survey_id == survey_id))
+    return 0 if last is None else last + 1
+
+
+def _options(db_session, survey_id, option_ids=None):
+    """
+    Choice options of the survey: [(id, question_id, text)] ordered by question and id
+    """
+    query = (
+        sa.select(Option.id, Option.question_id, Option.text)
+        .join(Question, Question.id == Option.question_id)
+        .where(Question.survey_id == survey_id, Question.type.in_(CHOICE_TYPES))
+        .order_by(Option.question_id, Option.id)
+    )
+    if option_ids is not None:
+        query = query.where(Option.id.in_(option_ids))
+    return db_session.execute(query).all()
+
+
+def _match(db_session, survey_id, bitmaps, terms):
+    for option_id, _ in terms:
+        if option_id not in bitmaps:
+            raise ValueError(f"Unknown option {option_id}")
+    picked = [bitmaps[option_id] for option_id, is_picked in terms if is_picked]
+    # Only filters without picked options need all respondents
+    mask = reduce(Bitmap.__and__, picked) if picked else Bitmap.universe(respondent_count(db_session, survey_id))
+    for option_id, is_picked in terms:
+        if not is_picked:
+            mask = mask - bitmaps[option_id]
+    return mask
+
+
+def matching(db_session, survey_id, terms):
+    """
+    Respondents of the survey matching all filter terms [(option id, picked)] (see crosstab.parse_filter).
+    Raises ValueError on options of other surveys or questions.
+    """
+    option_ids = {option_id for option_id, _ in terms}
+    bitmaps = load(db_session, [option.id for option in _options(db_session, survey_id, option_ids)])
+    return _match(db_session, survey_id, bitmaps, terms)
+
+
+def filtered_stats(db_session, survey_id, terms):
+    """
+    Stats of choice questions among respondents matching the filter, shaped like stats.compute_stats.
+    Raises ValueError on unknown options.
+    """
+    from stats import _percent  # stats imports this module
+
+    questions = db_session.execute(
+        sa.select(Question.id, Question.text, Question.type)
+        .where(Question.survey_id == survey_id, Question.type.in_(CHOICE_TYPES))
+        .order_by(Question.id),
+    ).all()
+    options = _options(db_session, survey_id)
+    bitmaps = load(db_session, [option.id for option in options])
+    mask = _match(db_session, survey_id, bitmaps, terms)
+    total = len(mask)
+    stats = []
+    for question in questions:
+        question_options = [option for option in options if option.question_id == question.id]
+        selected = [mask & bitmaps[option.id] for option in question_options]
+        values = [len(bitmap) for bitmap in selected]
+        answered = len(reduce(Bitmap.__or__, selected, Bitmap()))
+        stats.append({
+            "id": question.id,
+            "text": question.text,
+            "type": question.type.value,
+            "answers_count": sum(values),
+            "response_rate": _percent(answered, total),
+            "option_stats": [
+                {"option_id": option.id, "option": option.text, "count": value,
+                 "percentage": _percent(value, sum(values))}
+                for option, value in zip(question_options, values)
+            ],
+            "chart_labels": [option.text for option in question_options],
+            "chart_values": values,
+        })
+    return {"total_responses": total, "stats": stats}
+
+
+def selected_options(db_session, source, answers):
+    """
+    Options picked in answer rows (mappings with id, and option_ids of archived ones): {answer id: [option id]}
+    """
+    if source is ArchivedAnswer:
+        return {
+            answer["id"]: [int(option_id) for option_id in answer["option_ids"].split(",")]
+            for answer in answers if answer["option_ids"]
+        }
+    selected = {}
+    for answer_id, option_id in db_session.execute(
+        sa.select(AnswerOption.answer_id, AnswerOption.option_id)
+        .where(AnswerOption.answer_id.in_([answer["id"] for answer in answers]))
+        .order_by(AnswerOption.option_id),
+    ):
+        selected.setdefault(answer_id, []).append(option_id)
+    return selected
+
+
+def _columns(source, *columns):
+    # Picked options are read from answer_options, archived answers keep them in a column
+    columns = [getattr(source, column) for column in ("id",) + columns]
+    return columns + [ArchivedAnswer.option_ids] if source is ArchivedAnswer else columns
+
+
+def export_rows(db_session, survey_id, mask, archived=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the header and a row per respondent in the bitmap: ordinal, user id, IP address and answers to every
+    question ("; " between picked options), reading answers of batch_size respondents at a time
+    """
+    questions = dict(db_session.execute(
+        sa.select(Question.id, Question.text).where(Question.survey_id == survey_id).order_by(Question.id),
+    ).all())
+    yield ["respondent", "user_id", "ip_address", *questions.values()]
+    options = dict(db_session.execute(
+        sa.select(Option.id, Option.text).join(Question, Question.id == Option.question_id)
+        .where(Question.survey_id == survey_id),
+    ).all())
+    source = ArchivedAnswer if archived else Answer
+    condition = source.survey_id == survey_id if archived else source.question_id.in_(questions)
+    ordinals = [int(ordinal) for ordinal in mask.ordinals()]
+    for start in range(0, len(ordinals), batch_size):
+        respondents = db_session.execute(
+            sa.select(Respondent.ordinal, Respondent.key, Respondent.user_id, Respondent.ip_address)
+            .where(Respondent.survey_id == survey_id, Respondent.ordinal.in_(ordinals[start:start + batch_size]))
+            .order_by(Respondent.ordinal),
+        ).all()
+        users = [respondent.user_id for respondent in respondents if respondent.user_id is not None]
+        addresses = [respondent.ip_address for respondent in respondents if respondent.user_id is None]
+        rows = db_session.execute(
+            sa.select(*_columns(source, "user_id", "ip_address", "question_id", "text_response", "file_path"))
+            .where(condition, sa.or_(
+                source.user_id.in_(users), sa.and_(source.user_id.is_(None), source.ip_address.in_(addresses)),
+            ))
+            .order_by(source.id),
+        ).mappings().all()
+        selected = selected_options(db_session, source, rows)
+        answers = {}
+        for row in rows:
+            values = answers.setdefault(submissions.dedup_key(row["user_id"], row["ip_address"]), {}).setdefault(
+                row["question_id"], [],
+            )
+            values.extend(options[option_id] for option_id in selected.get(row["id"], ()) if option_id in options)
+            if row["text_response"] is not None or row["file_path"] is not None:
+                values.append(row["text_response"] if row["text_response"] is not None else row["file_path"])
+        for respondent in respondents:
+            values = answers.get(respondent.key, {})
+            yield [respondent.ordinal, respondent.user_id or "", respondent.ip_address or ""] + [
+                "; ".join(values.get(question_id, [])) for question_id in questions
+            ]
+
+
+def _index(db_session, source, question_ids, batch_size):
+    after = 0
+    while True:
+        rows = db_session.execute(
+            sa.select(*_columns(source, "question_id", "user_id", "ip_address", "created_at"))
+            .where(source.question_id.in_(question_ids), source.id > after)
+            .order_by(source.id)
+            .limit(batch_size),
+        ).mappings().all()
+        if not rows:
+            break
+        selected = selected_options(db_session, source, rows)
+        record(db_session, [{**row, "option_ids": selected.get(row["id"], [])} for row in rows])
+        after = rows[-1]["id"]
+
+
+def reindex_questions(db_session, question_ids, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Indexes answers of the questions again (e.g. after their type changed). Commit is up to the caller.
+    """
+    forget_options(db_session, sa.select(Option.id).where(Option.question_id.in_(question_ids)).scalar_subquery())
+    _index(db_session, Answer, question_ids, batch_size)
+
+
+def rebuild(db_session, survey_id, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Numbers respondents and indexes answers of the survey (archived ones if it's archived) from scratch,
+    reading them in batches. Commit is up to the caller.
+    """
+    forget(db_session, survey_id)
+    source = Answer if db_session.get(SurveySnapshot, survey_id) is None else ArchivedAnswer
+    _index(db_session, source, sa.select(Question.id).where(Question.survey_id == survey_id).scalar_subquery(),
+           batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitmap indexes of picked options")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_command = commands.add_parser("rebuild", help="index existing answers")
+    rebuild_command.add_argument("--survey", type=int, help="only this survey")
+    rebuild_command.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE, help="answers per query")
+    args = parser.parse_args()
+
+    db_session = create_session()
+    try:
+        if args.survey is not None:
+            survey_ids = [args.survey]
+        else:
+            survey_ids = db_session.scalars(sa.select(Survey.id).order_by(Survey.id)).all()
+        # One transaction per survey
+        for survey_id in survey_ids:
+            rebuild(db_session, survey_id, args.batch_size)
+            db_session.commit()
+            print(f"Survey {survey_id}: {respondent_count(db_session, survey_id)} respondents indexed")
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
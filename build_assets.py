@@ -0,0 +1,96 @@
+# build_assets.py
+"""
+Static assets build. Copies static files into static/dist with content hash in their names,
+writes precompressed .gz (and .br if brotli is installed) variants and manifest.json used by asset_url().
+
+Example:
+    python build_assets.py
+"""
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import mimetypes
+
+from compression import DIST_DIR, MANIFEST_NAME, COMPRESS_MIMETYPES, brotli
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# User content, not a build input
+EXCLUDE_DIRS = {DIST_DIR, "uploads"}
+# Precompressed variant isn't kept if it saves less than that
+MIN_RATIO = 0.9
+
+
+def fingerprint(name, data):
+    root, extension = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+
+def source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.relpath(os.path.join(root, d), static_folder) not in EXCLUDE_DIRS)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, "/"), path
+
+
+def write_variants(path, data):
+    """
+    Writes precompressed variants of the file, returns their extensions
+    """
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+
+    written = []
+    for extension, compressed in variants.items():
+        if len(compressed) < len(data) * MIN_RATIO:
+            with open(path + extension, "wb") as file:
+                file.write(compressed)
+            written.append(extension)
+    return written
+
+
+def build(static_folder=STATIC_FOLDER, log=print):
+    """
+    Builds static/dist from scratch, returns the manifest
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {}
+    for name, path in source_files(static_folder):
+        with open(path, "rb") as file:
+            data = file.read()
+        built = fingerprint(name, data)
+        target = os.path.join(dist, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as file:
+            file.write(data)
+
+        variants = []
+        if mimetypes.guess_type(name)[0] in COMPRESS_MIMETYPES:
+            variants = write_variants(target, data)
+        manifest[name] = f"{DIST_DIR}/{built}"
+        log(f"{name} -> {manifest[name]} {' '.join(variants)}".rstrip())
+
+    with open(os.path.join(dist, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted and precompressed static assets")
+    parser.add_argument("--static", default=STATIC_FOLDER, help="static folder")
+    args = parser.parse_args()
+    if not os.path.isdir(args.static):
+        sys.exit(f"{args.static} is not a directory")
+    build(args.static)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# caching.py
+"""
+HTTP caching module.
+Weak ETags for survey endpoints derived from the survey version (bumped on every change of the survey
+or its answers) and the last answer id, conditional GET (If-None-Match -> 304) and Cache-Control policies.
+"""
+import hashlib
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import request, current_app, make_response
+
+from db import create_session
+from ORM.models import Survey, Question, Answer
+import metrics
+
+# Cache-Control per endpoint, can be overridden with app.config["CACHE_CONTROL"]
+CACHE_CONTROL = {
+    "api.get_survey": "private, no-cache",
+    "get_survey_edit_data": "private, no-cache",
+    # Dashboards poll stats every 5 seconds
+    "get_survey_stats_data": "private, max-age=5, must-revalidate",
+}
+
+
+def bump_survey_version(db_session, survey_id):
+    """
+    Invalidates ETags of the survey, call it in the transaction changing the survey, its questions or answers
+    """
+    db_session.execute(
+        sa.update(Survey)
+        .where(Survey.id == survey_id)
+        .values(version=sa.func.coalesce(Survey.version, 1) + 1),
+    )
+
+
+def survey_version(db_session, survey_id):
+    """
+    Returns (version, author_id) of the survey or None if it doesn't exist
+    """
+    return db_session.execute(
+        sa.select(sa.func.coalesce(Survey.version, 1).label("version"), Survey.author_id)
+        .where(Survey.id == survey_id),
+    ).first()
+
+
+def last_answer_id(db_session, survey_id):
+    return db_session.execute(
+        sa.select(sa.func.max(Answer.id))
+        .join(Question, Question.id == Answer.question_id)
+        .where(Question.survey_id == survey_id),
+    ).scalar() or 0
+
+
+def make_etag(*parts):
+    """
+    Builds ETag value from parts and query string (responses differ by query arguments)
+    """
+    if request.query_string:
+        parts = (*parts, hashlib.sha1(request.query_string).hexdigest()[:12])
+    return "-".join(str(part) for part in parts)
+
+
+def conditional(etag_lookup):
+    """
+    Decorator of GET views. etag_lookup(db_session, **view_kwargs) returns ETag or None when the view must run
+    anyway (not found, access denied). Responds 304 if the client has the current version.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            db_session = create_session()
+            try:
+                etag = etag_lookup(db_session, **kwargs)
+            finally:
+                db_session.close()
+            if etag is None:
+                return fn(*args, **kwargs)
+
+            policies = current_app.config.get("CACHE_CONTROL", CACHE_CONTROL)
+            cache_control = policies.get(request.endpoint, "private, no-cache")
+
+            # If-None-Match uses weak comparison
+            hit = request.if_none_match.contains_weak(etag)
+            metrics.record_cache("etag", hit)
+            if hit:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # Weak on every response: a compressed body can't have a strong ETag (see compression.py) and a 304
+            # must repeat the ETag the 200 would have, whether or not it would have been compressed
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = cache_control
+            return response
+        return decorator
+    return wrapper
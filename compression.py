@@ -0,0 +1,180 @@
+# compression.py
+"""
+Response compression module.
+Dynamic responses (HTML, JSON, JS, CSV...) above COMPRESS_MIN_SIZE are compressed with brotli or gzip
+negotiated by Accept-Encoding, streamed responses (exports) are compressed chunk by chunk.
+Static files are served from static/dist built by build_assets.py: fingerprinted names with far-future
+Cache-Control and precompressed .br/.gz variants, see asset_url() in templates.
+"""
+import os
+import gzip
+import json
+import zlib
+import mimetypes
+
+from flask import request, current_app, url_for, send_file, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+COMPRESS_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript", "application/javascript",
+    "application/json", "application/xml", "image/svg+xml",
+}
+
+# Content-Encoding: precompressed file extension, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings():
+    return [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+
+
+def negotiate(encodings=None):
+    """
+    Returns the best Content-Encoding accepted by the client or None
+    """
+    encodings = available_encodings() if encodings is None else encodings
+    if not encodings:
+        return None
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level["br"])
+    return gzip.compress(data, compresslevel=level["gzip"], mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compresses an iterable of chunks, every chunk is flushed so the client gets data as it's produced
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level["br"])
+        for chunk in chunks:
+            data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level["gzip"], zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def _compressible(response):
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if "Content-Encoding" in response.headers or response.direct_passthrough:
+        return False
+    return "no-transform" not in response.headers.get("Cache-Control", "")
+
+
+def _compress_response(response):
+    config = current_app.config
+    if not config["COMPRESS_ENABLED"] or request.method == "HEAD" or not _compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if not response.is_streamed and response.content_length is not None \
+            and response.content_length < config["COMPRESS_MIN_SIZE"]:
+        return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    level = {"br": config["COMPRESS_BR_LEVEL"], "gzip": config["COMPRESS_GZIP_LEVEL"]}
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding, level))
+    response.headers["Content-Encoding"] = encoding
+
+    # Compressed body is another representation, its ETag can only be weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def load_manifest(static_folder):
+    """
+    Returns {"main.js": "dist/main.<hash>.js"} written by build_assets.py or {} if assets aren't built
+    """
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(filename):
+    """
+    URL of the fingerprinted static file, falls back to the source file in development
+    """
+    return url_for("static", filename=current_app.config["ASSET_MANIFEST"].get(filename, filename))
+
+
+def send_static(filename):
+    """
+    Static view serving precompressed variants of built assets
+    """
+    app = current_app
+    fingerprinted = filename.startswith(DIST_DIR + "/")
+    # Source names (e.g. /static/swagger.json) are served from their built copy too, but without long caching
+    built = filename if fingerprinted else app.config["ASSET_MANIFEST"].get(filename)
+    if built is None:
+        return app.send_static_file(filename)
+
+    path = safe_join(app.static_folder, built)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    max_age = ASSET_MAX_AGE if fingerprinted else None
+
+    encodings = [encoding for encoding, extension in ENCODINGS.items() if os.path.isfile(path + extension)]
+    encoding = negotiate(encodings)
+    if encoding is None:
+        response = send_file(path, max_age=max_age)
+    else:
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response = send_file(path + ENCODINGS[encoding], mimetype=mimetype, max_age=max_age)
+        response.headers["Content-Encoding"] = encoding
+    if encodings:
+        response.vary.add("Accept-Encoding")
+    if fingerprinted:
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+    return response
+
+
+def init_app(app):
+    """
+    Registers compression hook and static view. Configuration:
+    COMPRESS_ENABLED - compress dynamic responses (env COMPRESS_ENABLED, default on)
+    COMPRESS_MIN_SIZE - don't compress smaller bodies, bytes (env COMPRESS_MIN_SIZE, default 1024)
+    COMPRESS_GZIP_LEVEL, COMPRESS_BR_LEVEL - compression levels for dynamic responses
+    """
+    app.config.setdefault("COMPRESS_ENABLED", os.environ.get("COMPRESS_ENABLED", "1") == "1")
+    app.config.setdefault("COMPRESS_MIN_SIZE", int(os.environ.get("COMPRESS_MIN_SIZE", 1024)))
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", int(os.environ.get("COMPRESS_GZIP_LEVEL", 6)))
+    app.config.setdefault("COMPRESS_BR_LEVEL", int(os.environ.get("COMPRESS_BR_LEVEL", 4)))
+    app.config.setdefault("ASSET_MANIFEST", load_manifest(app.static_folder))
+
+    app.view_functions["static"] = send_static
+    app.add_template_global(asset_url)
+    app.after_request(_compress_response)
@@ -0,0 +1,258 @@
+# crosstab.py
+"""
+Cross-tabulation module.
+Choice answers of a survey are loaded into a boolean respondent x option matrix (NumPy). Respondents are told apart
+like repeated submissions are: by user if logged in, by IP address otherwise. Crosstabs of any two questions,
+optionally filtered, are then array operations instead of queries (filtered stats use option bitmaps, bitmaps.py).
+Matrices are cached per process by survey version (bumped by edits and deletions, which reload the matrix); new
+submissions are added incrementally by reading answers after the last loaded id. Re-reading a few ids back is
+harmless (bits are only set), so answers committed out of id order aren't missed.
+NumPy is imported on first use rather than with the module: most processes never build a matrix.
+"""
+import os
+import threading
+from collections import OrderedDict, defaultdict
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ORM.models import Question, CHOICE_TYPES, Option, Answer, AnswerOption, ArchivedAnswer
+from submissions import dedup_key
+import metrics
+
+# Answer ids re-read on refresh for transactions committed out of id order
+REFRESH_OVERLAP = 1000
+
+
+def parse_filter(value):
+    """
+    Parses "12,-15" (picked option 12 and not option 15) into [(12, True), (15, False)]
+    """
+    terms = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            option_id = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid filter term: {part}")
+        terms.append((abs(option_id), option_id > 0))
+    return terms
+
+
+class SurveyMatrix:
+    """
+    Respondent x option matrix of choice answers of one survey
+    """
+    def __init__(self, questions, options):
+        import numpy as np
+
+        # questions: [(id, text, type)], options: [(id, question_id, text)] ordered by question and id
+        self.questions = {question_id: (text, question_type) for question_id, text, question_type in questions}
+        self.option_ids = np.array([option[0] for option in options], dtype=np.int64)
+        self.option_questions = np.array([option[1] for option in options], dtype=np.int64)
+        self.option_texts = [option[2] for option in options]
+        self.columns = {option[0]: column for column, option in enumerate(options)}
+        self.respondents = {}
+        self._matrix = np.zeros((0, len(options)), dtype=bool)
+        self.last_answer_id = 0
+
+    @property
+    def matrix(self):
+        return self._matrix[:len(self.respondents)]
+
+    def add(self, answers):
+        """
+        Sets bits of picked options [(answer id, user_id, ip_address, option id)]
+        """
+        import numpy as np
+
+        rows, columns = [], []
+        for answer_id, user_id, ip_address, option_id in answers:
+            self.last_answer_id = max(self.last_answer_id, answer_id)
+            column = self.columns.get(option_id)
+            if column is None:
+                continue
+            key = dedup_key(user_id, ip_address)
+            row = self.respondents.get(key)
+            if row is None:
+                row = self.respondents[key] = len(self.respondents)
+            rows.append(row)
+            columns.append(column)
+        if len(self.respondents) > len(self._matrix):
+            # Grown by doubling, rows past len(respondents) are unused
+            grown = np.zeros((max(len(self.respondents), 2 * len(self._matrix)), len(self.option_ids)), dtype=bool)
+            grown[:len(self._matrix)] = self._matrix
+            self._matrix = grown
+        if rows:
+            self._matrix[rows, columns] = True
+
+    def question_columns(self, question_id):
+        import numpy as np
+
+        if self.questions.get(question_id, (None, None))[1] not in CHOICE_TYPES:
+            raise KeyError(question_id)
+        return np.flatnonzero(self.option_questions == question_id)
+
+    def mask(self, terms):
+        """
+        Respondents matching all filter terms [(option id, picked)]
+        """
+        import numpy as np
+
+        mask = np.ones(len(self.respondents), dtype=bool)
+        for option_id, picked in terms:
+            if option_id not in self.columns:
+                raise ValueError(f"Unknown option {option_id}")
+            column = self.matrix[:, self.columns[option_id]]
+            mask &= column if picked else ~column
+        return mask
+
+    def distribution(self, question_id, mask):
+        """
+        (respondents who answered the question, counts of its options) among masked respondents
+        """
+        selected = self.matrix[mask][:, self.question_columns(question_id)]
+        return int(selected.any(axis=1).sum()), selected.sum(axis=0)
+
+    def crosstab(self, row_question_id, column_question_id, mask):
+        """
+        Respondents who picked both options: rows x columns counts, and respondents per row option
+        """
+        import numpy as np
+
+        selected = self.matrix[mask]
+        rows = selected[:, self.question_columns(row_question_id)].astype(np.int64)
+        columns = selected[:, self.question_columns(column_question_id)].astype(np.int64)
+        return rows.T @ columns, rows.sum(axis=0)
+
+    def describe(self, question_id):
+        return {
+            "question_id": question_id,
+            "text": self.questions[question_id][0],
+            "options": [
+                {"id": int(self.option_ids[column]), "text": self.option_texts[column]}
+                for column in self.question_columns(question_id)
+            ],
+        }
+
+
+class MatrixCache:
+    """
+    Matrices per (survey, archived) with the survey version they were loaded at, least recently used are dropped
+    """
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._survey_locks = defaultdict(threading.Lock)
+
+    def survey_lock(self, survey_id):
+        with self._lock:
+            return self._survey_locks[survey_id]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _answers(db_session, survey_id, question_ids, after, archived):
+    """
+    Picked options of answers after the id: [(answer id, user_id, ip_address, option id)]
+    """
+    if not archived:
+        return db_session.execute(
+            sa.select(Answer.id, Answer.user_id, Answer.ip_address, AnswerOption.option_id)
+            .join(AnswerOption, AnswerOption.answer_id == Answer.id)
+            .where(Answer.question_id.in_(question_ids), Answer.id > after),
+        ).all()
+    # Archived answers keep their options in a column
+    return [
+        (answer_id, user_id, ip_address, int(option_id))
+        for answer_id, user_id, ip_address, option_ids in db_session.execute(
+            sa.select(ArchivedAnswer.id, ArchivedAnswer.user_id, ArchivedAnswer.ip_address, ArchivedAnswer.option_ids)
+            .where(ArchivedAnswer.survey_id == survey_id, ArchivedAnswer.question_id.in_(question_ids),
+                   ArchivedAnswer.id > after, ArchivedAnswer.option_ids.isnot(None)),
+        )
+        for option_id in option_ids.split(",")
+    ]
+
+
+def load_matrix(db_session, survey_id, archived=False):
+    questions = db_session.execute(
+        sa.select(Question.id, Question.text, Question.type)
+        .where(Question.survey_id == survey_id)
+        .order_by(Question.id),
+    ).all()
+    choice_ids = [question.id for question in questions if question.type in CHOICE_TYPES]
+    options = db_session.execute(
+        sa.select(Option.id, Option.question_id, Option.text)
+        .where(Option.question_id.in_(choice_ids))
+        .order_by(Option.question_id, Option.id),
+    ).all()
+    matrix = SurveyMatrix(questions, options)
+    if choice_ids:
+        matrix.add(_answers(db_session, survey_id, choice_ids, 0, archived))
+    return matrix
+
+
+def survey_matrix(db_session, survey_id, version, archived=False):
+    """
+    Cached matrix of the survey at the version, with answers submitted since the last call added
+    """
+    cache = current_app.extensions["crosstab"]
+    with cache.survey_lock(survey_id):
+        entry = cache.get((survey_id, archived))
+        hit = entry is not None and entry[0] == version
+        metrics.record_cache("crosstab", hit)
+        if not hit:
+            entry = (version, load_matrix(db_session, survey_id, archived))
+            cache.put((survey_id, archived), entry)
+        elif not archived:
+            matrix = entry[1]
+            question_ids = [int(question_id) for question_id in set(matrix.option_questions)]
+            if question_ids:
+                matrix.add(_answers(
+                    db_session, survey_id, question_ids, max(matrix.last_answer_id - REFRESH_OVERLAP, 0), archived,
+                ))
+        return entry[1]
+
+
+def crosstab(matrix, row_question_id, column_question_id, terms):
+    """
+    Crosstab of two choice questions among respondents matching the filter
+    """
+    import numpy as np
+
+    mask = matrix.mask(terms)
+    counts, row_totals = matrix.crosstab(row_question_id, column_question_id, mask)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(row_totals[:, None] > 0, counts / row_totals[:, None] * 100, 0.0)
+    return {
+        "respondents": int(mask.sum()),
+        "rows": matrix.describe(row_question_id),
+        "columns": matrix.describe(column_question_id),
+        "counts": counts.tolist(),
+        "row_totals": row_totals.tolist(),
+        "row_percentages": np.round(shares, 1).tolist(),
+    }
+
+
+def init_app(app):
+    """
+    Creates the matrix cache. Configuration:
+    CROSSTAB_CACHE_SIZE - cached survey matrices per process (env CROSSTAB_CACHE_SIZE)
+    """
+    app.config.setdefault("CROSSTAB_CACHE_SIZE", int(os.environ.get("CROSSTAB_CACHE_SIZE", 16)))
+    app.extensions["crosstab"] = MatrixCache(app.config["CROSSTAB_CACHE_SIZE"])
@@ -10,13 +10,20 @@ import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
 import sqlalchemy.ext.declarative as dec
 
+from instrumentation import instrument_engine
+
 SqlAlchemyBase = dec.declarative_base()
 
 __factory = None
+__engine = None
 
 
-def global_init():
-    global __factory
+def global_init(migrate=None):
+    """
+    Creates the engine (it connects on first use) and checks the schema version.
+    migrate (env DB_MIGRATE): "auto" - apply pending migrations, "check" - only warn about them, "off" - skip
+    """
+    global __factory, __engine
 
     if __factory:
         return
@@ -26,15 +33,29 @@ def global_init():
         conn_str = f"sqlite:///{file_path}?check_same_thread=False"
     else:
         conn_str = f"{os.environ.get('DB_TYPE', 'mariadb+pymysql')}://{os.environ.get('DB_USER', 'user')}:{os.environ.get('DB_PASSWORD', 'Password_123')}@{os.environ.get('DB_SERVER', '127.0.0.1')}/{os.environ.get('DB', 'SurveyAppDB')}?charset=utf8mb4&" # check_same_thread=False&
-    print(f"Подключение к базе данных по адресу {conn_str}")
 
     engine = sa.create_engine(conn_str, echo=False, pool_size=10, max_overflow=20)
-    __factory = orm.sessionmaker(bind=engine)
+    print(f"Подключение к базе данных по адресу {engine.url.render_as_string(hide_password=True)}")
+    instrument_engine(engine)
     from ORM import __all_models
 
-    SqlAlchemyBase.metadata.create_all(engine)
+    migrate = migrate or os.environ.get("DB_MIGRATE", "auto")
+    if migrate != "off":
+        from migrations import check_schema
+        # One query if the schema is up to date. Fails if the database is down, next call retries
+        check_schema(engine, auto_upgrade=migrate == "auto")
+
+    __engine = engine
+    __factory = orm.sessionmaker(bind=engine)
+
+
+def get_engine():
+    global __engine
+    return __engine
 
 
 def create_session() -> Session:
     global __factory
+    if __factory is None:
+        global_init()
     return __factory()
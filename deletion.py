@@ -0,0 +1,125 @@
+# deletion.py
+"""
+Chunked deletion module.
+Surveys and users are deleted with bounded batches of answers (and their answer_options), each batch in its own
+short transaction, so big surveys don't lock tables or load rows into memory. Questions, options and the parent row
+go last, together with answers submitted meanwhile. Deleting is idempotent: an interrupted run is simply repeated.
+"""
+import sqlalchemy as sa
+
+from ORM.models import User, Survey, Question, Option, Answer, AnswerOption, ArchivedAnswer, SurveySnapshot
+import bitmaps
+import sketches
+import text_analytics
+
+DELETE_BATCH_SIZE = 5000
+
+
+def _survey_questions(survey_id):
+    return sa.select(Question.id).where(Question.survey_id == survey_id).scalar_subquery()
+
+
+def count_survey_rows(db_session, survey_id):
+    """
+    Rows deleted with the survey (answers, archived answers, options, questions and the survey), used as job total
+    """
+    question_ids = _survey_questions(survey_id)
+    answers = db_session.scalar(sa.select(sa.func.count(Answer.id)).where(Answer.question_id.in_(question_ids)))
+    archived = db_session.scalar(sa.select(sa.func.count()).where(ArchivedAnswer.survey_id == survey_id))
+    options = db_session.scalar(sa.select(sa.func.count(Option.id)).where(Option.question_id.in_(question_ids)))
+    questions = db_session.scalar(sa.select(sa.func.count(Question.id)).where(Question.survey_id == survey_id))
+    return answers + archived + options + questions + 1
+
+
+def count_user_rows(db_session, user_id):
+    """
+    Rows deleted or updated with the user: rows of their surveys, their answers to other surveys and the user
+    """
+    survey_ids = db_session.scalars(sa.select(Survey.id).where(Survey.author_id == user_id)).all()
+    answers = db_session.scalar(sa.select(sa.func.count(Answer.id)).where(Answer.user_id == user_id))
+    return sum(count_survey_rows(db_session, survey_id) for survey_id in survey_ids) + answers + 1
+
+
+def delete_answers(db_session, answer_ids):
+    """
+    Deletes answers by id with their answer_options rows
+    """
+    db_session.execute(sa.delete(AnswerOption).where(AnswerOption.answer_id.in_(answer_ids)))
+    db_session.execute(sa.delete(Answer).where(Answer.id.in_(answer_ids)))
+
+
+def delete_survey(db_session, survey_id, batch_size=DELETE_BATCH_SIZE, on_batch=None, done=0):
+    """
+    Deletes the survey with everything attached, committing every batch.
+    on_batch(done) is called before each commit with the number of rows deleted so far (to store progress
+    in the same transaction). Returns that number.
+    """
+    question_ids = db_session.scalars(sa.select(Question.id).where(Question.survey_id == survey_id)).all()
+    while question_ids:
+        answer_ids = db_session.scalars(
+            sa.select(Answer.id).where(Answer.question_id.in_(question_ids)).limit(batch_size),
+        ).all()
+        if len(answer_ids) < batch_size:
+            # The rest goes with the final transaction
+            break
+        delete_answers(db_session, answer_ids)
+        done += len(answer_ids)
+        if on_batch is not None:
+            on_batch(done)
+        db_session.commit()
+
+    while True:
+        archived_ids = db_session.scalars(
+            sa.select(ArchivedAnswer.id).where(ArchivedAnswer.survey_id == survey_id).limit(batch_size),
+        ).all()
+        if not archived_ids:
+            break
+        db_session.execute(sa.delete(ArchivedAnswer).where(ArchivedAnswer.id.in_(archived_ids)))
+        done += len(archived_ids)
+        if on_batch is not None:
+            on_batch(done)
+        db_session.commit()
+
+    # Answers submitted while deleting, then the survey structure
+    answer_ids = db_session.scalars(sa.select(Answer.id).where(Answer.question_id.in_(question_ids))).all()
+    delete_answers(db_session, answer_ids)
+    option_ids = sa.select(Option.id).where(Option.question_id.in_(question_ids)).scalar_subquery()
+    db_session.execute(sa.delete(AnswerOption).where(AnswerOption.option_id.in_(option_ids)))
+    bitmaps.forget(db_session, survey_id)
+    options = db_session.execute(sa.delete(Option).where(Option.question_id.in_(question_ids))).rowcount
+    text_analytics.forget_questions(db_session, question_ids)
+    db_session.execute(sa.delete(Question).where(Question.id.in_(question_ids)))
+    db_session.execute(sa.delete(SurveySnapshot).where(SurveySnapshot.survey_id == survey_id))
+    sketches.forget(db_session, survey_id)
+    db_session.execute(sa.delete(Survey).where(Survey.id == survey_id))
+    done += len(answer_ids) + options + len(question_ids) + 1
+    if on_batch is not None:
+        on_batch(done)
+    db_session.commit()
+    return done
+
+
+def delete_user(db_session, user_id, batch_size=DELETE_BATCH_SIZE, on_batch=None, done=0):
+    """
+    Deletes the user with their surveys; their answers to other surveys are kept anonymous.
+    Same batching and on_batch as delete_survey.
+    """
+    for survey_id in db_session.scalars(sa.select(Survey.id).where(Survey.author_id == user_id)).all():
+        done = delete_survey(db_session, survey_id, batch_size, on_batch, done)
+
+    while True:
+        answer_ids = db_session.scalars(sa.select(Answer.id).where(Answer.user_id == user_id).limit(batch_size)).all()
+        if not answer_ids:
+            break
+        db_session.execute(sa.update(Answer).where(Answer.id.in_(answer_ids)).values(user_id=None))
+        done += len(answer_ids)
+        if on_batch is not None:
+            on_batch(done)
+        db_session.commit()
+
+    db_session.execute(sa.delete(User).where(User.id == user_id))
+    done += 1
+    if on_batch is not None:
+        on_batch(done)
+    db_session.commit()
+    return done
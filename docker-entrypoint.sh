@@ -27,6 +27,10 @@ print('Could not connect to database after 60 seconds')
 sys.exit(1)
 "
 
+# Apply database migrations
+echo "Applying migrations..."
+python3 -m migrations upgrade
+
 # Initialize the application
 echo "Starting application..."
 exec "$@" 
\ No newline at end of file
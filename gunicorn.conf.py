@@ -0,0 +1,26 @@
+# gunicorn.conf.py
+"""
+Gunicorn configuration. Run with:
+    PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus gunicorn -c gunicorn.conf.py app:app
+PROMETHEUS_MULTIPROC_DIR must point to an empty directory, it is cleaned on start (the Docker image sets it).
+"""
+import os
+import shutil
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+# Workers divide the global concurrency limits by it (see ratelimit.init_app)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def on_starting(server):
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
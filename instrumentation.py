@@ -0,0 +1,143 @@
+# instrumentation.py
+"""
+Per-request instrumentation module.
+Counts SQL statements and measures DB, template rendering and handler time of every request.
+Results are logged and, outside of production, returned in "Server-Timing" header.
+"""
+import os
+import time
+import logging
+
+from flask import g, request, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger("questionnaire.requests")
+
+
+def parse_budgets(value):
+    """
+    Parses "endpoint=N,..." into {endpoint: N}
+    """
+    budgets = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            endpoint, count = item.split("=", 1)
+            budgets[endpoint.strip()] = int(count)
+    return budgets
+
+
+def instrument_engine(engine):
+    """
+    Attaches statement counting hooks to SQLAlchemy engine
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _timings():
+    if not has_request_context():
+        return None
+    return g.get("_timings")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timings() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _timings()
+    started = conn.info.get("query_started")
+    if timings is None or not started:
+        return
+    timings["db_queries"] += 1
+    timings["db_time"] += time.perf_counter() - started.pop()
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def _before_render_template(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings["template_started"].append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and timings["template_started"]:
+        timings["template_time"] += time.perf_counter() - timings["template_started"].pop()
+
+
+def _start_request():
+    g._timings = {
+        "started": time.perf_counter(),
+        "db_queries": 0,
+        "db_time": 0.0,
+        "template_started": [],
+        "template_time": 0.0,
+    }
+
+
+def _finish_request(response):
+    timings = g.pop("_timings", None)
+    if timings is None:
+        return response
+
+    handler_time = time.perf_counter() - timings["started"]
+    endpoint = request.endpoint or "<unknown>"
+    fields = {
+        "endpoint": endpoint,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "db_queries": timings["db_queries"],
+        "db_time_ms": round(timings["db_time"] * 1000, 2),
+        "template_time_ms": round(timings["template_time"] * 1000, 2),
+        "handler_time_ms": round(handler_time * 1000, 2),
+    }
+    logger.info(
+        "%(method)s %(path)s %(status)s endpoint=%(endpoint)s db_queries=%(db_queries)s "
+        "db_time_ms=%(db_time_ms)s template_time_ms=%(template_time_ms)s handler_time_ms=%(handler_time_ms)s",
+        fields, extra=fields,
+    )
+
+    budget = current_app.config["QUERY_BUDGETS"].get(endpoint, current_app.config["QUERY_BUDGET"])
+    if budget is not None and timings["db_queries"] > budget:
+        logger.warning(
+            "Query budget exceeded: %(endpoint)s issued %(db_queries)s SQL statements",
+            fields, extra={**fields, "query_budget": budget},
+        )
+
+    if current_app.config["SERVER_TIMING"]:
+        response.headers["Server-Timing"] = ", ".join([
+            f'db;dur={fields["db_time_ms"]};desc="{timings["db_queries"]} queries"',
+            f'tpl;dur={fields["template_time_ms"]}',
+            f'app;dur={fields["handler_time_ms"]}',
+        ])
+    return response
+
+
+def init_app(app):
+    """
+    Registers request hooks. Configuration:
+    SERVER_TIMING - add "Server-Timing" header (env SERVER_TIMING, by default enabled if FLASK_ENV isn't production)
+    QUERY_BUDGET - default max SQL statements per request before a warning is logged (env QUERY_BUDGET)
+    QUERY_BUDGETS - {endpoint: max statements} overrides (env QUERY_BUDGETS="survey.take_survey=30,...")
+    """
+    app.config.setdefault(
+        "SERVER_TIMING",
+        os.environ.get("SERVER_TIMING", str(os.environ.get("FLASK_ENV", "production") != "production")).lower()
+        in ("1", "true", "yes"),
+    )
+    app.config.setdefault("QUERY_BUDGET", int(os.environ.get("QUERY_BUDGET", 50)))
+    app.config.setdefault("QUERY_BUDGETS", parse_budgets(os.environ.get("QUERY_BUDGETS")))
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
@@ -0,0 +1,205 @@
+# jobs.py
+"""
+Background jobs module.
+Long operations (deleting big surveys and users) are stored in the jobs table and run by a worker thread,
+progress is saved with every batch (GET /api/jobs/<id>). Any process may run a pending job, claiming it with
+a conditional UPDATE; jobs of a stopped process become pending again after JOB_STALE_AFTER seconds.
+"""
+import os
+import atexit
+import logging
+import datetime
+import threading
+
+import sqlalchemy as sa
+from flask import current_app
+
+from db import create_session
+from ORM.models import Job
+import deletion
+
+logger = logging.getLogger("questionnaire.jobs")
+
+# kind: (handler(db_session, target_id, batch_size, on_batch), counter of rows to process)
+HANDLERS = {
+    "delete_survey": (deletion.delete_survey, deletion.count_survey_rows),
+    "delete_user": (deletion.delete_user, deletion.count_user_rows),
+}
+
+
+def dump_job(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "status": job.status,
+        "total": job.total,
+        "done": job.done,
+        "progress": round(min(job.done, job.total) / job.total, 4) if job.total else 0,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+def run_or_submit(db_session, kind, target_id, created_by):
+    """
+    Runs small operations at once (still in batches) and returns None,
+    bigger ones (more than JOB_INLINE_MAX rows) are queued and their Job is returned.
+    While a job of the same kind and target is pending or running, that job is returned instead.
+    """
+    handler, counter = HANDLERS[kind]
+    active = db_session.scalars(
+        sa.select(Job)
+        .where(Job.kind == kind, Job.target_id == target_id, Job.status.in_(("pending", "running")))
+        .order_by(Job.id)
+        .limit(1),
+    ).first()
+    if active is not None:
+        return active
+
+    total = counter(db_session, target_id)
+    if total <= current_app.config["JOB_INLINE_MAX"]:
+        handler(db_session, target_id, current_app.config["JOB_BATCH_SIZE"])
+        return None
+
+    job = Job(kind=kind, target_id=target_id, created_by=created_by, total=total, done=0, status="pending")
+    db_session.add(job)
+    db_session.commit()
+    current_app.extensions["jobs"].wake()
+    return job
+
+
+class JobRunner:
+    """
+    Claims pending jobs one by one and runs them in a thread
+    """
+    def __init__(self, batch_size=deletion.DELETE_BATCH_SIZE, poll_interval=5.0, stale_after=300.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def claim(self, db_session):
+        """
+        Marks the oldest pending job as running, returns its id or None
+        """
+        now = datetime.datetime.utcnow()
+        db_session.execute(
+            sa.update(Job)
+            .where(Job.status == "running", Job.updated_at < now - datetime.timedelta(seconds=self.stale_after))
+            .values(status="pending"),
+        )
+        db_session.commit()
+        for job_id in db_session.scalars(sa.select(Job.id).where(Job.status == "pending").order_by(Job.id).limit(10)):
+            claimed = db_session.execute(
+                sa.update(Job).where(Job.id == job_id, Job.status == "pending").values(status="running", updated_at=now),
+            ).rowcount
+            db_session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def run(self, db_session, job_id):
+        job = db_session.get(Job, job_id)
+        handler, _ = HANDLERS[job.kind]
+
+        def on_batch(done):
+            # Saved in the transaction of the batch
+            db_session.execute(
+                sa.update(Job).where(Job.id == job_id).values(done=done, updated_at=datetime.datetime.utcnow()),
+            )
+
+        try:
+            # A job taken over from a stopped worker continues counting from its saved progress
+            handler(db_session, job.target_id, self.batch_size, on_batch, job.done or 0)
+            status, error = "done", None
+        except Exception as e:
+            db_session.rollback()
+            logger.exception("Job %s failed", job_id)
+            status, error = "failed", str(e)
+        db_session.execute(
+            sa.update(Job).where(Job.id == job_id)
+            .values(status=status, error=error, updated_at=datetime.datetime.utcnow()),
+        )
+        db_session.commit()
+
+    def run_pending(self):
+        """
+        Runs pending jobs until there are none, returns how many were run
+        """
+        count = 0
+        db_session = create_session()
+        try:
+            while (job_id := self.claim(db_session)) is not None:
+                self.run(db_session, job_id)
+                count += 1
+        finally:
+            db_session.close()
+        return count
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Failed to run jobs, retrying in %s s", self.poll_interval)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """
+        Starts the thread once per process (threads don't survive forking of workers)
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+
+def _start_runner():
+    # Started by the first request, so importing the app doesn't touch the database
+    if current_app.config["JOB_WORKER"]:
+        current_app.extensions["jobs"].start()
+
+
+def init_app(app):
+    """
+    Creates the job runner. Configuration:
+    JOB_WORKER - run jobs in a thread of this process, started by the first request (env JOB_WORKER, default on)
+    JOB_BATCH_SIZE - rows per transaction (env JOB_BATCH_SIZE)
+    JOB_INLINE_MAX - operations on fewer rows run during the request (env JOB_INLINE_MAX)
+    JOB_POLL_INTERVAL - seconds between checks for jobs queued by other processes (env JOB_POLL_INTERVAL)
+    JOB_STALE_AFTER - seconds without progress after which a running job is taken over (env JOB_STALE_AFTER)
+    """
+    app.config.setdefault("JOB_WORKER", os.environ.get("JOB_WORKER", "1") == "1")
+    app.config.setdefault("JOB_BATCH_SIZE", int(os.environ.get("JOB_BATCH_SIZE", deletion.DELETE_BATCH_SIZE)))
+    app.config.setdefault("JOB_INLINE_MAX", int(os.environ.get("JOB_INLINE_MAX", 10000)))
+    app.config.setdefault("JOB_POLL_INTERVAL", float(os.environ.get("JOB_POLL_INTERVAL", 5)))
+    app.config.setdefault("JOB_STALE_AFTER", float(os.environ.get("JOB_STALE_AFTER", 300)))
+
+    runner = JobRunner(
+        batch_size=app.config["JOB_BATCH_SIZE"],
+        poll_interval=app.config["JOB_POLL_INTERVAL"],
+        stale_after=app.config["JOB_STALE_AFTER"],
+    )
+    app.extensions["jobs"] = runner
+    app.before_request(_start_runner)
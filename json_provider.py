@@ -0,0 +1,84 @@
+# json_provider.py
+"""
+Fast JSON module.
+Flask JSON provider backed by orjson (falls back to stdlib json if orjson isn't installed).
+Datetimes are encoded as ISO 8601, enums (QuestionType) by value, Decimal and UUID as strings.
+"""
+import enum
+import uuid
+import decimal
+import datetime
+import dataclasses
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+
+def default(obj):
+    """
+    Encodes types unsupported by json (and orjson)
+    """
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider with orjson encoding for app.json, jsonify() and the Jinja tojson filter
+    """
+    default = staticmethod(default)
+
+    def _orjson_option(self, indent=None, sort_keys=None):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps_bytes(self, obj, indent=None):
+        """
+        Serializes obj to UTF-8 JSON bytes
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_option(indent))
+            except orjson.JSONEncodeError:
+                # E.g. integers wider than 64 bits, stdlib json handles them
+                pass
+        if indent:
+            return super().dumps(obj, indent=indent).encode()
+        return super().dumps(obj, separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        # Options orjson doesn't support (cls=, default=...) are handled by stdlib json
+        if orjson is not None and set(kwargs) <= {"indent", "separators", "sort_keys", "ensure_ascii"}:
+            try:
+                option = self._orjson_option(kwargs.get("indent"), kwargs.get("sort_keys"))
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
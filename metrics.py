@@ -0,0 +1,104 @@
+# metrics.py
+"""
+Prometheus metrics module.
+Exposes /metrics endpoint. Under gunicorn set PROMETHEUS_MULTIPROC_DIR (an empty directory) for every worker,
+values of all workers are aggregated then (see gunicorn.conf.py).
+"""
+import os
+import time
+
+from flask import Blueprint, Response, g, request
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+
+from db import get_engine
+
+metrics_bp = Blueprint("metrics", __name__)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency",
+    ["blueprint", "endpoint", "method"],
+)
+REQUESTS = Counter(
+    "http_requests_total", "Handled requests",
+    ["blueprint", "endpoint", "method", "status"],
+)
+POOL_SIZE = Gauge("db_pool_size", "Connection pool size", multiprocess_mode="livesum")
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections in use", multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections opened above pool size", multiprocess_mode="livesum")
+POOL_WAITERS = Gauge("db_pool_waiters", "Threads waiting for a connection", multiprocess_mode="livesum")
+SUBMISSIONS = Counter("survey_submissions_total", "Accepted survey submissions", ["survey_id"])
+BUFFERED_SUBMISSIONS = Gauge(
+    "buffered_submissions", "Submissions waiting in the write-behind journal", multiprocess_mode="max",
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups", ["cache", "result"])
+UPLOADS = Counter("upload_files_total", "Uploaded files")
+UPLOAD_BYTES = Counter("upload_bytes_total", "Uploaded bytes")
+REJECTED_REQUESTS = Counter("rejected_requests_total", "Requests rejected by admission control", ["reason"])
+
+
+def record_cache(cache, hit):
+    """
+    Counts cache lookup, hit ratio is cache_requests_total{result="hit"} / cache_requests_total
+    """
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_upload(size):
+    UPLOADS.inc()
+    UPLOAD_BYTES.inc(size)
+
+
+def _pool_waiters(pool):
+    # QueuePool keeps waiting threads in the condition of its internal queue
+    condition = getattr(getattr(pool, "_pool", None), "not_empty", None)
+    return len(getattr(condition, "_waiters", ()))
+
+
+def update_pool_gauges():
+    engine = get_engine()
+    pool = engine.pool if engine is not None else None
+    if pool is None or not hasattr(pool, "checkedout"):
+        return
+    POOL_SIZE.set(pool.size())
+    POOL_CHECKED_OUT.set(pool.checkedout())
+    POOL_OVERFLOW.set(max(pool.overflow(), 0))
+    POOL_WAITERS.set(_pool_waiters(pool))
+
+
+def _start_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _finish_request(response):
+    started = g.pop("_metrics_started", None)
+    if started is None or request.endpoint == "metrics.metrics":
+        return response
+
+    labels = {
+        "blueprint": request.blueprint or "app",
+        "endpoint": request.endpoint or "<unknown>",
+        "method": request.method,
+    }
+    REQUEST_LATENCY.labels(**labels).observe(time.perf_counter() - started)
+    REQUESTS.labels(status=str(response.status_code), **labels).inc()
+    update_pool_gauges()
+    return response
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    update_pool_gauges()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(metrics_bp)
@@ -0,0 +1,196 @@
+# migrations/__init__.py
+"""
+Schema migrations module.
+Migrations are modules vNNNN_<name>.py of this package with VERSION, upgrade(connection) and downgrade(connection).
+Applied versions are recorded in the schema_version table, so a started process only reads max(version).
+CLI: python -m migrations upgrade|current|downgrade
+"""
+import pkgutil
+import logging
+import datetime
+import importlib
+import contextlib
+
+import sqlalchemy as sa
+
+logger = logging.getLogger("questionnaire.migrations")
+
+LOCK_NAME = "questionnaire_migrations"
+LOCK_TIMEOUT = 300
+
+metadata = sa.MetaData()
+schema_version = sa.Table(
+    "schema_version", metadata,
+    sa.Column("version", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("description", sa.VARCHAR(200)),
+    sa.Column("applied_at", sa.DateTime),
+)
+
+
+def load_migrations():
+    """
+    Returns migration modules sorted by version
+    """
+    modules = [
+        importlib.import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if info.name[:1] == "v" and info.name[1:5].isdigit()
+    ]
+    modules.sort(key=lambda module: module.VERSION)
+    versions = [module.VERSION for module in modules]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return modules
+
+
+def head_version():
+    migrations = load_migrations()
+    return migrations[-1].VERSION if migrations else 0
+
+
+def describe(module):
+    return (module.__doc__ or module.__name__).strip().splitlines()[0]
+
+
+def current_version(connection):
+    """
+    Version of the database schema, 0 if it isn't managed yet. One query.
+    """
+    try:
+        return connection.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+    except (sa.exc.OperationalError, sa.exc.ProgrammingError):
+        # No schema_version table
+        connection.rollback()
+        return 0
+
+
+@contextlib.contextmanager
+def migration_lock(engine):
+    """
+    Lets one process migrate the database at a time (MariaDB/MySQL named lock, SQLite locks the file itself)
+    """
+    if engine.dialect.name not in ("mysql", "mariadb"):
+        yield
+        return
+    with engine.connect() as connection:
+        if not connection.execute(sa.text("SELECT GET_LOCK(:name, :timeout)"),
+                                  {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT}).scalar():
+            raise RuntimeError("Timed out waiting for another process to finish migrations")
+        try:
+            yield
+        finally:
+            connection.execute(sa.text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+
+def upgrade(engine, target=None, log=logger.info):
+    """
+    Applies migrations up to target (latest by default), returns the new version
+    """
+    with migration_lock(engine):
+        metadata.create_all(engine)
+        with engine.connect() as connection:
+            current = current_version(connection)
+        for module in load_migrations():
+            if module.VERSION <= current or (target is not None and module.VERSION > target):
+                continue
+            log(f"Upgrading to {module.VERSION}: {describe(module)}")
+            with engine.begin() as connection:
+                module.upgrade(connection)
+                connection.execute(schema_version.insert().values(
+                    version=module.VERSION, description=describe(module)[:200], applied_at=datetime.datetime.utcnow(),
+                ))
+            current = module.VERSION
+        return current
+
+
+def downgrade(engine, target, log=logger.info):
+    """
+    Reverts migrations above target, returns the new version
+    """
+    with migration_lock(engine):
+        with engine.connect() as connection:
+            current = current_version(connection)
+        for module in reversed(load_migrations()):
+            if module.VERSION <= target or module.VERSION > current:
+                continue
+            log(f"Downgrading {module.VERSION}: {describe(module)}")
+            with engine.begin() as connection:
+                module.downgrade(connection)
+                connection.execute(schema_version.delete().where(schema_version.c.version == module.VERSION))
+        with engine.connect() as connection:
+            return current_version(connection)
+
+
+def check_schema(engine, auto_upgrade=True):
+    """
+    Called on start: reads the schema version and upgrades the database (or only warns) if it's behind the code
+    """
+    with engine.connect() as connection:
+        current = current_version(connection)
+    head = head_version()
+    if current == head:
+        return current
+    if current > head:
+        logger.warning("Database schema version %s is newer than the code (%s)", current, head)
+        return current
+    if not auto_upgrade:
+        logger.warning("Database schema version %s is behind %s, run `python -m migrations upgrade`", current, head)
+        return current
+    return upgrade(engine)
+
+
+# DDL helpers for migrations
+
+def has_column(connection, table, column):
+    return column in {info["name"] for info in sa.inspect(connection).get_columns(table)}
+
+
+def has_index(connection, table, name):
+    return name in {info["name"] for info in sa.inspect(connection).get_indexes(table)}
+
+
+def create_index(connection, name, table, columns):
+    """
+    Creates index without blocking writes on MariaDB/MySQL (online DDL), plain CREATE INDEX elsewhere
+    """
+    if has_index(connection, table, name):
+        return
+    if connection.dialect.name in ("mysql", "mariadb"):
+        connection.execute(sa.text(
+            f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)}), ALGORITHM=INPLACE, LOCK=NONE",
+        ))
+    else:
+        connection.execute(sa.text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def drop_index(connection, name, table):
+    if not has_index(connection, table, name):
+        return
+    if connection.dialect.name in ("mysql", "mariadb"):
+        connection.execute(sa.text(f"ALTER TABLE {table} DROP INDEX {name}, ALGORITHM=INPLACE, LOCK=NONE"))
+    else:
+        connection.execute(sa.text(f"DROP INDEX {name}"))
+
+
+def replace_foreign_key(connection, table, column, referred_table, ondelete=None):
+    """
+    Recreates the foreign key of the column with the ON DELETE action on MariaDB/MySQL, in place.
+    SQLite can't alter constraints (and enforces them only with PRAGMA foreign_keys), so it's skipped there.
+    """
+    if connection.dialect.name not in ("mysql", "mariadb"):
+        return
+    for foreign_key in sa.inspect(connection).get_foreign_keys(table):
+        if foreign_key["constrained_columns"] == [column]:
+            connection.execute(sa.text(
+                f"ALTER TABLE {table} DROP FOREIGN KEY {foreign_key['name']}, ALGORITHM=INPLACE, LOCK=NONE",
+            ))
+    action = f" ON DELETE {ondelete}" if ondelete else ""
+    # Rows were checked by the old constraint; without the check the new one is added without copying the table
+    connection.execute(sa.text("SET SESSION foreign_key_checks = 0"))
+    try:
+        connection.execute(sa.text(
+            f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} FOREIGN KEY ({column}) "
+            f"REFERENCES {referred_table} (id){action}, ALGORITHM=INPLACE, LOCK=NONE",
+        ))
+    finally:
+        connection.execute(sa.text("SET SESSION foreign_key_checks = 1"))
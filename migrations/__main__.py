@@ -0,0 +1,48 @@
+# migrations/__main__.py
+"""
+Migrations CLI. Uses the database configured by environment (see db.global_init).
+
+Example:
+    python -m migrations current
+    python -m migrations upgrade
+    python -m migrations downgrade --to 1
+"""
+import os
+import argparse
+
+if os.environ.get("DOTENV", False):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from db import global_init, get_engine
+from migrations import load_migrations, current_version, head_version, describe, upgrade, downgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Database schema migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("current", help="show schema version and pending migrations")
+    upgrade_parser = commands.add_parser("upgrade", help="apply migrations")
+    upgrade_parser.add_argument("--to", type=int, default=None, help="target version (latest by default)")
+    downgrade_parser = commands.add_parser("downgrade", help="revert migrations")
+    downgrade_parser.add_argument("--to", type=int, required=True, help="target version (0 reverts everything)")
+    args = parser.parse_args()
+
+    global_init(migrate="off")
+    engine = get_engine()
+
+    if args.command == "current":
+        with engine.connect() as connection:
+            current = current_version(connection)
+        print(f"Current version: {current}, latest: {head_version()}")
+        for module in load_migrations():
+            if module.VERSION > current:
+                print(f"  pending {module.VERSION}: {describe(module)}")
+    elif args.command == "upgrade":
+        print(f"Version: {upgrade(engine, args.to, log=print)}")
+    else:
+        print(f"Version: {downgrade(engine, args.to, log=print)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# migrations/v0001_baseline.py
+"""
+Baseline schema (tables created by create_all before migrations)
+"""
+import sqlalchemy as sa
+
+VERSION = 1
+
+# Frozen copy of the models at this version, later model changes go to new migrations
+metadata = sa.MetaData()
+
+sa.Table(
+    "users", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("username", sa.VARCHAR(64), unique=True),
+    sa.Column("email", sa.VARCHAR(120), unique=True),
+    sa.Column("password_hash", sa.VARCHAR(162)),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("is_admin", sa.Boolean),
+)
+sa.Table(
+    "surveys", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("title", sa.VARCHAR(100)),
+    sa.Column("description", sa.Text),
+    sa.Column("author_id", sa.Integer, sa.ForeignKey("users.id")),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("is_active", sa.Boolean),
+    sa.Column("require_login", sa.Boolean),
+)
+sa.Table(
+    "questions", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("survey_id", sa.Integer, sa.ForeignKey("surveys.id")),
+    sa.Column("type", sa.Enum(
+        "TEXT", "WORD", "STRING", "SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE", "FILE", name="questiontype",
+    )),
+    sa.Column("text", sa.VARCHAR(500)),
+    sa.Column("is_required", sa.Boolean),
+    sa.Column("choice_limit", sa.Integer, nullable=True),
+)
+sa.Table(
+    "options", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("question_id", sa.Integer, sa.ForeignKey("questions.id")),
+    sa.Column("text", sa.VARCHAR(200)),
+)
+sa.Table(
+    "answers", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=True),
+    sa.Column("question_id", sa.Integer, sa.ForeignKey("questions.id")),
+    sa.Column("text_response", sa.Text, nullable=True),
+    sa.Column("file_path", sa.VARCHAR(300), nullable=True),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("ip_address", sa.VARCHAR(46)),
+    sa.Column("user_agent", sa.VARCHAR(200)),
+    sa.Column("browser", sa.VARCHAR(200)),
+    sa.Column("device_type", sa.VARCHAR(50)),
+    sa.Column("os", sa.VARCHAR(50)),
+    sa.Column("language", sa.VARCHAR(10)),
+    sa.Column("timezone", sa.VARCHAR(50)),
+)
+sa.Table(
+    "answer_options", metadata,
+    sa.Column("answer_id", sa.Integer, sa.ForeignKey("answers.id"), primary_key=True),
+    sa.Column("option_id", sa.Integer, sa.ForeignKey("options.id"), primary_key=True),
+)
+
+
+def upgrade(connection):
+    # Databases created by create_all already have these tables
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection)
@@ -0,0 +1,22 @@
+# migrations/v0002_survey_version.py
+"""
+Add surveys.version used in ETags.
+The column reached the model with ETags, before migrations existed: commits in between expect it on databases
+created without it, when bisecting across them add it by hand (or check out a commit with migrations and run
+python -m migrations upgrade --to 2).
+"""
+import sqlalchemy as sa
+
+from migrations import has_column
+
+VERSION = 2
+
+
+def upgrade(connection):
+    # Databases created by create_all after the column was added already have it
+    if not has_column(connection, "surveys", "version"):
+        connection.execute(sa.text("ALTER TABLE surveys ADD COLUMN version INTEGER DEFAULT 1"))
+
+
+def downgrade(connection):
+    connection.execute(sa.text("ALTER TABLE surveys DROP COLUMN version"))
@@ -0,0 +1,23 @@
+# migrations/v0003_answers_indexes.py
+"""
+Add answers indexes for repeated submission checks and stats, built online on MariaDB
+"""
+from migrations import create_index, drop_index
+
+VERSION = 3
+
+INDEXES = {
+    "ix_answers_question_user": ("question_id", "user_id"),
+    "ix_answers_question_ip": ("question_id", "ip_address"),
+    "ix_answers_question_created": ("question_id", "created_at"),
+}
+
+
+def upgrade(connection):
+    for name, columns in INDEXES.items():
+        create_index(connection, name, "answers", columns)
+
+
+def downgrade(connection):
+    for name in INDEXES:
+        drop_index(connection, name, "answers")
@@ -0,0 +1,29 @@
+# migrations/v0004_cascade_foreign_keys.py
+"""
+Add ON DELETE actions to foreign keys, so the database removes rows left by deleted parents
+"""
+from migrations import replace_foreign_key
+
+VERSION = 4
+
+# (table, column, referred table, ON DELETE action)
+FOREIGN_KEYS = [
+    ("surveys", "author_id", "users", "CASCADE"),
+    ("questions", "survey_id", "surveys", "CASCADE"),
+    ("options", "question_id", "questions", "CASCADE"),
+    ("answers", "question_id", "questions", "CASCADE"),
+    # Answers of a deleted user stay in stats of other authors' surveys
+    ("answers", "user_id", "users", "SET NULL"),
+    ("answer_options", "answer_id", "answers", "CASCADE"),
+    ("answer_options", "option_id", "options", "CASCADE"),
+]
+
+
+def upgrade(connection):
+    for table, column, referred_table, ondelete in FOREIGN_KEYS:
+        replace_foreign_key(connection, table, column, referred_table, ondelete)
+
+
+def downgrade(connection):
+    for table, column, referred_table, _ in FOREIGN_KEYS:
+        replace_foreign_key(connection, table, column, referred_table)
@@ -0,0 +1,31 @@
+# migrations/v0005_jobs.py
+"""
+Add jobs table for background operations with progress
+"""
+import sqlalchemy as sa
+
+VERSION = 5
+
+# Frozen copy of the model at this version
+metadata = sa.MetaData()
+jobs = sa.Table(
+    "jobs", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("kind", sa.VARCHAR(50)),
+    sa.Column("target_id", sa.Integer),
+    sa.Column("status", sa.VARCHAR(20)),
+    sa.Column("created_by", sa.Integer, nullable=True),
+    sa.Column("total", sa.Integer),
+    sa.Column("done", sa.Integer),
+    sa.Column("error", sa.Text, nullable=True),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("updated_at", sa.DateTime),
+)
+
+
+def upgrade(connection):
+    jobs.create(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    jobs.drop(connection, checkfirst=True)
@@ -0,0 +1,51 @@
+# migrations/v0006_answers_archive.py
+"""
+Add answers_archive and survey_snapshots tables for archived surveys
+"""
+import sqlalchemy as sa
+
+VERSION = 6
+
+# Frozen copy of the models at this version
+metadata = sa.MetaData()
+# Referenced by survey_snapshots, only its key is needed (the table isn't created here)
+sa.Table("surveys", metadata, sa.Column("id", sa.Integer, primary_key=True))
+answers_archive = sa.Table(
+    "answers_archive", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("survey_id", sa.Integer),
+    sa.Column("user_id", sa.Integer, nullable=True),
+    sa.Column("question_id", sa.Integer),
+    sa.Column("text_response", sa.Text, nullable=True),
+    sa.Column("file_path", sa.VARCHAR(300), nullable=True),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("ip_address", sa.VARCHAR(46)),
+    sa.Column("user_agent", sa.VARCHAR(200)),
+    sa.Column("browser", sa.VARCHAR(200)),
+    sa.Column("device_type", sa.VARCHAR(50)),
+    sa.Column("os", sa.VARCHAR(50)),
+    sa.Column("language", sa.VARCHAR(10)),
+    sa.Column("timezone", sa.VARCHAR(50)),
+    sa.Column("option_ids", sa.Text, nullable=True),
+    sa.Column("archived_at", sa.DateTime),
+    sa.Index("ix_answers_archive_survey", "survey_id"),
+    # InnoDB compressed pages, archived rows are written once and rarely read
+    mysql_row_format="COMPRESSED",
+)
+survey_snapshots = sa.Table(
+    "survey_snapshots", metadata,
+    sa.Column("survey_id", sa.Integer, sa.ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True),
+    sa.Column("stats", sa.Text),
+    sa.Column("answers_count", sa.Integer),
+    sa.Column("created_at", sa.DateTime),
+)
+
+
+def upgrade(connection):
+    answers_archive.create(connection, checkfirst=True)
+    survey_snapshots.create(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    survey_snapshots.drop(connection, checkfirst=True)
+    answers_archive.drop(connection, checkfirst=True)
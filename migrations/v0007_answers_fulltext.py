@@ -0,0 +1,57 @@
+# migrations/v0007_answers_fulltext.py
+"""
+Add full-text search over answers.text_response: FULLTEXT index on MariaDB, FTS5 mirror table on SQLite
+"""
+import logging
+
+import sqlalchemy as sa
+
+from migrations import has_index
+
+VERSION = 7
+
+logger = logging.getLogger("questionnaire.migrations")
+
+# Frozen copy of ORM.models.ANSWERS_FTS_DDL
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(text_response, content='answers', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_insert AFTER INSERT ON answers BEGIN "
+    "INSERT INTO answers_fts (rowid, text_response) VALUES (new.id, new.text_response); END",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_delete AFTER DELETE ON answers BEGIN "
+    "INSERT INTO answers_fts (answers_fts, rowid, text_response) VALUES ('delete', old.id, old.text_response); END",
+    "CREATE TRIGGER IF NOT EXISTS answers_fts_update AFTER UPDATE OF text_response ON answers BEGIN "
+    "INSERT INTO answers_fts (answers_fts, rowid, text_response) VALUES ('delete', old.id, old.text_response); "
+    "INSERT INTO answers_fts (rowid, text_response) VALUES (new.id, new.text_response); END",
+]
+FTS_TRIGGERS = ["answers_fts_insert", "answers_fts_delete", "answers_fts_update"]
+
+
+def upgrade(connection):
+    if connection.dialect.name in ("mysql", "mariadb"):
+        if not has_index(connection, "answers", "ft_answers_text_response"):
+            # Writes are allowed while the index is built, only DDL is blocked
+            connection.execute(sa.text(
+                "ALTER TABLE answers ADD FULLTEXT INDEX ft_answers_text_response (text_response), "
+                "ALGORITHM=INPLACE, LOCK=SHARED",
+            ))
+    elif connection.dialect.name == "sqlite":
+        try:
+            connection.execute(sa.text(FTS_DDL[0]))
+        except sa.exc.OperationalError:
+            # SQLite built without FTS5, search falls back to LIKE
+            logger.warning("SQLite has no FTS5, full-text search over answers is disabled")
+            return
+        for statement in FTS_DDL[1:]:
+            connection.execute(sa.text(statement))
+        # Index answers stored before the table existed
+        connection.execute(sa.text("INSERT INTO answers_fts (answers_fts) VALUES ('rebuild')"))
+
+
+def downgrade(connection):
+    if connection.dialect.name in ("mysql", "mariadb"):
+        if has_index(connection, "answers", "ft_answers_text_response"):
+            connection.execute(sa.text("ALTER TABLE answers DROP INDEX ft_answers_text_response"))
+    elif connection.dialect.name == "sqlite":
+        for trigger in FTS_TRIGGERS:
+            connection.execute(sa.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(sa.text("DROP TABLE IF EXISTS answers_fts"))
@@ -0,0 +1,15 @@
+# migrations/v0008_answers_keyset_index.py
+"""
+Add answers (question_id, id) index for keyset pagination of responses on the stats page, built online on MariaDB
+"""
+from migrations import create_index, drop_index
+
+VERSION = 8
+
+
+def upgrade(connection):
+    create_index(connection, "ix_answers_question_id", "answers", ("question_id", "id"))
+
+
+def downgrade(connection):
+    drop_index(connection, "ix_answers_question_id", "answers")
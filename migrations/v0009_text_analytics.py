@@ -0,0 +1,179 @@
+# migrations/v0009_text_analytics.py
+"""
+Add tables of incremental text analytics and summarize existing answers to text questions
+"""
+import re
+import bisect
+import hashlib
+from collections import Counter
+
+import sqlalchemy as sa
+
+VERSION = 9
+
+# Frozen copy of text_analytics at this version
+TEXT_TYPES = ("TEXT", "WORD", "STRING")
+TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my no not of on or so that the this to was we "
+    "were with you your".split(),
+)
+MAX_TERM = 64
+LENGTH_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000)
+TOP_TERMS_CAPACITY = 100
+BATCH_SIZE = 5000
+
+# Frozen copy of the models at this version
+metadata = sa.MetaData()
+# Referenced by the analytics tables, only the columns used here are needed (the tables aren't created here)
+questions = sa.Table(
+    "questions", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("type", sa.Enum(
+        "TEXT", "WORD", "STRING", "SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE", "FILE", name="questiontype",
+    )),
+)
+answers = sa.Table(
+    "answers", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("question_id", sa.Integer),
+    sa.Column("text_response", sa.Text, nullable=True),
+)
+
+
+def _question_id():
+    return sa.Column("question_id", sa.Integer, sa.ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+
+
+TABLES = [
+    text_stats := sa.Table(
+        "text_stats", metadata, _question_id(),
+        sa.Column("responses", sa.Integer),
+        sa.Column("total_length", sa.BigInteger),
+        sa.Column("tokens", sa.BigInteger),
+        sa.Column("distinct_responses", sa.Integer),
+    ),
+    text_length_buckets := sa.Table(
+        "text_length_buckets", metadata, _question_id(),
+        sa.Column("bucket", sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column("count", sa.Integer),
+    ),
+    text_terms := sa.Table(
+        "text_terms", metadata, _question_id(),
+        sa.Column("term", sa.VARCHAR(64), primary_key=True),
+        sa.Column("count", sa.Integer),
+        sa.Column("error", sa.Integer),
+    ),
+    text_response_hashes := sa.Table(
+        "text_response_hashes", metadata, _question_id(),
+        sa.Column("digest", sa.BigInteger, primary_key=True, autoincrement=False),
+        sa.Column("count", sa.Integer),
+    ),
+]
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def _space_saving(counters, terms):
+    for term, count in terms.most_common():
+        if term in counters:
+            counters[term] = (counters[term][0] + count, counters[term][1])
+        elif len(counters) < TOP_TERMS_CAPACITY:
+            counters[term] = (count, 0)
+        else:
+            evicted = min(counters, key=lambda key: counters[key][0])
+            floor = counters.pop(evicted)[0]
+            counters[term] = (floor + count, floor)
+    return counters
+
+
+def _summarize(connection, question_id):
+    """
+    Summarizes answers of the question in batches like `text_analytics.py rebuild`. Digests are written with every
+    batch, so memory doesn't grow with the number of answers.
+    """
+    responses = total_length = tokens = distinct = 0
+    buckets = Counter()
+    counters = {}
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(answers.c.id, answers.c.text_response)
+            .where(answers.c.question_id == question_id, answers.c.text_response.isnot(None), answers.c.id > after)
+            .order_by(answers.c.id)
+            .limit(BATCH_SIZE),
+        ).all()
+        if not rows:
+            break
+        after = rows[-1][0]
+        terms = Counter()
+        digests = Counter()
+        for _, text in rows:
+            if not text.strip():
+                continue
+            words = TOKEN.findall(text.lower())
+            responses += 1
+            total_length += len(text)
+            tokens += len(words)
+            buckets[bisect.bisect_right(LENGTH_BUCKETS, len(text)) - 1] += 1
+            terms.update(word for word in words if word not in STOPWORDS and len(word) <= MAX_TERM)
+            digests[_digest(text)] += 1
+        counters = _space_saving(counters, terms)
+        if not digests:
+            continue
+
+        stored = dict(connection.execute(
+            sa.select(text_response_hashes.c.digest, text_response_hashes.c.count)
+            .where(text_response_hashes.c.question_id == question_id, text_response_hashes.c.digest.in_(digests)),
+        ).all())
+        added = [
+            {"question_id": question_id, "digest": value, "count": count}
+            for value, count in digests.items() if value not in stored
+        ]
+        if added:
+            connection.execute(sa.insert(text_response_hashes), added)
+            distinct += len(added)
+        changed = [{"b_digest": value, "b_count": stored[value] + count} for value, count in digests.items()
+                   if value in stored]
+        if changed:
+            connection.execute(
+                sa.update(text_response_hashes)
+                .where(text_response_hashes.c.question_id == question_id,
+                       text_response_hashes.c.digest == sa.bindparam("b_digest"))
+                .values(count=sa.bindparam("b_count")),
+                changed,
+            )
+
+    if not responses:
+        return
+    connection.execute(sa.insert(text_stats).values(
+        question_id=question_id, responses=responses, total_length=total_length, tokens=tokens,
+        distinct_responses=distinct,
+    ))
+    connection.execute(sa.insert(text_length_buckets), [
+        {"question_id": question_id, "bucket": bucket, "count": count} for bucket, count in buckets.items()
+    ])
+    if counters:
+        connection.execute(sa.insert(text_terms), [
+            {"question_id": question_id, "term": term, "count": count, "error": error}
+            for term, (count, error) in counters.items()
+        ])
+
+
+def upgrade(connection):
+    # Tables created by create_all are kept up to date by the application
+    if sa.inspect(connection).has_table("text_stats"):
+        return
+    for table in TABLES:
+        table.create(connection)
+    for question_id in connection.execute(
+        sa.select(questions.c.id).where(questions.c.type.in_(TEXT_TYPES)).order_by(questions.c.id),
+    ).scalars().all():
+        _summarize(connection, question_id)
+
+
+def downgrade(connection):
+    for table in reversed(TABLES):
+        table.drop(connection, checkfirst=True)
@@ -0,0 +1,98 @@
+# migrations/v0010_respondent_sketches.py
+"""
+Add respondent_sketches table of HyperLogLog sketches and sketch respondents of existing answers
+"""
+import zlib
+import hashlib
+import datetime
+
+import sqlalchemy as sa
+
+VERSION = 10
+
+# Frozen copy of sketches at this version
+PRECISION = 12
+SEGMENTS = ("browser", "os", "device_type", "language")
+BATCH_SIZE = 5000
+
+# Frozen copy of the models at this version
+metadata = sa.MetaData()
+# Referenced by respondent_sketches, only the columns used here are needed (the tables aren't created here)
+sa.Table("surveys", metadata, sa.Column("id", sa.Integer, primary_key=True))
+questions = sa.Table(
+    "questions", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("survey_id", sa.Integer),
+)
+answers = sa.Table(
+    "answers", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("question_id", sa.Integer),
+    sa.Column("created_at", sa.DateTime),
+    sa.Column("ip_address", sa.VARCHAR(46)),
+    *[sa.Column(segment, sa.VARCHAR(200)) for segment in SEGMENTS],
+)
+respondent_sketches = sa.Table(
+    "respondent_sketches", metadata,
+    sa.Column("survey_id", sa.Integer, sa.ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True),
+    sa.Column("kind", sa.VARCHAR(20), primary_key=True),
+    sa.Column("key", sa.VARCHAR(200), primary_key=True),
+    sa.Column("registers", sa.LargeBinary),
+)
+
+
+def _add(registers, value):
+    hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+    index = hashed >> (64 - PRECISION)
+    rest = hashed & ((1 << (64 - PRECISION)) - 1)
+    rank = 64 - PRECISION - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def _sketch(connection, survey_id):
+    """
+    Sketches answers of the survey in batches like `sketches.py rebuild`
+    """
+    question_ids = sa.select(questions.c.id).where(questions.c.survey_id == survey_id).scalar_subquery()
+    sketches = {}
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(answers)
+            .where(answers.c.question_id.in_(question_ids), answers.c.id > after)
+            .order_by(answers.c.id)
+            .limit(BATCH_SIZE),
+        ).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        for row in rows:
+            if not row["ip_address"]:
+                continue
+            created_at = row["created_at"] or datetime.datetime.utcnow()
+            keys = [("survey", ""), ("question", str(row["question_id"])), ("day", created_at.date().isoformat())]
+            keys.extend((segment, row[segment][:200]) for segment in SEGMENTS if row[segment])
+            for key in keys:
+                _add(sketches.setdefault(key, bytearray(1 << PRECISION)), row["ip_address"])
+    if sketches:
+        # Precision byte and compressed registers, like HyperLogLog.to_bytes
+        connection.execute(sa.insert(respondent_sketches), [
+            {"survey_id": survey_id, "kind": kind, "key": key, "registers": bytes([PRECISION]) + zlib.compress(value)}
+            for (kind, key), value in sorted(sketches.items())
+        ])
+
+
+def upgrade(connection):
+    # A table created by create_all is kept up to date by the application
+    if sa.inspect(connection).has_table("respondent_sketches"):
+        return
+    respondent_sketches.create(connection)
+    for survey_id in connection.execute(
+        sa.select(questions.c.survey_id).where(questions.c.survey_id.isnot(None)).distinct().order_by(questions.c.survey_id),
+    ).scalars().all():
+        _sketch(connection, survey_id)
+
+
+def downgrade(connection):
+    respondent_sketches.drop(connection, checkfirst=True)
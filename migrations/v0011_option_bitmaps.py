@@ -0,0 +1,211 @@
+# migrations/v0011_option_bitmaps.py
+"""
+Add respondents and option_bitmaps tables, number respondents and index picked options of existing answers
+"""
+import struct
+import datetime
+
+import sqlalchemy as sa
+
+VERSION = 11
+
+# Frozen copy of bitmaps at this version, in pure Python
+CHOICE_TYPES = ("SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE")
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+ARRAY, RUNS, BITSET = 0, 1, 2
+BATCH_SIZE = 5000
+
+# Frozen copy of the models at this version, only the columns used here
+metadata = sa.MetaData()
+surveys = sa.Table("surveys", metadata, sa.Column("id", sa.Integer, primary_key=True))
+questions = sa.Table(
+    "questions", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("survey_id", sa.Integer),
+    sa.Column("type", sa.Enum(
+        "TEXT", "WORD", "STRING", "SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE", "FILE", name="questiontype",
+    )),
+)
+options = sa.Table(
+    "options", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("question_id", sa.Integer),
+    sa.Column("text", sa.VARCHAR(200)),
+)
+
+
+def _answer_columns():
+    return [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, nullable=True),
+        sa.Column("question_id", sa.Integer),
+        sa.Column("text_response", sa.Text, nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("ip_address", sa.VARCHAR(46)),
+    ]
+
+
+answers = sa.Table("answers", metadata, *_answer_columns())
+answers_archive = sa.Table(
+    "answers_archive", metadata,
+    *_answer_columns(),
+    sa.Column("survey_id", sa.Integer),
+    sa.Column("option_ids", sa.Text, nullable=True),
+)
+answer_options = sa.Table(
+    "answer_options", metadata,
+    sa.Column("answer_id", sa.Integer, primary_key=True),
+    sa.Column("option_id", sa.Integer, primary_key=True),
+)
+survey_snapshots = sa.Table("survey_snapshots", metadata, sa.Column("survey_id", sa.Integer, primary_key=True))
+respondents = sa.Table(
+    "respondents", metadata,
+    sa.Column("survey_id", sa.Integer, sa.ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True),
+    sa.Column("ordinal", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("key", sa.VARCHAR(60)),
+    sa.Column("user_id", sa.Integer, nullable=True),
+    sa.Column("ip_address", sa.VARCHAR(46)),
+    sa.Column("created_at", sa.DateTime),
+    sa.Index("ix_respondents_survey_key", "survey_id", "key", unique=True),
+)
+option_bitmaps = sa.Table(
+    "option_bitmaps", metadata,
+    sa.Column("option_id", sa.Integer, sa.ForeignKey("options.id", ondelete="CASCADE"), primary_key=True),
+    sa.Column("chunk", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("container", sa.LargeBinary),
+)
+
+
+def _container(bitset):
+    """
+    Smallest container of a chunk like bitmaps.encode: sorted uint16 values, runs (start, length - 1) or the bitset
+    """
+    values = [
+        index << 3 | bit for index, byte in enumerate(bitset) if byte for bit in range(8) if byte >> bit & 1
+    ]
+    runs = []
+    for value in values:
+        if runs and runs[-1][0] + runs[-1][1] + 1 == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 0])
+    return min(
+        (ARRAY, struct.pack(f"<{len(values)}H", *values)),
+        (RUNS, struct.pack(f"<{len(runs) * 2}H", *(number for run in runs for number in run))),
+        (BITSET, bytes(bitset)),
+        key=lambda container: len(container[1]),
+    )
+
+
+def _index(connection, survey_id):
+    """
+    Numbers respondents of the survey in order of their first answer and sets bits of the options they picked,
+    like `bitmaps.py rebuild`. Choice answers of this version copy the option text, some have answer_options rows.
+    """
+    archived = connection.execute(
+        sa.select(survey_snapshots.c.survey_id).where(survey_snapshots.c.survey_id == survey_id),
+    ).first() is not None
+    source = answers_archive if archived else answers
+    question_ids = sa.select(questions.c.id).where(questions.c.survey_id == survey_id).scalar_subquery()
+    # {question_id: {option text: option id}}, the first option wins if texts repeat
+    texts = {}
+    for option_id, question_id, text in connection.execute(
+        sa.select(options.c.id, options.c.question_id, options.c.text)
+        .join(questions, questions.c.id == options.c.question_id)
+        .where(questions.c.survey_id == survey_id, questions.c.type.in_(CHOICE_TYPES))
+        .order_by(options.c.id.desc()),
+    ):
+        texts.setdefault(question_id, {})[text] = option_id
+
+    columns = [source.c.id, source.c.user_id, source.c.question_id, source.c.text_response, source.c.created_at,
+               source.c.ip_address] + ([source.c.option_ids] if archived else [])
+    ordinals = 0
+    bitsets = {}
+    after = 0
+    while True:
+        rows = connection.execute(
+            sa.select(*columns)
+            .where(source.c.question_id.in_(question_ids), source.c.id > after)
+            .order_by(source.c.id)
+            .limit(BATCH_SIZE),
+        ).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        picked = {}
+        if archived:
+            for row in rows:
+                if row["option_ids"]:
+                    picked[row["id"]] = [int(option_id) for option_id in row["option_ids"].split(",")]
+        else:
+            for answer_id, option_id in connection.execute(
+                sa.select(answer_options.c.answer_id, answer_options.c.option_id)
+                .where(answer_options.c.answer_id.in_([row["id"] for row in rows])),
+            ):
+                picked.setdefault(answer_id, []).append(option_id)
+
+        # Respondents are told apart like submissions.dedup_key
+        keys = {}
+        for row in rows:
+            if row["user_id"] is not None:
+                keys.setdefault(f"user:{row['user_id']}", row)
+            elif row["ip_address"]:
+                keys.setdefault(f"ip:{row['ip_address']}", row)
+        numbered = dict(connection.execute(
+            sa.select(respondents.c.key, respondents.c.ordinal)
+            .where(respondents.c.survey_id == survey_id, respondents.c.key.in_(keys)),
+        ).all())
+        added = []
+        for key, row in keys.items():
+            if key not in numbered:
+                numbered[key] = ordinals
+                added.append({
+                    "survey_id": survey_id, "ordinal": ordinals, "key": key, "user_id": row["user_id"],
+                    "ip_address": row["ip_address"], "created_at": row["created_at"] or datetime.datetime.utcnow(),
+                })
+                ordinals += 1
+        if added:
+            connection.execute(sa.insert(respondents), added)
+
+        for row in rows:
+            key = f"user:{row['user_id']}" if row["user_id"] is not None else f"ip:{row['ip_address']}"
+            if key not in numbered:
+                continue
+            option_ids = list(picked.get(row["id"], []))
+            if row["text_response"] in texts.get(row["question_id"], {}):
+                option_ids.append(texts[row["question_id"]][row["text_response"]])
+            ordinal = numbered[key]
+            for option_id in option_ids:
+                bitset = bitsets.setdefault((option_id, ordinal >> CHUNK_BITS), bytearray(CHUNK_SIZE >> 3))
+                bitset[(ordinal & (CHUNK_SIZE - 1)) >> 3] |= 1 << (ordinal & 7)
+
+    # answer_options rows of deleted options may be left where foreign keys aren't enforced
+    existing = set(connection.execute(
+        sa.select(options.c.id).where(options.c.id.in_({option_id for option_id, _ in bitsets})),
+    ).scalars())
+    rows = []
+    for (option_id, chunk), bitset in sorted(bitsets.items()):
+        if option_id in existing:
+            kind, data = _container(bitset)
+            rows.append({"option_id": option_id, "chunk": chunk, "container": bytes([kind]) + data})
+        if len(rows) >= BATCH_SIZE:
+            connection.execute(sa.insert(option_bitmaps), rows)
+            rows = []
+    if rows:
+        connection.execute(sa.insert(option_bitmaps), rows)
+
+
+def upgrade(connection):
+    # Tables created by create_all are kept up to date by the application
+    if sa.inspect(connection).has_table("respondents"):
+        return
+    respondents.create(connection)
+    option_bitmaps.create(connection)
+    for survey_id in connection.execute(sa.select(surveys.c.id).order_by(surveys.c.id)).scalars().all():
+        _index(connection, survey_id)
+
+
+def downgrade(connection):
+    option_bitmaps.drop(connection, checkfirst=True)
+    respondents.drop(connection, checkfirst=True)
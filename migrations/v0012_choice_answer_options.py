@@ -0,0 +1,195 @@
+# migrations/v0012_choice_answer_options.py
+"""
+Store choice answers as answer_options rows: one answer per question and submission instead of a copy of each option text
+"""
+import itertools
+
+import sqlalchemy as sa
+
+VERSION = 12
+
+CHOICE_TYPES = ("SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE")
+BATCH_SIZE = 5000
+
+# Frozen copy of the models at this version, only the columns used here
+metadata = sa.MetaData()
+questions = sa.Table(
+    "questions", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("type", sa.Enum(
+        "TEXT", "WORD", "STRING", "SINGLE_CHOICE", "MULTIPLE_CHOICE", "LIMITED_CHOICE", "FILE", name="questiontype",
+    )),
+)
+options = sa.Table(
+    "options", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("question_id", sa.Integer),
+    sa.Column("text", sa.VARCHAR(200)),
+)
+
+
+def _answer_columns():
+    return [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, nullable=True),
+        sa.Column("question_id", sa.Integer),
+        sa.Column("text_response", sa.Text, nullable=True),
+        sa.Column("file_path", sa.VARCHAR(300), nullable=True),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("ip_address", sa.VARCHAR(46)),
+        sa.Column("user_agent", sa.VARCHAR(200)),
+        sa.Column("browser", sa.VARCHAR(200)),
+        sa.Column("device_type", sa.VARCHAR(50)),
+        sa.Column("os", sa.VARCHAR(50)),
+        sa.Column("language", sa.VARCHAR(10)),
+        sa.Column("timezone", sa.VARCHAR(50)),
+    ]
+
+
+answers = sa.Table("answers", metadata, *_answer_columns())
+answers_archive = sa.Table(
+    "answers_archive", metadata,
+    *_answer_columns(),
+    sa.Column("survey_id", sa.Integer),
+    sa.Column("option_ids", sa.Text, nullable=True),
+)
+answer_options = sa.Table(
+    "answer_options", metadata,
+    sa.Column("answer_id", sa.Integer, primary_key=True),
+    sa.Column("option_id", sa.Integer, primary_key=True),
+)
+
+
+def _choice_questions(connection):
+    """
+    {question_id: {option text: option id}}, the first option wins if texts repeat
+    """
+    result = {}
+    for question_id, option_id, text in connection.execute(
+        sa.select(questions.c.id, options.c.id, options.c.text)
+        .join(options, options.c.question_id == questions.c.id)
+        .where(questions.c.type.in_(CHOICE_TYPES))
+        .order_by(questions.c.id, options.c.id.desc()),
+    ):
+        result.setdefault(question_id, {})[text] = option_id
+    return result
+
+
+def _submissions(connection, table, question_id):
+    """
+    Yields answers of the question grouped by submission: rows of one submission were inserted together, so they are
+    consecutive by id and share user, IP address and time
+    """
+    after = 0
+    held = []
+    while True:
+        rows = connection.execute(
+            sa.select(table)
+            .where(table.c.question_id == question_id, table.c.id > after)
+            .order_by(table.c.id)
+            .limit(BATCH_SIZE),
+        ).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        groups = [
+            list(group) for _, group in itertools.groupby(
+                held + list(rows), key=lambda row: (row["user_id"], row["ip_address"], row["created_at"]),
+            )
+        ]
+        # The last submission may continue in the next batch
+        held = groups.pop()
+        yield from groups
+    if held:
+        yield held
+
+
+def _copies(rows, option_ids):
+    """
+    Answers of a submission to merge: ones copying an option text or already without text.
+    Texts of deleted options are left alone. None if there's nothing to merge.
+    """
+    rows = [row for row in rows if row["text_response"] is None or row["text_response"] in option_ids]
+    if len(rows) <= 1 and all(row["text_response"] is None for row in rows):
+        return None
+    return rows
+
+
+def _picked(rows, option_ids, existing):
+    return list(dict.fromkeys(existing + [
+        option_ids[row["text_response"]] for row in rows if row["text_response"] is not None
+    ]))
+
+
+def upgrade(connection):
+    for question_id, option_ids in _choice_questions(connection).items():
+        for rows in _submissions(connection, answers, question_id):
+            rows = _copies(rows, option_ids)
+            if rows is None:
+                continue
+            ids = [row["id"] for row in rows]
+            existing = connection.execute(
+                sa.select(answer_options.c.option_id)
+                .where(answer_options.c.answer_id.in_(ids))
+                .order_by(answer_options.c.answer_id, answer_options.c.option_id),
+            ).scalars().all()
+            picked = _picked(rows, option_ids, existing)
+            # The first answer is kept with all options, the others go
+            connection.execute(sa.delete(answer_options).where(answer_options.c.answer_id.in_(ids)))
+            connection.execute(sa.delete(answers).where(answers.c.id.in_(ids[1:])))
+            connection.execute(sa.update(answers).where(answers.c.id == ids[0]).values(text_response=None))
+            if picked:
+                connection.execute(
+                    sa.insert(answer_options), [{"answer_id": ids[0], "option_id": option_id} for option_id in picked],
+                )
+
+        for rows in _submissions(connection, answers_archive, question_id):
+            rows = _copies(rows, option_ids)
+            if rows is None:
+                continue
+            ids = [row["id"] for row in rows]
+            existing = [
+                int(option_id) for row in rows if row["option_ids"] for option_id in row["option_ids"].split(",")
+            ]
+            picked = _picked(rows, option_ids, existing)
+            connection.execute(sa.delete(answers_archive).where(answers_archive.c.id.in_(ids[1:])))
+            connection.execute(sa.update(answers_archive).where(answers_archive.c.id == ids[0]).values(
+                text_response=None, option_ids=",".join(map(str, picked)) or None,
+            ))
+
+
+def downgrade(connection):
+    # Choice answers copy option texts again, one answer per option. Archived ones keep only the first option
+    # as text, their ids come from the answers table and can't be made up.
+    for question_id in _choice_questions(connection):
+        texts = dict(connection.execute(
+            sa.select(options.c.id, options.c.text).where(options.c.question_id == question_id),
+        ).all())
+        for rows in _submissions(connection, answers, question_id):
+            for row in rows:
+                picked = connection.execute(
+                    sa.select(answer_options.c.option_id)
+                    .where(answer_options.c.answer_id == row["id"])
+                    .order_by(answer_options.c.option_id),
+                ).scalars().all()
+                picked = [option_id for option_id in picked if option_id in texts]
+                if not picked or row["text_response"] is not None:
+                    continue
+                connection.execute(
+                    sa.update(answers).where(answers.c.id == row["id"]).values(text_response=texts[picked[0]]),
+                )
+                copies = [
+                    {**{key: value for key, value in row.items() if key != "id"}, "text_response": texts[option_id]}
+                    for option_id in picked[1:]
+                ]
+                if copies:
+                    connection.execute(sa.insert(answers), copies)
+
+        for rows in _submissions(connection, answers_archive, question_id):
+            for row in rows:
+                if row["option_ids"] and row["text_response"] is None:
+                    first = int(row["option_ids"].split(",")[0])
+                    connection.execute(
+                        sa.update(answers_archive).where(answers_archive.c.id == row["id"])
+                        .values(text_response=texts.get(first)),
+                    )
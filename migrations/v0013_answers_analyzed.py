@@ -0,0 +1,29 @@
+# migrations/v0013_answers_analyzed.py
+"""
+Add answers.analyzed, analytics are updated by a consumer instead of the request; existing answers count as analyzed
+"""
+import sqlalchemy as sa
+
+from migrations import has_column, create_index, drop_index
+
+VERSION = 13
+
+
+def upgrade(connection):
+    # Databases created by create_all after the column was added already have it
+    if not has_column(connection, "answers", "analyzed"):
+        if connection.dialect.name in ("mysql", "mariadb"):
+            # Instant ADD COLUMN: existing rows read the default of the moment they were added, without a rewrite
+            connection.execute(sa.text(
+                "ALTER TABLE answers ADD COLUMN analyzed BOOLEAN NOT NULL DEFAULT TRUE, ALGORITHM=INSTANT",
+            ))
+            connection.execute(sa.text("ALTER TABLE answers ALTER COLUMN analyzed SET DEFAULT FALSE"))
+        else:
+            connection.execute(sa.text("ALTER TABLE answers ADD COLUMN analyzed BOOLEAN NOT NULL DEFAULT 0"))
+            connection.execute(sa.text("UPDATE answers SET analyzed = 1"))
+    create_index(connection, "ix_answers_analyzed", "answers", ("analyzed", "id"))
+
+
+def downgrade(connection):
+    drop_index(connection, "ix_answers_analyzed", "answers")
+    connection.execute(sa.text("ALTER TABLE answers DROP COLUMN analyzed"))
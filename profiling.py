@@ -0,0 +1,114 @@
+# profiling.py
+"""
+On-demand request profiling module.
+A request is run under cProfile when an admin asks for it ("X-Profile: 1" header or "?_profile=1")
+or when it's sampled (1 of PROFILE_SAMPLE_RATE requests). Profiles are saved as .pstats files into PROFILE_DIR,
+open them with `python -m pstats <file>` or snakeviz.
+"""
+import os
+import random
+import cProfile
+import datetime
+
+from flask import g, request, current_app
+from flask_login import current_user
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+
+PROFILE_EXTENSION = ".pstats"
+
+
+def _is_admin():
+    if current_user.is_authenticated and current_user.is_admin:
+        return True
+    try:
+        verify_jwt_in_request(optional=True)
+        return bool(get_jwt().get("is_admin"))
+    except Exception:
+        return False
+
+
+def _requested():
+    return request.headers.get("X-Profile") == "1" or request.args.get("_profile") == "1"
+
+
+def _start_profiling():
+    sample_rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    sampled = sample_rate > 0 and random.randrange(sample_rate) == 0
+    if not sampled and not (_requested() and _is_admin()):
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this thread
+        return
+    g._profiler = profiler
+
+
+def _finish_profiling(response):
+    profiler = g.pop("_profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+
+    profile_dir = current_app.config["PROFILE_DIR"]
+    os.makedirs(profile_dir, exist_ok=True)
+    name = "{}-{}-{}{}".format(
+        datetime.datetime.now().strftime("%Y%m%dT%H%M%S.%f"),
+        (request.endpoint or "unknown").replace(".", "_"),
+        os.getpid(),
+        PROFILE_EXTENSION,
+    )
+    profiler.dump_stats(os.path.join(profile_dir, name))
+    response.headers["X-Profile"] = name
+    return response
+
+
+def _stop_profiling(exception=None):
+    # after_request isn't called when the handler fails
+    profiler = g.pop("_profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def list_profiles(limit=50):
+    """
+    Returns recent profiles, newest first
+    """
+    profile_dir = current_app.config["PROFILE_DIR"]
+    if not os.path.isdir(profile_dir):
+        return []
+
+    profiles = []
+    for entry in os.scandir(profile_dir):
+        if not entry.name.endswith(PROFILE_EXTENSION):
+            continue
+        try:
+            created_at, endpoint, _ = entry.name[:-len(PROFILE_EXTENSION)].split("-", 2)
+            created_at = datetime.datetime.strptime(created_at, "%Y%m%dT%H%M%S.%f")
+        except ValueError:
+            # Not written by this module
+            continue
+        profiles.append({
+            "name": entry.name,
+            "endpoint": endpoint,
+            "size": entry.stat().st_size,
+            "created_at": created_at.isoformat(),
+        })
+    profiles.sort(key=lambda profile: profile["name"], reverse=True)
+    return profiles[:limit]
+
+
+def init_app(app):
+    """
+    Registers profiling hooks. Configuration:
+    PROFILE_DIR - where to save profiles (env PROFILE_DIR)
+    PROFILE_SAMPLE_RATE - profile 1 of N requests, 0 disables sampling (env PROFILE_SAMPLE_RATE)
+    """
+    app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR", "/tmp/questionnaire_profiles"))
+    app.config.setdefault("PROFILE_SAMPLE_RATE", int(os.environ.get("PROFILE_SAMPLE_RATE", 0)))
+
+    app.before_request(_start_profiling)
+    app.after_request(_finish_profiling)
+    app.teardown_request(_stop_profiling)
@@ -0,0 +1,284 @@
+# ratelimit.py
+"""
+Admission control module.
+Token bucket rate limits per client IP, user and survey for unsafe requests (logins, registrations,
+survey submissions, API writes) answered with 429, and a concurrency limiter shedding requests with 503
+when too many are in flight and the queue is full. Both set Retry-After.
+Buckets are kept in process memory or in Redis (RATELIMIT_STORAGE_URL=redis://...) shared by all workers.
+"""
+import os
+import math
+import time
+import threading
+
+from flask import request, current_app, jsonify, make_response
+from flask_login import current_user
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+import metrics
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - depends on environment
+    redis = None
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Limits per blueprint or endpoint (endpoint entries override scopes of their blueprint): {scope: "N/period"}
+RATELIMITS = {
+    "api": {"user": "120/minute", "ip": "300/minute"},
+    "api.login": {"user": "5/minute", "ip": "10/minute"},
+    "auth.login": {"user": "5/minute", "ip": "10/minute"},
+    "auth.register": {"ip": "5/minute"},
+    "survey.take_survey": {"user": "10/minute", "ip": "10/minute", "survey": "600/minute"},
+}
+# Narrow scopes are checked first: a client over its own limit must not use up tokens of a bucket shared with others
+SCOPE_ORDER = ("user", "ip", "survey")
+LIMITED_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Never shed: monitoring must work when the app is overloaded
+EXEMPT_ENDPOINTS = {"metrics.metrics", "static"}
+
+
+def parse_limit(value):
+    """
+    Parses "10/minute" into (capacity, refill rate per second)
+    """
+    count, _, period = value.partition("/")
+    count = int(count)
+    if period not in PERIODS or count <= 0:
+        raise ValueError(f"Invalid rate limit: {value}")
+    return count, count / PERIODS[period]
+
+
+class MemoryBackend:
+    """
+    Buckets in process memory, every worker has its own
+    """
+    # Full buckets are dropped when there are more keys
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now=None):
+        """
+        Takes a token, returns 0 or seconds until one is available
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        # Buckets can't refill above capacity, so forgetting a long untouched one changes nothing.
+        # Rate isn't stored, the longest period is assumed
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > PERIODS["day"]]
+        for key in stale or list(self._buckets)[:len(self._buckets) // 2]:
+            del self._buckets[key]
+
+
+class RedisBackend:
+    """
+    Buckets in Redis hashes, updated atomically by a Lua script
+    """
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("redis package is required for RATELIMIT_STORAGE_URL=" + url)
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        return float(self._script(keys=[key], args=[capacity, rate, now]))
+
+
+def create_backend(url):
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported RATELIMIT_STORAGE_URL: {url}")
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` requests run at once, up to `queue` more wait `timeout` seconds for a slot.
+    Counts requests of one process, see init_app for how the global limit is divided between workers.
+    """
+    def __init__(self, limit, queue=0, timeout=0):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue:
+                    return False
+                self.waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self.active < self.limit, self.timeout):
+                        return False
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+def _user_key():
+    if current_user.is_authenticated:
+        return f"id:{current_user.id}"
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    if identity is not None:
+        return f"id:{identity}"
+    # Login attempts are counted per account
+    username = request.form.get("username") or (request.get_json(silent=True) or {}).get("username")
+    return f"name:{username}" if isinstance(username, str) and username else None
+
+
+def _scope_key(scope):
+    if scope == "ip":
+        return request.remote_addr
+    if scope == "user":
+        return _user_key()
+    if scope == "survey":
+        view_args = request.view_args or {}
+        survey_id = view_args.get("survey_id", view_args.get("id"))
+        return None if survey_id is None else str(survey_id)
+    raise ValueError(f"Unknown rate limit scope: {scope}")
+
+
+def _limits():
+    """
+    Yields (config name, scope, limit) applying to the current request, narrowest scope first
+    """
+    config = current_app.config["RATELIMITS"]
+    limits = {}
+    for name in (request.blueprint, request.endpoint):
+        for scope, limit in (config.get(name) or {}).items():
+            limits[scope] = (name, limit)
+    for scope in SCOPE_ORDER:
+        if scope in limits:
+            name, limit = limits.pop(scope)
+            yield name, scope, limit
+    for scope in limits:
+        raise ValueError(f"Unknown rate limit scope: {scope}")
+
+
+def _reject(status, message, retry_after):
+    if request.blueprint == "api":
+        response = make_response(jsonify({"msg": message}), status)
+    else:
+        response = make_response(message, status)
+        response.mimetype = "text/plain"
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _check_rate_limits():
+    if not current_app.config["RATELIMIT_ENABLED"] or request.method not in LIMITED_METHODS:
+        return None
+
+    backend = current_app.extensions["ratelimit"]
+    for name, scope, limit in _limits():
+        key = _scope_key(scope)
+        if key is None:
+            continue
+        capacity, rate = parse_limit(limit)
+        retry_after = backend.consume(f"ratelimit:{name}:{scope}:{key}", capacity, rate)
+        if retry_after:
+            # Rejected requests don't take tokens of the wider scopes
+            metrics.REJECTED_REQUESTS.labels(reason=f"ratelimit_{scope}").inc()
+            return _reject(429, "Too many requests", retry_after)
+    return None
+
+
+def _admit():
+    limiter = current_app.extensions.get("concurrency_limiter")
+    if limiter is not None and request.endpoint not in EXEMPT_ENDPOINTS:
+        if not limiter.acquire():
+            metrics.REJECTED_REQUESTS.labels(reason="overload").inc()
+            return _reject(503, "Service is overloaded, try again later", current_app.config["OVERLOAD_RETRY_AFTER"])
+        request.environ["questionnaire.admitted"] = True
+    return _check_rate_limits()
+
+
+def _release(exception=None):
+    if request.environ.pop("questionnaire.admitted", False):
+        current_app.extensions["concurrency_limiter"].release()
+
+
+def init_app(app):
+    """
+    Registers admission control hooks. Configuration:
+    RATELIMIT_ENABLED - apply rate limits (env RATELIMIT_ENABLED, default on)
+    RATELIMIT_STORAGE_URL - memory:// or redis://host:port/db (env RATELIMIT_STORAGE_URL)
+    RATELIMITS - limits per blueprint or endpoint, see RATELIMITS
+    MAX_CONCURRENT_REQUESTS - in flight requests of all workers, 0 disables shedding (env MAX_CONCURRENT_REQUESTS)
+    MAX_QUEUED_REQUESTS - requests of all workers waiting for a slot, others get 503 at once (env MAX_QUEUED_REQUESTS)
+    WORKERS - number of worker processes, both limits are divided by it (rounded up) and enforced by every process
+        on its own, so a busy worker can shed while another has free slots (env WEB_CONCURRENCY, as gunicorn)
+    QUEUE_TIMEOUT - seconds a request waits for a slot (env QUEUE_TIMEOUT)
+    OVERLOAD_RETRY_AFTER - Retry-After of 503 responses, seconds (env OVERLOAD_RETRY_AFTER)
+    """
+    app.config.setdefault("RATELIMIT_ENABLED", os.environ.get("RATELIMIT_ENABLED", "1") == "1")
+    app.config.setdefault("RATELIMIT_STORAGE_URL", os.environ.get("RATELIMIT_STORAGE_URL", "memory://"))
+    app.config.setdefault("RATELIMITS", RATELIMITS)
+    app.config.setdefault("MAX_CONCURRENT_REQUESTS", int(os.environ.get("MAX_CONCURRENT_REQUESTS", 0)))
+    app.config.setdefault("MAX_QUEUED_REQUESTS", int(os.environ.get("MAX_QUEUED_REQUESTS", 0)))
+    app.config.setdefault("WORKERS", int(os.environ.get("WEB_CONCURRENCY", 1)))
+    app.config.setdefault("QUEUE_TIMEOUT", float(os.environ.get("QUEUE_TIMEOUT", 5)))
+    app.config.setdefault("OVERLOAD_RETRY_AFTER", int(os.environ.get("OVERLOAD_RETRY_AFTER", 5)))
+
+    app.extensions["ratelimit"] = create_backend(app.config["RATELIMIT_STORAGE_URL"])
+    if app.config["MAX_CONCURRENT_REQUESTS"] > 0:
+        workers = max(1, app.config["WORKERS"])
+        app.extensions["concurrency_limiter"] = ConcurrencyLimiter(
+            math.ceil(app.config["MAX_CONCURRENT_REQUESTS"] / workers),
+            math.ceil(app.config["MAX_QUEUED_REQUESTS"] / workers),
+            app.config["QUEUE_TIMEOUT"],
+        )
+
+    app.before_request(_admit)
+    app.teardown_request(_release)
@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Запуск бенчмарков с сохранением истории результатов и сравнением с предыдущим запуском
+# BENCH_SIZES - размеры наборов данных (ответов на опрос), например: BENCH_SIZES=1000,100000,1000000
+# BENCH_THRESHOLD - допустимая регрессия среднего времени в процентах
+# BENCH_STORAGE - каталог с историей результатов
+BENCH_THRESHOLD=${BENCH_THRESHOLD:-10}
+BENCH_STORAGE=${BENCH_STORAGE:-benchmarks/.results}
+
+echo "Запуск бенчмарков..."
+if compgen -G "${BENCH_STORAGE}/*/*.json" > /dev/null; then
+    python -m pytest benchmarks/ \
+        --benchmark-storage="file://${BENCH_STORAGE}" \
+        --benchmark-autosave \
+        --benchmark-compare \
+        --benchmark-compare-fail="mean:${BENCH_THRESHOLD}%" \
+        "$@"
+else
+    # Первый запуск: сравнивать не с чем, только сохраняем результаты
+    python -m pytest benchmarks/ \
+        --benchmark-storage="file://${BENCH_STORAGE}" \
+        --benchmark-autosave \
+        "$@"
+fi
@@ -0,0 +1,94 @@
+# search.py
+"""
+Response search module.
+Text responses of a question are searched with the MariaDB FULLTEXT index (natural language mode, ranked by
+relevance) or the SQLite FTS5 mirror table (ranked by bm25); other databases, archived answers and SQLite builds
+without FTS5 fall back to LIKE ordered by id. Results are returned page by page.
+"""
+import re
+
+import sqlalchemy as sa
+
+from ORM.models import Answer, ArchivedAnswer
+
+MAX_PER_PAGE = 100
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts5_query(query):
+    """
+    Turns user input into an FTS5 query: every word must match, the last one as a prefix.
+    Quoting keeps FTS5 operators and punctuation from being parsed.
+    """
+    tokens = TOKEN.findall(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"' for token in tokens) + "*"
+
+
+def _has_fts5(db_session):
+    return db_session.execute(
+        sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'answers_fts'"),
+    ).first() is not None
+
+
+def _like(source, query):
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return source.text_response.like(f"%{escaped}%", escape="\\")
+
+
+def _ranked(statement):
+    return sa.text(statement).columns(
+        sa.column("id", sa.Integer), sa.column("text_response", sa.Text),
+        sa.column("created_at", sa.DateTime), sa.column("score", sa.Float),
+    )
+
+
+MARIADB_SEARCH = _ranked(
+    "SELECT id, text_response, created_at, "
+    "MATCH (text_response) AGAINST (:query IN NATURAL LANGUAGE MODE) AS score "
+    "FROM answers WHERE question_id = :question_id AND MATCH (text_response) AGAINST (:query IN NATURAL LANGUAGE MODE) "
+    "ORDER BY score DESC, id LIMIT :limit OFFSET :offset",
+)
+SQLITE_SEARCH = _ranked(
+    "SELECT answers.id, answers.text_response, answers.created_at, bm25(answers_fts) AS score "
+    "FROM answers_fts JOIN answers ON answers.id = answers_fts.rowid "
+    "WHERE answers_fts MATCH :query AND answers.question_id = :question_id "
+    "ORDER BY score, answers.id LIMIT :limit OFFSET :offset",
+)
+
+
+def search_responses(db_session, question_id, query, page=1, per_page=20, survey_id=None, archived=False):
+    """
+    Responses of the question matching the query, best first: ([(answer id, text, created_at, rank)], has_more).
+    An empty query lists all responses by id. rank is None for LIKE matches. survey_id is required for archived answers.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    offset = (max(page, 1) - 1) * per_page
+    # Parameters of the ranked SQL statements
+    params = {"question_id": question_id, "limit": per_page + 1, "offset": offset}
+    dialect = db_session.get_bind().dialect.name
+
+    if archived:
+        statement = (
+            sa.select(ArchivedAnswer.id, ArchivedAnswer.text_response, ArchivedAnswer.created_at, sa.null())
+            .where(ArchivedAnswer.survey_id == survey_id, ArchivedAnswer.question_id == question_id,
+                   _like(ArchivedAnswer, query))
+            .order_by(ArchivedAnswer.id)
+            .offset(offset).limit(per_page + 1)
+        )
+    elif dialect in ("mysql", "mariadb") and query.strip():
+        statement = MARIADB_SEARCH
+        params["query"] = query
+    elif dialect == "sqlite" and fts5_query(query) and _has_fts5(db_session):
+        statement = SQLITE_SEARCH
+        params["query"] = fts5_query(query)
+    else:
+        statement = (
+            sa.select(Answer.id, Answer.text_response, Answer.created_at, sa.null())
+            .where(Answer.question_id == question_id, _like(Answer, query))
+            .order_by(Answer.id)
+            .offset(offset).limit(per_page + 1)
+        )
+    rows = db_session.execute(statement, params if isinstance(statement, sa.TextualSelect) else None).all()
+    return [tuple(row) for row in rows[:per_page]], len(rows) > per_page
@@ -0,0 +1,321 @@
+# seed.py
+"""
+Synthetic dataset generator. Populates the database configured by environment (see db.global_init)
+with users, surveys, questions, options and answers for scale testing.
+
+Example:
+    DB_TYPE=sqlite DB_FILE_PATH=/tmp/big.sqlite3 python seed.py --users 1000 --surveys 200 --answers 10000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+if os.environ.get("DOTENV", False):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+from user_agents import parse
+
+from db import global_init, create_session
+from ORM.models import User, Survey, Question, QuestionType, CHOICE_TYPES, Option, Answer, AnswerOption
+from submissions import dedup_key
+import analytics
+
+DEFAULT_QUESTIONS = "text=1,word=1,string=1,single_choice=3,multiple_choice=2,limited_choice=1,file=1"
+
+# (weight, user agent string); parsed fields are computed once per string
+USER_AGENTS = [
+    (35, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+         "Chrome/124.0.0.0 Safari/537.36"),
+    (20, "Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) "
+         "Chrome/124.0.0.0 Mobile Safari/537.36"),
+    (15, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+         "Version/17.4 Mobile/15E148 Safari/604.1"),
+    (10, "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+         "Version/17.4 Safari/605.1.15"),
+    (8, "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0"),
+    (5, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/124.0.0.0 Safari/537.36 Edg/124.0.2478.80"),
+    (4, "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0"),
+    (2, "Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+        "Version/17.4 Mobile/15E148 Safari/604.1"),
+    (1, "curl/8.5.0"),
+]
+
+TIMEZONES = [
+    (30, "Europe/Moscow"), (15, "UTC"), (12, "Europe/Berlin"), (10, "America/New_York"),
+    (8, "Europe/London"), (6, "Asia/Yekaterinburg"), (5, "America/Los_Angeles"), (5, "Asia/Tokyo"),
+    (4, "Asia/Novosibirsk"), (3, "Australia/Sydney"), (2, "America/Sao_Paulo"),
+]
+
+LANGUAGES = [(45, "ru"), (30, "en"), (8, "de"), (5, "fr"), (4, "es"), (3, "ja"), (3, "pt"), (2, None)]
+
+FILE_EXTENSIONS = [(50, "jpg"), (25, "png"), (15, "pdf"), (7, "jpeg"), (3, "gif")]
+
+WORDS = (
+    "survey service quality price delivery support team product interface speed design mobile web app "
+    "easy hard good bad great slow fast useful useless love hate recommend friend work home time money "
+    "bug feature update login password email notification report chart question answer option"
+).split()
+
+
+def parse_questions_spec(spec):
+    """
+    Parses "type=count,..." into {QuestionType: count}
+    """
+    counts = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, count = item.partition("=")
+        counts[QuestionType(name.strip())] = int(count or 1)
+    return counts
+
+
+def _weighted(pairs):
+    return [value for _, value in pairs], [weight for weight, _ in pairs]
+
+
+def _next_id(db_session, model):
+    return (db_session.query(sa.func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(db_session, model, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db_session.execute(sa.insert(model), rows[start:start + batch_size])
+
+
+def _insert_answers(db_session, answer_rows, answer_options, batch_size):
+    _insert(db_session, Answer, answer_rows, batch_size)
+    _insert(db_session, AnswerOption, answer_options, batch_size)
+    db_session.commit()
+    return len(answer_rows)
+
+
+def _text(rnd, question_type):
+    if question_type == QuestionType.WORD:
+        return rnd.choice(WORDS)
+    if question_type == QuestionType.STRING:
+        return " ".join(rnd.choices(WORDS, k=rnd.randint(2, 6)))
+    return " ".join(rnd.choices(WORDS, k=rnd.randint(5, 60)))
+
+
+def generate(db_session, users=100, surveys=20, questions=None, options=5, answers=10000, seed=0,
+             batch_size=10000, password="password", start=datetime.datetime(2025, 1, 1), days=90,
+             logged_in_share=0.3, log=None):
+    """
+    Generates a synthetic dataset, deterministic for the same arguments on an empty database.
+    Answers are bulk inserted like the other tables and analyzed once at the end. Like real submissions, inactive
+    surveys get no answers, surveys requiring login only get logged-in respondents and a respondent answers a survey
+    once. Returns ids of created users and surveys.
+
+    :param questions: {QuestionType: count} of questions per survey
+    :param options: options per choice question
+    :param answers: total number of answer rows to create (approximately, whole respondents are generated)
+    """
+    rnd = random.Random(seed)
+    questions = questions or parse_questions_spec(DEFAULT_QUESTIONS)
+    log = log or (lambda message: None)
+
+    # Users share one password hash, hashing is way too slow for bulk data
+    password_hash = generate_password_hash(password)
+    first_user_id = _next_id(db_session, User)
+    user_ids = list(range(first_user_id, first_user_id + users))
+    _insert(db_session, User, [{
+        "id": user_id,
+        "username": f"user_{user_id}",
+        "email": f"user_{user_id}@example.com",
+        "password_hash": password_hash,
+        "created_at": start - datetime.timedelta(days=rnd.randint(0, 365)),
+        "is_admin": False,
+    } for user_id in user_ids], batch_size)
+
+    first_survey_id = _next_id(db_session, Survey)
+    survey_ids = list(range(first_survey_id, first_survey_id + surveys))
+    survey_rows = []
+    question_rows = []
+    option_rows = []
+    survey_questions = {}  # survey_id -> [(question_id, type, is_required, choice_limit, [(option_id, text)])]
+    question_id = _next_id(db_session, Question)
+    option_id = _next_id(db_session, Option)
+    for survey_id in survey_ids:
+        survey_rows.append({
+            "id": survey_id,
+            "title": f"Survey #{survey_id}",
+            "description": _text(rnd, QuestionType.TEXT),
+            "author_id": rnd.choice(user_ids),
+            "created_at": start + datetime.timedelta(seconds=rnd.randint(0, days * 86400)),
+            "is_active": rnd.random() < 0.8,
+            "require_login": rnd.random() < 0.1,
+        })
+        survey_questions[survey_id] = []
+        for question_type, count in questions.items():
+            for _ in range(count):
+                is_required = rnd.random() < 0.7
+                choice_limit = rnd.randint(2, max(2, options - 1)) \
+                    if question_type == QuestionType.LIMITED_CHOICE else None
+                question_rows.append({
+                    "id": question_id,
+                    "survey_id": survey_id,
+                    "type": question_type,
+                    "text": _text(rnd, QuestionType.STRING) + "?",
+                    "is_required": is_required,
+                    "choice_limit": choice_limit,
+                })
+                question_options = []
+                if question_type in CHOICE_TYPES:
+                    for index in range(options):
+                        text = f"Option {index + 1}: {rnd.choice(WORDS)}"
+                        option_rows.append({"id": option_id, "question_id": question_id, "text": text})
+                        question_options.append((option_id, text))
+                        option_id += 1
+                survey_questions[survey_id].append(
+                    (question_id, question_type, is_required, choice_limit, question_options),
+                )
+                question_id += 1
+
+    _insert(db_session, Survey, survey_rows, batch_size)
+    _insert(db_session, Question, question_rows, batch_size)
+    _insert(db_session, Option, option_rows, batch_size)
+    db_session.commit()
+    log(f"Created {users} users, {surveys} surveys, {len(question_rows)} questions, {len(option_rows)} options")
+
+    # Survey popularity follows a power law: a few surveys get most of the answers
+    survey_weights = [1 / (rank + 1) for rank in range(len(survey_ids))]
+    rnd.shuffle(survey_weights)
+    # Only active surveys take answers
+    weights = {row["id"]: weight for row, weight in zip(survey_rows, survey_weights) if row["is_active"]}
+    # Users who haven't answered surveys requiring login yet, each of them answers once
+    waiting = {
+        row["id"]: rnd.sample(user_ids, len(user_ids)) for row in survey_rows
+        if row["id"] in weights and row["require_login"]
+    }
+    answered = {survey_id: set() for survey_id in weights}
+
+    user_agents, agent_weights = _weighted(USER_AGENTS)
+    parsed_agents = []
+    for user_agent in user_agents:
+        ua = parse(user_agent)
+        parsed_agents.append({
+            "user_agent": user_agent,
+            "browser": ua.browser.family,
+            "device_type": ua.device.family,
+            "os": ua.os.family,
+        })
+    timezones, timezone_weights = _weighted(TIMEZONES)
+    languages, language_weights = _weighted(LANGUAGES)
+    extensions, extension_weights = _weighted(FILE_EXTENSIONS)
+
+    created = 0
+    respondent = 0
+    answer_id = _next_id(db_session, Answer)
+    answer_rows, answer_options = [], []
+    while created < answers and weights:
+        survey_id = rnd.choices(list(weights), list(weights.values()))[0]
+        if rnd.random() < 0.15:
+            ip_address = "2001:db8:{:x}:{:x}::{:x}".format(rnd.getrandbits(16), rnd.getrandbits(16), respondent)
+        else:
+            # Most respondents have unique addresses, some are behind shared NAT
+            ip_address = "{}.{}.{}.{}".format(rnd.randint(1, 223), rnd.getrandbits(8),
+                                              rnd.getrandbits(8), rnd.randint(1, 254))
+        if survey_id in waiting:
+            if not waiting[survey_id]:
+                # Every user has answered it
+                del weights[survey_id]
+                continue
+            user_id = waiting[survey_id].pop()
+        else:
+            user_id = rnd.choice(user_ids) if user_ids and rnd.random() < logged_in_share else None
+            if dedup_key(user_id, ip_address) in answered[survey_id]:
+                # Answers again anonymously
+                user_id = None
+        key = dedup_key(user_id, ip_address)
+        if key in answered[survey_id]:
+            continue
+        answered[survey_id].add(key)
+        answer_data = {
+            "user_id": user_id,
+            "ip_address": ip_address,
+            "timezone": rnd.choices(timezones, timezone_weights)[0],
+            "language": rnd.choices(languages, language_weights)[0],
+            "created_at": start + datetime.timedelta(seconds=rnd.randint(0, days * 86400)),
+            **rnd.choices(parsed_agents, agent_weights)[0],
+        }
+        respondent += 1
+
+        for question_id, question_type, is_required, choice_limit, question_options in survey_questions[survey_id]:
+            if not is_required and rnd.random() < 0.25:
+                continue
+
+            row = {"id": answer_id, "question_id": question_id, "text_response": None, "file_path": None, **answer_data}
+            if question_type in CHOICE_TYPES:
+                if question_type == QuestionType.SINGLE_CHOICE:
+                    picked = [rnd.choice(question_options)]
+                else:
+                    limit = choice_limit or len(question_options)
+                    picked = rnd.sample(question_options, rnd.randint(1, min(limit, len(question_options))))
+                answer_options.extend({"answer_id": answer_id, "option_id": option_id} for option_id, _ in picked)
+            elif question_type == QuestionType.FILE:
+                extension = rnd.choices(extensions, extension_weights)[0]
+                row["file_path"] = f"upload_{respondent}_{question_id}.{extension}"
+            else:
+                row["text_response"] = _text(rnd, question_type)
+            answer_rows.append(row)
+            answer_id += 1
+
+        if len(answer_rows) >= batch_size:
+            created += _insert_answers(db_session, answer_rows, answer_options, batch_size)
+            answer_rows, answer_options = [], []
+            log(f"Answers: {created}/{answers}")
+
+    if answer_rows:
+        created += _insert_answers(db_session, answer_rows, answer_options, batch_size)
+    log(f"Created {created} answers from {respondent} respondents")
+
+    # Text analytics, respondent sketches and option bitmaps in one pass over the new answers
+    analyzed = analytics.run_pending(db_session, batch_size)
+    log(f"Analyzed {analyzed} answers")
+
+    return {"user_ids": user_ids, "survey_ids": survey_ids, "answers": created, "respondents": respondent}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Populate the database with a synthetic dataset")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--surveys", type=int, default=20)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS,
+                        help=f"Questions per survey by type, default: {DEFAULT_QUESTIONS}")
+    parser.add_argument("--options", type=int, default=5, help="Options per choice question")
+    parser.add_argument("--answers", type=int, default=10000, help="Total number of answer rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--password", default="password", help="Password of every generated user")
+    parser.add_argument("--days", type=int, default=90, help="Answers are spread over this many days")
+    args = parser.parse_args(argv)
+
+    global_init()
+    db_session = create_session()
+    started = time.monotonic()
+    generate(
+        db_session,
+        users=args.users,
+        surveys=args.surveys,
+        questions=parse_questions_spec(args.questions),
+        options=args.options,
+        answers=args.answers,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        password=args.password,
+        days=args.days,
+        log=lambda message: print(f"[{time.monotonic() - started:.1f}s] {message}", file=sys.stderr),
+    )
+    db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# serializers.py
+"""
+Serializers module.
+Defines public shape of every model and builds column-level queries for it, so listing endpoints select only
+serialized columns and get plain rows instead of ORM objects.
+Values are returned as is (datetime, QuestionType), they are encoded by the app JSON provider.
+"""
+import sqlalchemy as sa
+
+from ORM.models import User, Survey, Question, Option, Answer, AnswerOption
+
+IN_CHUNK_SIZE = 1000
+
+
+class Serializer:
+    """
+    Public shape of a model: ordered list of column names
+    """
+    def __init__(self, model, fields, nested=()):
+        self.model = model
+        self.fields = tuple(fields)
+        self.nested = tuple(nested)  # Fields computed by extra queries (e.g. "selected_options")
+
+    def parse_fields(self, value):
+        """
+        Parses sparse fieldset "id,title,..." (?fields=), returns all fields if value is empty.
+        Raises ValueError on unknown fields.
+        """
+        if not value:
+            return self.fields + self.nested
+        requested = [field.strip() for field in value.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in self.fields and field not in self.nested]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # "id" is always returned, clients need it to reference objects
+        return tuple(field for field in ("id", *self.fields[1:], *self.nested) if field == "id" or field in requested)
+
+    def columns(self, fields=None):
+        return [getattr(self.model, field) for field in (fields or self.fields) if field in self.fields]
+
+    def select(self, fields=None, *extra_columns):
+        return sa.select(*self.columns(fields), *extra_columns)
+
+    def dump(self, obj, fields=None):
+        """
+        Serializes ORM object or row
+        """
+        return {field: getattr(obj, field) for field in (fields or self.fields) if field in self.fields}
+
+    def dump_rows(self, rows, fields=None):
+        columns = [field for field in (fields or self.fields) if field in self.fields]
+        return [dict(zip(columns, row)) for row in rows]
+
+
+USER = Serializer(User, ("id", "username", "email", "created_at", "is_admin"))
+SURVEY = Serializer(Survey, ("id", "title", "description", "author_id", "created_at", "is_active", "require_login"))
+QUESTION = Serializer(Question, ("id", "type", "text", "is_required", "choice_limit"))
+OPTION = Serializer(Option, ("id", "text"))
+ANSWER = Serializer(
+    Answer,
+    ("id", "user_id", "question_id", "text_response", "file_path", "created_at",
+     "ip_address", "browser", "device_type", "os"),
+    nested=("selected_options",),
+)
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def selected_options(db_session, answer_ids):
+    """
+    Returns {answer_id: [{"id", "text"}]} loaded with one query per IN_CHUNK_SIZE answers
+    """
+    result = {answer_id: [] for answer_id in answer_ids}
+    for chunk in _chunks(answer_ids):
+        rows = db_session.execute(
+            sa.select(AnswerOption.answer_id, Option.id, Option.text)
+            .join(Option, Option.id == AnswerOption.option_id)
+            .where(AnswerOption.answer_id.in_(chunk))
+            .order_by(Option.id),
+        )
+        for answer_id, option_id, text in rows:
+            result[answer_id].append({"id": option_id, "text": text})
+    return result
+
+
+def dump_answers(db_session, query, fields=None):
+    """
+    Runs column-level answers query built from ANSWER.select(fields) and serializes its rows
+    """
+    fields = fields or ANSWER.fields + ANSWER.nested
+    answers = ANSWER.dump_rows(db_session.execute(query), fields)
+    if "selected_options" in fields:
+        options = selected_options(db_session, [answer["id"] for answer in answers])
+        for answer in answers:
+            answer["selected_options"] = options[answer["id"]]
+    return answers
+
+
+def dump_survey_graph(db_session, survey_id):
+    """
+    Serializes survey with its questions and options using three column-level queries, returns None if not found
+    """
+    row = db_session.execute(SURVEY.select().where(Survey.id == survey_id)).first()
+    if row is None:
+        return None
+
+    survey = SURVEY.dump(row)
+    questions = QUESTION.dump_rows(db_session.execute(
+        QUESTION.select().where(Question.survey_id == survey_id).order_by(Question.id),
+    ))
+    by_question = {question["id"]: question for question in questions}
+    for question in questions:
+        question["options"] = []
+
+    options = db_session.execute(
+        OPTION.select(None, Option.question_id)
+        .join(Question, Question.id == Option.question_id)
+        .where(Question.survey_id == survey_id)
+        .order_by(Option.id),
+    )
+    for option_id, text, question_id in options:
+        by_question[question_id]["options"].append({"id": option_id, "text": text})
+
+    survey["questions"] = questions
+    return survey
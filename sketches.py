@@ -0,0 +1,271 @@
+# sketches.py
+"""
+Respondent sketches module.
+Unique respondents (by IP address, like stats) are counted with HyperLogLog sketches updated by the analytics
+consumer (see analytics.py): one for the survey, one per question, per day and per value of the segment columns.
+A sketch takes a few KB whatever the number of respondents, counting it takes microseconds and the relative standard
+error is 1.04 / sqrt(2 ** PRECISION), about 1.6%. Sketches can't forget respondents, so deleted answers stay counted
+until the survey is rebuilt. Small surveys are counted exactly with SQL instead (see count_respondents).
+
+Sketches of surveys are rebuilt from their answers with:
+    python sketches.py rebuild
+    python sketches.py rebuild --survey 42
+"""
+import math
+import zlib
+import hashlib
+import argparse
+import datetime
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from db import create_session
+from ORM.models import Question, Answer, RespondentSketch
+
+PRECISION = 12
+# Relative standard error of estimates
+ERROR = 1.04 / math.sqrt(1 << PRECISION)
+SEGMENTS = ("browser", "os", "device_type", "language")
+KINDS = ("question", "day") + SEGMENTS
+# Surveys with at most this many answers are counted exactly
+EXACT_MAX = 10000
+REBUILD_BATCH_SIZE = 5000
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch with 2 ** precision one-byte registers and a 64-bit blake2b hash
+    """
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers if registers is not None else 1 << precision)
+
+    @property
+    def error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1 bit in the rest of the hash
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        histogram = Counter(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(
+            count * 2.0 ** -rank for rank, count in histogram.items()
+        )
+        if estimate <= 2.5 * size and histogram[0]:
+            # Linear counting is more precise for small cardinalities
+            estimate = size * math.log(size / histogram[0])
+        return round(estimate)
+
+    def to_bytes(self):
+        # Sketches of small surveys are mostly zero registers and compress well
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], zlib.decompress(data[1:]))
+
+
+def _keys(row):
+    """
+    Sketches the answer row goes to: [(kind, key)]
+    """
+    created_at = row.get("created_at") or datetime.datetime.utcnow()
+    keys = [("survey", ""), ("question", str(row["question_id"])), ("day", created_at.date().isoformat())]
+    keys.extend((segment, row[segment][:200]) for segment in SEGMENTS if row.get(segment))
+    return keys
+
+
+def _merge(db_session, survey_id, sketches):
+    """
+    Merges {(kind, key): HyperLogLog} into the stored sketches of the survey: one locking read, one insert of
+    new sketches and one update of the others
+    """
+    keys = sorted(sketches)
+    query = (
+        sa.select(RespondentSketch.kind, RespondentSketch.key, RespondentSketch.registers)
+        .where(
+            RespondentSketch.survey_id == survey_id,
+            sa.tuple_(RespondentSketch.kind, RespondentSketch.key).in_(keys),
+        )
+        .with_for_update()
+    )
+    stored = {(kind, key): registers for kind, key, registers in db_session.execute(query)}
+    added = [
+        {"survey_id": survey_id, "kind": kind, "key": key, "registers": sketches[kind, key].to_bytes()}
+        for kind, key in keys if (kind, key) not in stored
+    ]
+    if added:
+        try:
+            with db_session.begin_nested():
+                db_session.execute(sa.insert(RespondentSketch), added)
+        except IntegrityError:
+            # Some were created by a concurrent transaction, their rows are locked now
+            stored = {(kind, key): registers for kind, key, registers in db_session.execute(query)}
+            added = [row for row in added if (row["kind"], row["key"]) not in stored]
+            if added:
+                db_session.execute(sa.insert(RespondentSketch), added)
+    changed = [
+        {
+            "b_kind": kind, "b_key": key,
+            "b_registers": sketches[kind, key].merge(HyperLogLog.from_bytes(registers)).to_bytes(),
+        }
+        for (kind, key), registers in stored.items()
+    ]
+    if changed:
+        db_session.execute(
+            sa.update(RespondentSketch.__table__)
+            .where(
+                RespondentSketch.survey_id == survey_id,
+                RespondentSketch.kind == sa.bindparam("b_kind"),
+                RespondentSketch.key == sa.bindparam("b_key"),
+            )
+            .values(registers=sa.bindparam("b_registers")),
+            changed,
+        )
+
+
+def record(db_session, rows):
+    """
+    Adds respondents of answer rows (dicts of Answer columns) to the sketches of their surveys, one update
+    per sketch however many rows there are. Commit is up to the caller.
+    """
+    rows = [row for row in rows if row.get("ip_address")]
+    if not rows:
+        return
+    surveys = dict(db_session.execute(
+        sa.select(Question.id, Question.survey_id).where(Question.id.in_({row["question_id"] for row in rows})),
+    ).all())
+    sketches = {}
+    for row in rows:
+        survey_id = surveys.get(row["question_id"])
+        if survey_id is None:
+            continue
+        for key in _keys(row):
+            sketches.setdefault(survey_id, {}).setdefault(key, HyperLogLog()).add(row["ip_address"])
+    for survey_id in sorted(sketches):
+        _merge(db_session, survey_id, sketches[survey_id])
+
+
+def forget(db_session, survey_id, kind=None, keys=None):
+    """
+    Deletes sketches of the survey, all of them or of the kind (and keys)
+    """
+    query = sa.delete(RespondentSketch).where(RespondentSketch.survey_id == survey_id)
+    if kind is not None:
+        query = query.where(RespondentSketch.kind == kind)
+    if keys is not None:
+        query = query.where(RespondentSketch.key.in_(keys))
+    db_session.execute(query)
+
+
+def estimate(db_session, survey_id, kind="survey"):
+    """
+    Estimated unique respondents of the survey: {key: count}, key is "" for the whole survey
+    """
+    return {
+        key: HyperLogLog.from_bytes(registers).count() for key, registers in db_session.execute(
+            sa.select(RespondentSketch.key, RespondentSketch.registers)
+            .where(RespondentSketch.survey_id == survey_id, RespondentSketch.kind == kind)
+            .order_by(RespondentSketch.key),
+        )
+    }
+
+
+def _exact(db_session, survey_id, kind):
+    question_ids = sa.select(Question.id).where(Question.survey_id == survey_id).scalar_subquery()
+    respondents = sa.func.count(sa.distinct(Answer.ip_address))
+    if kind == "survey":
+        return {"": db_session.scalar(sa.select(respondents).where(Answer.question_id.in_(question_ids)))}
+    if kind == "question":
+        column = Answer.question_id
+    elif kind == "day":
+        column = sa.func.date(Answer.created_at)
+    else:
+        column = getattr(Answer, kind)
+    return {
+        str(key): count for key, count in db_session.execute(
+            sa.select(column, respondents)
+            .where(Answer.question_id.in_(question_ids), column.isnot(None))
+            .group_by(column).order_by(column),
+        )
+    }
+
+
+def count_respondents(db_session, survey_id, kind="survey", exact=None, answers=None):
+    """
+    Unique respondents of the survey, in total or grouped by kind: ({key: count}, exact).
+    exact=None counts exactly when the survey has at most EXACT_MAX answers (pass `answers` if already known),
+    archived surveys are always estimated.
+    """
+    if exact is None:
+        if answers is None:
+            question_ids = sa.select(Question.id).where(Question.survey_id == survey_id).scalar_subquery()
+            answers = db_session.scalar(sa.select(sa.func.count(Answer.id)).where(Answer.question_id.in_(question_ids)))
+        exact = 0 < answers <= EXACT_MAX
+    if exact:
+        return _exact(db_session, survey_id, kind), True
+    return estimate(db_session, survey_id, kind), False
+
+
+def rebuild(db_session, survey_id, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Sketches answers of the survey from scratch by reading them in batches. Commit is up to the caller.
+    """
+    forget(db_session, survey_id)
+    question_ids = sa.select(Question.id).where(Question.survey_id == survey_id).scalar_subquery()
+    columns = [Answer.id, Answer.question_id, Answer.ip_address, Answer.created_at] + [
+        getattr(Answer, segment) for segment in SEGMENTS
+    ]
+    after = 0
+    while True:
+        rows = db_session.execute(
+            sa.select(*columns)
+            .where(Answer.question_id.in_(question_ids), Answer.id > after)
+            .order_by(Answer.id)
+            .limit(batch_size),
+        ).mappings().all()
+        if not rows:
+            break
+        record(db_session, rows)
+        after = rows[-1]["id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HyperLogLog sketches of respondents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_command = commands.add_parser("rebuild", help="sketch existing answers")
+    rebuild_command.add_argument("--survey", type=int, help="only this survey")
+    rebuild_command.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE, help="answers per query")
+    args = parser.parse_args()
+
+    db_session = create_session()
+    try:
+        if args.survey is not None:
+            survey_ids = [args.survey]
+        else:
+            survey_ids = db_session.scalars(sa.select(Question.survey_id).distinct().order_by(Question.survey_id)).all()
+        # One transaction per survey
+        for survey_id in survey_ids:
+            rebuild(db_session, survey_id, args.batch_size)
+            db_session.commit()
+            print(f"Survey {survey_id}: sketched")
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
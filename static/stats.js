@@ -0,0 +1,144 @@
+// Text responses and uploaded files on the stats page: the first page is rendered by the server,
+// next pages are loaded with the cursor (after=<answer id>), search switches to ranked pages.
+// Responses over time are loaded from the timeseries endpoint and refreshed every minute.
+
+const TIMELINE_REFRESH = 60000;
+let timelineChart = null;
+
+function renderResponse(panel, item) {
+    const row = document.createElement('div');
+    row.className = 'list-group-item';
+    if (panel.dataset.kind === 'file') {
+        const link = document.createElement('a');
+        link.href = panel.dataset.uploads + encodeURIComponent(item.file_path);
+        link.target = '_blank';
+        link.textContent = item.file_path;
+        row.appendChild(link);
+    } else {
+        row.textContent = item.text;
+    }
+    return row;
+}
+
+
+async function loadResponses(panel, reset) {
+    const list = panel.querySelector('.responses-list');
+    const more = panel.querySelector('.responses-more');
+    const search = panel.querySelector('.responses-search');
+    const query = search ? search.value.trim() : '';
+    const params = new URLSearchParams();
+    if (query) {
+        panel.dataset.page = reset ? 1 : Number(panel.dataset.page || 1) + 1;
+        params.set('q', query);
+        params.set('page', panel.dataset.page);
+    } else if (!reset && panel.dataset.next) {
+        params.set('after', panel.dataset.next);
+    }
+
+    more.disabled = true;
+    try {
+        const response = await fetch(`${panel.dataset.url}?${params}`, {credentials: 'same-origin'});
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+        if (reset) {
+            list.replaceChildren();
+        }
+        data.items.forEach(item => list.appendChild(renderResponse(panel, item)));
+        panel.dataset.next = data.next_after || '';
+        more.hidden = !data.has_more;
+    } catch (error) {
+        console.error('Responses loading error:', error);
+    } finally {
+        more.disabled = false;
+    }
+}
+
+
+function timelineLabel(start, bucket) {
+    // ISO date-time of the bucket start
+    return bucket === 'day' ? start.slice(0, 10) : start.replace('T', ' ').slice(0, 16);
+}
+
+
+async function loadTimeline() {
+    const canvas = document.getElementById('timeline');
+    const bucket = document.getElementById('timeline-bucket').value;
+    try {
+        const response = await fetch(`${canvas.dataset.url}?bucket=${bucket}`, {credentials: 'same-origin'});
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+        const labels = data.points.map(point => timelineLabel(point.start, bucket));
+        const answers = data.points.map(point => point.answers);
+        const respondents = data.points.map(point => point.respondents);
+        if (timelineChart) {
+            timelineChart.data.labels = labels;
+            timelineChart.data.datasets[0].data = respondents;
+            timelineChart.data.datasets[1].data = answers;
+            timelineChart.update();
+            return;
+        }
+        timelineChart = new Chart(canvas.getContext('2d'), {
+            type: 'line',
+            data: {
+                labels: labels,
+                datasets: [{
+                    label: 'Respondents',
+                    data: respondents,
+                    borderColor: 'rgba(54, 162, 235, 1)',
+                    backgroundColor: 'rgba(54, 162, 235, 0.2)',
+                    fill: true,
+                    tension: 0.2
+                }, {
+                    label: 'Answers',
+                    data: answers,
+                    borderColor: 'rgba(255, 159, 64, 1)',
+                    backgroundColor: 'rgba(255, 159, 64, 0.2)',
+                    tension: 0.2
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                elements: {
+                    point: {
+                        radius: 0
+                    }
+                },
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        ticks: {
+                            precision: 0
+                        }
+                    }
+                }
+            }
+        });
+    } catch (error) {
+        console.error('Timeline loading error:', error);
+    }
+}
+
+
+document.addEventListener('DOMContentLoaded', () => {
+    if (document.getElementById('timeline')) {
+        document.getElementById('timeline-bucket').addEventListener('change', loadTimeline);
+        loadTimeline();
+        setInterval(loadTimeline, TIMELINE_REFRESH);
+    }
+    document.querySelectorAll('.responses-panel').forEach(panel => {
+        panel.querySelector('.responses-more').addEventListener('click', () => loadResponses(panel, false));
+        const search = panel.querySelector('.responses-search');
+        if (search) {
+            let timer = null;
+            search.addEventListener('input', () => {
+                clearTimeout(timer);
+                timer = setTimeout(() => loadResponses(panel, true), 300);
+            });
+        }
+    });
+});
@@ -11,6 +11,7 @@ function addQuestion() {
                 </button>
             </div>
             <div class="card-body">
+                <input type="hidden" name="questions[${questionCounter}][id]" value="">
                 <div class="row mb-3">
                     <div class="col-md-6">
                         <label class="form-label">Question Text</label>
@@ -64,6 +65,7 @@ function updateQuestionOptions(qIndex) {
                 <label class="form-label">Answer Options</label>
                 <div class="options-list">
                     <div class="input-group mb-2">
+                        <input type="hidden" name="questions[${qIndex}][option_ids][]" value="">
                         <input type="text" 
                                name="questions[${qIndex}][options][]" 
                                class="form-control">
@@ -93,9 +95,11 @@ function addOption(btn) {
     const optionsList = btn.closest('.options-list');
     const newOption = document.createElement('div');
     newOption.className = 'input-group mb-2';
+    const optionName = btn.previousElementSibling.name;
     newOption.innerHTML = `
+        <input type="hidden" name="${optionName.replace('[options][]', '[option_ids][]')}" value="">
         <input type="text" 
-               name="${btn.previousElementSibling.name}" 
+               name="${optionName}" 
                class="form-control">
         <button type="button" 
                 class="btn btn-outline-danger" 
@@ -0,0 +1,186 @@
+# stats.py
+"""
+Survey statistics module.
+Aggregates are computed by a few GROUP BY queries instead of loading answers through the ORM,
+text questions are summarized incrementally by text_analytics.py.
+Archived surveys (see archive.py) are served from the snapshot of aggregates frozen when their answers were
+moved to answers_archive; text responses and uploaded files are read from there.
+Only the first page of text responses and files is included, further pages are read by list_responses()
+with keyset pagination (GET /api/surveys/<id>/questions/<qid>/responses?after=<id>).
+"""
+import os
+import json
+from collections import Counter
+
+import sqlalchemy as sa
+
+from ORM.models import (
+    Question, QuestionType, CHOICE_TYPES, TEXT_TYPES, Option, Answer, AnswerOption, ArchivedAnswer, SurveySnapshot,
+)
+import bitmaps
+import sketches
+import text_analytics
+
+RESPONSES_PAGE = 20
+
+
+def _counts(db_session, column, condition):
+    return dict(db_session.execute(sa.select(column, sa.func.count()).where(condition).group_by(column)).all())
+
+
+def _percent(part, whole):
+    return f"{part / whole * 100:.1f}%" if whole > 0 else "0%"
+
+
+def compute_stats(db_session, survey_id):
+    """
+    Aggregated stats of the survey answers: respondents, demographics and per question counts.
+    Lists of text responses and files aren't included (see survey_stats).
+    """
+    questions = db_session.execute(
+        sa.select(Question.id, Question.text, Question.type)
+        .where(Question.survey_id == survey_id)
+        .order_by(Question.id),
+    ).all()
+    question_ids = [question.id for question in questions]
+    in_survey = Answer.question_id.in_(question_ids)
+
+    answers_count = _counts(db_session, Answer.question_id, in_survey)
+    # Unique respondents by IP address, estimated by the HyperLogLog sketch for big surveys
+    respondents, respondents_exact = sketches.count_respondents(
+        db_session, survey_id, answers=sum(answers_count.values()),
+    )
+    total_responses = respondents.get("", 0)
+
+    choice_ids = [question.id for question in questions if question.type in CHOICE_TYPES]
+    option_counts = {}
+    options = {question_id: [] for question_id in choice_ids}
+    option_ids = {question_id: [] for question_id in choice_ids}
+    if choice_ids:
+        # Picked options are answer_options rows, counted by option id
+        option_counts = dict(db_session.execute(
+            sa.select(AnswerOption.option_id, sa.func.count())
+            .join(Option, Option.id == AnswerOption.option_id)
+            .where(Option.question_id.in_(choice_ids))
+            .group_by(AnswerOption.option_id),
+        ).all())
+        for option_id, question_id, text in db_session.execute(
+            sa.select(Option.id, Option.question_id, Option.text)
+            .where(Option.question_id.in_(choice_ids))
+            .order_by(Option.id),
+        ):
+            options[question_id].append(text)
+            option_ids[question_id].append(option_id)
+
+    # Maintained incrementally, raw text isn't read
+    text_stats = text_analytics.question_stats(
+        db_session, [question.id for question in questions if question.type in TEXT_TYPES],
+    )
+
+    file_ids = [question.id for question in questions if question.type == QuestionType.FILE]
+    file_types = {question_id: Counter() for question_id in file_ids}
+    if file_ids:
+        for question_id, file_path in db_session.execute(
+            sa.select(Answer.question_id, Answer.file_path)
+            .where(Answer.question_id.in_(file_ids), Answer.file_path.isnot(None)),
+        ):
+            file_types[question_id][os.path.splitext(file_path)[1].lower()] += 1
+
+    stats = []
+    for question in questions:
+        count = answers_count.get(question.id, 0)
+        question_stat = {
+            "id": question.id,
+            "text": question.text,
+            "type": question.type.value,
+            "answers_count": count,
+            "response_rate": _percent(count, total_responses),
+        }
+        if question.type in CHOICE_TYPES:
+            labels = options[question.id]
+            values = [option_counts.get(option_id, 0) for option_id in option_ids[question.id]]
+            question_stat["option_stats"] = [
+                {"option_id": option_id, "option": text, "count": value, "percentage": _percent(value, sum(values))}
+                for option_id, text, value in zip(option_ids[question.id], labels, values)
+            ]
+            question_stat["chart_labels"] = labels
+            question_stat["chart_values"] = values
+        elif question.type in TEXT_TYPES:
+            question_stat["text_stats"] = {
+                **text_stats.get(question.id, text_analytics.EMPTY_STATS),
+                "responses": [],
+                "next": None,
+            }
+        elif question.type == QuestionType.FILE:
+            question_stat["file_stats"] = {"file_types": dict(file_types[question.id]), "file_paths": [], "next": None}
+        stats.append(question_stat)
+
+    return {
+        "total_responses": total_responses,
+        "respondents_exact": respondents_exact,
+        "answers": sum(answers_count.values()),
+        "browsers": _counts(db_session, Answer.browser, in_survey),
+        "operating_systems": _counts(db_session, Answer.os, in_survey),
+        "devices": _counts(db_session, Answer.device_type, in_survey),
+        "stats": stats,
+    }
+
+
+def list_responses(db_session, question_id, after=None, limit=RESPONSES_PAGE, files=False, survey_id=None,
+                   archived=False):
+    """
+    Page of text responses (or uploaded file names) to the question after the answer id `after`, ordered by id.
+    Returns ([(answer id, text or file name, created_at)], id to continue after or None on the last page).
+    survey_id is required for archived answers.
+    """
+    source = ArchivedAnswer if archived else Answer
+    column = source.file_path if files else source.text_response
+    condition = [source.question_id == question_id, column.isnot(None)]
+    if archived:
+        condition.append(source.survey_id == survey_id)
+    if after is not None:
+        condition.append(source.id > after)
+    rows = db_session.execute(
+        sa.select(source.id, column, source.created_at).where(*condition).order_by(source.id).limit(limit + 1),
+    ).all()
+    page = [tuple(row) for row in rows[:limit]]
+    return page, page[-1][0] if len(rows) > limit else None
+
+
+def _add_responses(db_session, survey_id, stats, archived):
+    """
+    Fills the first page of text responses and uploaded file names
+    """
+    for stat in stats["stats"]:
+        if "text_stats" in stat:
+            values, files = stat["text_stats"], False
+        elif "file_stats" in stat:
+            values, files = stat["file_stats"], True
+        else:
+            continue
+        rows, values["next"] = list_responses(
+            db_session, stat["id"], files=files, survey_id=survey_id, archived=archived,
+        )
+        values["file_paths" if files else "responses"] = [value for _, value, _ in rows]
+
+
+def survey_stats(db_session, survey_id, respondent_filter=None):
+    """
+    Stats of the survey: live ones, or the snapshot if its answers are archived ("archived_at" is set then).
+    respondent_filter (crosstab.parse_filter terms) limits them to choice questions and matching respondents
+    (counted with option bitmaps), raises ValueError on unknown options.
+    """
+    snapshot = db_session.get(SurveySnapshot, survey_id)
+    if respondent_filter:
+        stats = bitmaps.filtered_stats(db_session, survey_id, respondent_filter)
+        stats["archived_at"] = snapshot.created_at.strftime("%d.%m.%Y %H:%M") if snapshot is not None else None
+        stats["filter"] = ",".join(f"{'' if picked else '-'}{option_id}" for option_id, picked in respondent_filter)
+        return stats
+    if snapshot is None:
+        stats = compute_stats(db_session, survey_id)
+        stats["archived_at"] = None
+    else:
+        stats = json.loads(snapshot.stats)
+        stats["archived_at"] = snapshot.created_at.strftime("%d.%m.%Y %H:%M")
+    _add_responses(db_session, survey_id, stats, archived=snapshot is not None)
+    return stats
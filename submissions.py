@@ -0,0 +1,354 @@
+# submissions.py
+"""
+Survey submissions module.
+Validates submitted forms into answer rows and writes them with one bulk insert.
+Optional write-behind mode (SUBMISSION_BUFFER=<journal path>): submissions are appended to a local SQLite journal
+and acknowledged at once, a flusher thread moves them to the database in batches. Journal entries are deleted only
+after the batch is committed, so pending submissions survive restarts; entries already in the database are skipped.
+"""
+import os
+import json
+import time
+import fcntl
+import atexit
+import sqlite3
+import logging
+import datetime
+import threading
+
+import sqlalchemy as sa
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from db import create_session
+from files import allowed_file
+from ORM.models import QuestionType, CHOICE_TYPES, Question, Option, Answer, AnswerOption
+import metrics
+
+logger = logging.getLogger("questionnaire.submissions")
+
+
+def dedup_key(user_id, ip_address):
+    """
+    Respondent identity used to reject repeated submissions: user if logged in, IP otherwise
+    """
+    return f"user:{user_id}" if user_id is not None else f"ip:{ip_address}"
+
+
+def already_answered(db_session, survey_id, user_id, ip_address):
+    """
+    Checks answers in the database and submissions waiting in the write-behind journal
+    """
+    query = sa.select(Answer.id).join(Question, Question.id == Answer.question_id).where(Question.survey_id == survey_id)
+    if user_id is not None:
+        query = query.where(Answer.user_id == user_id)
+    else:
+        query = query.where(Answer.ip_address == ip_address)
+    if db_session.execute(query.limit(1)).first() is not None:
+        return True
+
+    buffer = current_app.extensions.get("submission_buffer")
+    return buffer is not None and buffer.journal.is_pending(survey_id, dedup_key(user_id, ip_address))
+
+
+def collect_answers(db_session, survey, form, files, meta, upload_folder):
+    """
+    Validates the submitted form and saves uploaded files, returns answer rows (dicts of Answer columns).
+    Choice answers are one row per question with ids of the selected options in "option_ids".
+    Raises ValueError on unknown options.
+    """
+    options = dict(db_session.execute(
+        sa.select(Option.id, Option.question_id)
+        .join(Question, Question.id == Option.question_id)
+        .where(Question.survey_id == survey.id),
+    ).all())
+
+    rows = []
+    for question in survey.questions:
+        row = {**meta, "question_id": question.id, "text_response": None, "file_path": None}
+        if question.type == QuestionType.FILE:
+            file = files.get(f"q_{question.id}")
+            if file and allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                file_path = os.path.join(upload_folder, filename)
+                file.save(file_path)
+                metrics.record_upload(os.path.getsize(file_path))
+                row["file_path"] = filename
+            rows.append(row)
+        elif question.type in CHOICE_TYPES:
+            option_ids = list(dict.fromkeys(int(value) for value in form.getlist(f"q_{question.id}")))
+            for option_id in option_ids:
+                if options.get(option_id) != question.id:
+                    raise ValueError(f"Invalid option {option_id} for question {question.id}")
+            if option_ids:
+                rows.append({**row, "option_ids": option_ids})
+        else:
+            row["text_response"] = form.get(f"q_{question.id}")
+            rows.append(row)
+    return rows
+
+
+def persist_submission(db_session, rows):
+    """
+    Inserts answer rows with one executemany (and answer_options rows for their "option_ids"). Text analytics,
+    respondent sketches and option bitmaps are updated later by the analytics consumer (see analytics.py).
+    Commit is up to the caller.
+    """
+    if rows:
+        answer_ids = db_session.scalars(
+            sa.insert(Answer).returning(Answer.id, sort_by_parameter_order=True),
+            [{column: value for column, value in row.items() if column != "option_ids"} for row in rows],
+        ).all()
+        answer_options = [
+            {"answer_id": answer_id, "option_id": option_id}
+            for answer_id, row in zip(answer_ids, rows) for option_id in row.get("option_ids") or ()
+        ]
+        if answer_options:
+            db_session.execute(sa.insert(AnswerOption), answer_options)
+
+
+def _encode_rows(rows):
+    return json.dumps([{**row, "created_at": row["created_at"].isoformat()} for row in rows])
+
+
+def _decode_rows(value):
+    return [{**row, "created_at": datetime.datetime.fromisoformat(row["created_at"])} for row in json.loads(value)]
+
+
+class SubmissionJournal:
+    """
+    Durable queue of submissions in a local SQLite database (WAL, synced on every append)
+    """
+    def __init__(self, path):
+        self.path = path
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    survey_id INTEGER NOT NULL,
+                    dedup_key TEXT NOT NULL,
+                    answers TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (survey_id, dedup_key)
+                )
+            """)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def append(self, survey_id, key, rows):
+        """
+        Returns False if the respondent already has a pending submission of the survey
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT INTO submissions (survey_id, dedup_key, answers, created_at) VALUES (?, ?, ?, ?)",
+                    (survey_id, key, _encode_rows(rows), time.time()),
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            connection.close()
+
+    def is_pending(self, survey_id, key):
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT 1 FROM submissions WHERE survey_id = ? AND dedup_key = ?", (survey_id, key),
+            ).fetchone() is not None
+        finally:
+            connection.close()
+
+    def pending(self, limit):
+        """
+        Returns the oldest submissions: [(id, survey_id, dedup_key, rows)]
+        """
+        connection = self._connect()
+        try:
+            entries = connection.execute(
+                "SELECT id, survey_id, dedup_key, answers FROM submissions ORDER BY id LIMIT ?", (limit,),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [(entry_id, survey_id, key, _decode_rows(answers)) for entry_id, survey_id, key, answers in entries]
+
+    def delete(self, ids):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("DELETE FROM submissions WHERE id = ?", [(entry_id,) for entry_id in ids])
+        finally:
+            connection.close()
+
+    def stats(self):
+        """
+        Returns (pending submissions, append time of the oldest one or None)
+        """
+        connection = self._connect()
+        try:
+            return connection.execute("SELECT count(*), min(created_at) FROM submissions").fetchone()
+        finally:
+            connection.close()
+
+
+class SubmissionBuffer:
+    """
+    Write-behind buffer: journal plus flusher thread
+    """
+    def __init__(self, journal, batch_size=500, flush_interval=1.0, max_lag=30.0, max_pending=100000):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_lag = max_lag
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def accepting(self):
+        """
+        False when the flusher falls behind (database is slow or down), submissions are written directly then
+        """
+        count, oldest = self.journal.stats()
+        metrics.BUFFERED_SUBMISSIONS.set(count)
+        return count < self.max_pending and (oldest is None or time.time() - oldest < self.max_lag)
+
+    def append(self, survey_id, key, rows):
+        return self.journal.append(survey_id, key, rows)
+
+    def flush(self):
+        """
+        Moves one batch into the database, returns number of journal entries processed
+        """
+        with self._lock, open(self.journal.path + ".lock", "a") as lock_file:
+            try:
+                # One flusher for all processes sharing the journal
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+
+            entries = self.journal.pending(self.batch_size)
+            if not entries:
+                return 0
+
+            db_session = create_session()
+            try:
+                existing = self._existing_keys(db_session, entries)
+                # Surveys can be deleted or edited while their submissions are pending
+                question_ids = set(db_session.scalars(
+                    sa.select(Question.id).where(Question.survey_id.in_({entry[1] for entry in entries})),
+                ))
+                option_ids = set(db_session.scalars(sa.select(Option.id).where(Option.question_id.in_(question_ids))))
+                rows = []
+                for _, survey_id, key, answers in entries:
+                    if (survey_id, key) in existing:
+                        # Committed before a crash, or answered directly while the entry was pending
+                        continue
+                    existing.add((survey_id, key))
+                    for answer in answers:
+                        if answer["question_id"] not in question_ids:
+                            continue
+                        if "option_ids" in answer:
+                            answer = {**answer, "option_ids": [
+                                option_id for option_id in answer["option_ids"] if option_id in option_ids
+                            ]}
+                            # Like unanswered choice questions, no row when none of the options is left
+                            if not answer["option_ids"]:
+                                continue
+                        rows.append(answer)
+                persist_submission(db_session, rows)
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+            finally:
+                db_session.close()
+
+            self.journal.delete([entry[0] for entry in entries])
+            return len(entries)
+
+    @staticmethod
+    def _existing_keys(db_session, entries):
+        survey_ids = {entry[1] for entry in entries}
+        user_ids, ips = set(), set()
+        for _, _, key, _ in entries:
+            kind, _, value = key.partition(":")
+            if kind == "user":
+                user_ids.add(int(value))
+            else:
+                ips.add(value)
+
+        existing = set()
+        answers = db_session.execute(
+            sa.select(Question.survey_id, Answer.user_id, Answer.ip_address)
+            .join(Question, Question.id == Answer.question_id)
+            .where(Question.survey_id.in_(survey_ids), sa.or_(Answer.user_id.in_(user_ids), Answer.ip_address.in_(ips)))
+            .distinct(),
+        )
+        for survey_id, user_id, ip_address in answers:
+            if user_id is not None:
+                existing.add((survey_id, dedup_key(user_id, None)))
+            existing.add((survey_id, dedup_key(None, ip_address)))
+        return existing
+
+    def flush_all(self):
+        while self.flush() == self.batch_size:
+            pass
+
+    def _run(self):
+        # The first flush recovers submissions left by a previous run
+        while True:
+            try:
+                self.flush_all()
+            except Exception:
+                logger.exception("Failed to flush submissions, retrying in %s s", self.flush_interval)
+            if self._stopped.wait(self.flush_interval):
+                break
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="submission-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def init_app(app):
+    """
+    Enables write-behind mode if SUBMISSION_BUFFER is set. Configuration:
+    SUBMISSION_BUFFER - journal path (env SUBMISSION_BUFFER, empty disables write-behind)
+    SUBMISSION_BATCH_SIZE - submissions per transaction (env SUBMISSION_BATCH_SIZE)
+    SUBMISSION_FLUSH_INTERVAL - seconds between flushes (env SUBMISSION_FLUSH_INTERVAL)
+    SUBMISSION_MAX_LAG - seconds, older pending submissions switch the app to direct writes (env SUBMISSION_MAX_LAG)
+    SUBMISSION_MAX_PENDING - journal size switching the app to direct writes (env SUBMISSION_MAX_PENDING)
+    """
+    app.config.setdefault("SUBMISSION_BUFFER", os.environ.get("SUBMISSION_BUFFER", ""))
+    app.config.setdefault("SUBMISSION_BATCH_SIZE", int(os.environ.get("SUBMISSION_BATCH_SIZE", 500)))
+    app.config.setdefault("SUBMISSION_FLUSH_INTERVAL", float(os.environ.get("SUBMISSION_FLUSH_INTERVAL", 1)))
+    app.config.setdefault("SUBMISSION_MAX_LAG", float(os.environ.get("SUBMISSION_MAX_LAG", 30)))
+    app.config.setdefault("SUBMISSION_MAX_PENDING", int(os.environ.get("SUBMISSION_MAX_PENDING", 100000)))
+    if not app.config["SUBMISSION_BUFFER"]:
+        return
+
+    buffer = SubmissionBuffer(
+        SubmissionJournal(app.config["SUBMISSION_BUFFER"]),
+        batch_size=app.config["SUBMISSION_BATCH_SIZE"],
+        flush_interval=app.config["SUBMISSION_FLUSH_INTERVAL"],
+        max_lag=app.config["SUBMISSION_MAX_LAG"],
+        max_pending=app.config["SUBMISSION_MAX_PENDING"],
+    )
+    buffer.start()
+    app.extensions["submission_buffer"] = buffer
@@ -2,22 +2,75 @@
 """
 Surveys module
 """
-import os
+import re
+import datetime
 
 from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app  # , current_app
 from flask_login import login_required, current_user, AnonymousUserMixin
-from werkzeug.utils import secure_filename
 
 from db import create_session
-from ORM.models import Survey, Question, QuestionType, Option, Answer, AnswerOption
+from ORM.models import Survey, QuestionType, CHOICE_TYPES
 
-from user_agents import parse
-
-from files import allowed_file
+from submissions import already_answered, collect_answers, persist_submission, dedup_key
+import metrics
+import jobs
+from caching import bump_survey_version
+from survey_definitions import apply_definitions, create_surveys
 
 survey_bp = Blueprint("survey", __name__, template_folder="templates", url_prefix="/surveys")
 
 
+QUESTION_TEXT_FIELD = re.compile(r"questions\[(\d+)\]\[text\]")
+
+
+def _int_or_none(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def parse_questions_form(form):
+    """
+    Parses "questions[<index>][...]" fields of the survey builder form into question definitions.
+    Existing questions and options carry their ids ("[id]", "[option_ids][]"), new ones have None.
+    """
+    # Removed question cards leave gaps in indexes
+    indexes = sorted({
+        int(match.group(1)) for match in map(QUESTION_TEXT_FIELD.fullmatch, form.keys()) if match
+    })
+
+    definitions = []
+    for question_index in indexes:
+        q_prefix = f"questions[{question_index}]"
+
+        definition = {
+            "id": _int_or_none(form.get(f"{q_prefix}[id]")),
+            "text": form[f"{q_prefix}[text]"],
+            "type": QuestionType(form[f"{q_prefix}[type]"]),
+            "required": bool(form.get(f"{q_prefix}[required]")),
+            "options": [],
+            "option_ids": [],
+            "limit": None,
+        }
+
+        # Process answer options for choice types
+        if definition["type"] in CHOICE_TYPES:
+            texts = form.getlist(f"{q_prefix}[options][]")
+            ids = form.getlist(f"{q_prefix}[option_ids][]")
+            if len(ids) != len(texts):
+                ids = [None] * len(texts)
+            for option_id, opt_text in zip(ids, texts):
+                if opt_text.strip():
+                    definition["options"].append(opt_text)
+                    definition["option_ids"].append(_int_or_none(option_id))
+
+        # Choice limit for LIMITED_CHOICE
+        if definition["type"] == QuestionType.LIMITED_CHOICE:
+            definition["limit"] = int(form.get(f"{q_prefix}[limit]", 1))
+
+        definitions.append(definition)
+
+    return definitions
+
+
 @survey_bp.route("/create", methods=["GET", "POST"])
 @login_required
 def create():
@@ -25,48 +78,15 @@ def create():
 
     if request.method == "POST":
         try:
-            # Create a survey
-            new_survey = Survey(
-                title=request.form["survey_title"],
-                description=request.form["survey_description"],
-                author_id=current_user.id,
-            )
-            db_session.add(new_survey)
-            db_session.flush()  # To get the ID of the new survey
-
-            # Process questions
-            question_index = 0
-            while True:
-                q_prefix = f"questions[{question_index}]"
-                if f"{q_prefix}[text]" not in request.form:
-                    break
-
-                question = Question(
-                    text=request.form[f"{q_prefix}[text]"],
-                    type=QuestionType(request.form[f"{q_prefix}[type]"]),
-                    is_required=bool(request.form.get(f"{q_prefix}[required]")),
-                    survey_id=new_survey.id,
-                )
-
-                # Process answer options for choice types
-                if question.type in [QuestionType.SINGLE_CHOICE,
-                                     QuestionType.MULTIPLE_CHOICE,
-                                     QuestionType.LIMITED_CHOICE]:
-                    options = request.form.getlist(f"{q_prefix}[options][]")
-                    for opt_text in options:
-                        if opt_text.strip():
-                            question.options.append(Option(text=opt_text))
-
-                # Choice limit for LIMITED_CHOICE
-                if question.type == QuestionType.LIMITED_CHOICE:
-                    question.choice_limit = int(request.form.get(f"{q_prefix}[limit]", 1))
-
-                db_session.add(question)
-                question_index += 1
+            # Survey, its questions and options are inserted with one statement each
+            survey_id, = create_surveys(db_session, current_user.id, [(
+                {"title": request.form["survey_title"], "description": request.form["survey_description"]},
+                parse_questions_form(request.form),
+            )])
 
             db_session.commit()
             flash("Survey created successfully!", "success")
-            return redirect(url_for("survey.view", id=new_survey.id))
+            return redirect(url_for("survey.view", id=survey_id))
 
         except Exception as e:
             db_session.rollback()
@@ -114,39 +134,10 @@ def edit(id):
             survey.description = request.form["survey_description"]
             survey.require_login = "require_login" in request.form
 
-            # Delete old questions and their options
-            for question in survey.questions:
-                db_session.delete(question)
-
-            # Add new questions (similar to create)
-            question_index = 0
-            while True:
-                q_prefix = f"questions[{question_index}]"
-                if f"{q_prefix}[text]" not in request.form:
-                    break
-
-                question = Question(
-                    text=request.form[f"{q_prefix}[text]"],
-                    type=QuestionType(request.form[f"{q_prefix}[type]"]),
-                    is_required=bool(request.form.get(f"{q_prefix}[required]")),
-                    survey_id=survey.id,
-                )
-
-                # Process options for choice questions
-                if question.type in [QuestionType.SINGLE_CHOICE,
-                                     QuestionType.MULTIPLE_CHOICE,
-                                     QuestionType.LIMITED_CHOICE]:
-                    options = request.form.getlist(f"{q_prefix}[options][]")
-                    for opt_text in options:
-                        if opt_text.strip():
-                            question.options.append(Option(text=opt_text))
-
-                # Choice limit for LIMITED_CHOICE
-                if question.type == QuestionType.LIMITED_CHOICE:
-                    question.choice_limit = int(request.form.get(f"{q_prefix}[limit]", 1))
-
-                db_session.add(question)
-                question_index += 1
+            bump_survey_version(db_session, survey.id)
+
+            # Update questions and options in place, answers keep referencing them
+            apply_definitions(db_session, survey.id, parse_questions_form(request.form))
 
             db_session.commit()
             flash("Survey updated successfully", "success")
@@ -164,33 +155,25 @@ def take_survey(id):
     db_session = create_session()
     survey = db_session.query(Survey).get(id)
 
+    # Closed surveys (archived ones among them) don't take answers
+    if not survey.is_active:
+        flash("This survey is closed", "warning")
+        return redirect(url_for("survey.view", id=id))
+
     # Check authorization
     if survey.require_login and isinstance(current_user, AnonymousUserMixin):
         return redirect(url_for("auth.login", next=request.url))
 
-    # Check previous responses
-    if current_user.is_authenticated:
-        has_answered = (db_session.query(Answer)
-                        .filter(Answer.user_id == current_user.id)
-                        .join(Question)
-                        .filter(Question.survey_id == id)
-                        .first()
-                        )
-
-    else:
-    # Check by IP (simplified)
-        has_answered = db_session.query(
-            Answer,
-        ).filter(
-            Answer.ip_address == request.remote_addr,
-        ).join(Question).filter(Question.survey_id == id).first()
-
-    if has_answered:
+    # Check previous responses (by IP for anonymous respondents, simplified)
+    user_id = current_user.id if current_user.is_authenticated else None
+    if already_answered(db_session, id, user_id, request.remote_addr):
         flash("You have already taken this survey", "warning")
         return redirect(url_for("survey.view", id=id))
 
     if request.method == "POST":
         try:
+            from user_agents import parse
+
             # Collect metadata
             ua = parse(request.user_agent.string)
             answer_data = {
@@ -201,83 +184,30 @@ def take_survey(id):
                 "browser": ua.browser.family,
                 "language": request.accept_languages.best,
                 "timezone": request.form.get("timezone", "UTC"),
-                "user_id": current_user.id if current_user.is_authenticated else None,
+                "user_id": user_id,
+                "created_at": datetime.datetime.utcnow(),
             }
+            rows = collect_answers(
+                db_session, survey, request.form, request.files, answer_data, current_app.config["UPLOAD_FOLDER"],
+            )
 
-            # Process each question
-            print("DEBUG")
-            print(request.form)
-            print("FILES")
-            print(request.files)
-
-            for question in survey.questions:
-                answer = Answer(question_id=question.id, **answer_data)
-
-                if question.type == QuestionType.FILE:
-                    file = request.files.get(f"q_{question.id}")
-                    if file and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        file.save(os.path.join(
-                            current_app.config["UPLOAD_FOLDER"],
-                            filename,
-                        ))
-                        answer.file_path = filename
-                else:
-                    # Process other question types
-
-                    # ... save logic
-
-                    if question.type in [
-                        QuestionType.SINGLE_CHOICE,
-                        QuestionType.MULTIPLE_CHOICE,
-                        QuestionType.LIMITED_CHOICE,
-                    ]:
-                        answer = None
-
-                        values = request.form.getlist(f"q_{question.id}")
-                        # request.form.get(f"q_{question.id}")
-                        print("values!", values)
-                        for value in values:
-                            _answer = Answer(question_id=question.id, **answer_data)
-
-                            # value = request.form.get(f"q_{question.id}")
-                            value = int(value)
-                            try:
-                                _answer.text_response = db_session.query(
-                                    Option,
-                                ).filter(
-                                    Option.id == value,
-                                    Option.question_id == question.id,
-                                ).first().text
-                            except Exception as e:
-                                print(1, e, e.__class__.__name__)
-                                raise e
-
-                            try:
-                                db_session.add(_answer)
-                            except Exception as e:
-                                print(2, e, e.__class__.__name__)
-                                raise e
-
-                    else:
-                        value = request.form.get(f"q_{question.id}")
-                        print(value)
-                        answer.text_response = value
-
-                if answer:
-                    db_session.add(answer)
-
-
-
-            db_session.commit()
+            buffer = current_app.extensions.get("submission_buffer")
+            if buffer is not None and buffer.accepting():
+                # Acknowledged once journaled, the flusher writes it to the database
+                if not buffer.append(id, dedup_key(user_id, request.remote_addr), rows):
+                    flash("You have already taken this survey", "warning")
+                    return redirect(url_for("survey.view", id=id))
+            else:
+                persist_submission(db_session, rows)
+                db_session.commit()
+            metrics.SUBMISSIONS.labels(survey_id=str(id)).inc()
 
             flash("Thank you for your participation!", "success")
             return redirect(url_for("survey.view", id=id))
 
         except Exception as e:
             db_session.rollback()
-            print(e)
-            print(e.__class__.__name__, dir(e))
+            current_app.logger.exception("Failed to save answers to survey %s", id)
             flash(f"Error: {str(e)}", "danger")
 
     return render_template("survey/take.html", survey=survey, QuestionType=QuestionType)
@@ -297,9 +227,10 @@ def delete(survey_id):
         return redirect(url_for("survey.user_surveys"))
 
     if request.method == "POST":
-        db_session.delete(survey)
-        db_session.commit()
-        flash("Survey deleted", "success")
+        if jobs.run_or_submit(db_session, "delete_survey", survey_id, current_user.id) is None:
+            flash("Survey deleted", "success")
+        else:
+            flash("Survey is being deleted, it will disappear from the list in a few minutes", "info")
         return redirect(url_for("survey.user_surveys"))
 
     return render_template("survey/delete.html", survey=survey)
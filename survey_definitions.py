@@ -0,0 +1,254 @@
+# survey_definitions.py
+"""
+Survey structure module.
+Question definitions come from the survey builder form (see survey.parse_questions_form) or JSON (parse_survey_json).
+create_surveys() inserts whole surveys with a few bulk statements; apply_definitions() applies definitions
+to a stored survey as a diff: questions and options are matched by id, only changed rows are updated, new ones
+inserted and removed ones deleted. Ids of kept questions and options don't change, so their answers stay valid.
+"""
+import sqlalchemy as sa
+
+from ORM.models import Survey, Question, QuestionType, CHOICE_TYPES, Option, Answer, AnswerOption
+import bitmaps
+import sketches
+import text_analytics
+
+# Column sizes
+MAX_TITLE = 100
+MAX_QUESTION_TEXT = 500
+MAX_OPTION_TEXT = 200
+
+QUESTION_FIELDS = {"text": "text", "type": "type", "required": "is_required", "limit": "choice_limit"}
+
+
+def _load(db_session, survey_id):
+    questions = {
+        row.id: row for row in db_session.execute(
+            sa.select(Question.id, Question.text, Question.type, Question.is_required, Question.choice_limit)
+            .where(Question.survey_id == survey_id),
+        )
+    }
+    options = {
+        row.id: row for row in db_session.execute(
+            sa.select(Option.id, Option.question_id, Option.text)
+            .join(Question, Question.id == Option.question_id)
+            .where(Question.survey_id == survey_id),
+        )
+    }
+    return questions, options
+
+
+def _string(value, path, max_length, required=True):
+    if value is None and not required:
+        return ""
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise ValueError(f"{path}: non-empty string expected")
+    if len(value) > max_length:
+        raise ValueError(f"{path}: longer than {max_length} characters")
+    return value
+
+
+def _bool(value, path, default):
+    if value is None:
+        return default
+    if not isinstance(value, bool):
+        raise ValueError(f"{path}: boolean expected")
+    return value
+
+
+def parse_question_json(data, path="question"):
+    """
+    Validates {"text", "type", "required", "options": [...], "limit"} into a question definition.
+    Raises ValueError with the path of the invalid field.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: object expected")
+    try:
+        question_type = QuestionType(data.get("type"))
+    except ValueError:
+        raise ValueError(f"{path}.type: one of {', '.join(t.value for t in QuestionType)} expected") from None
+
+    options = data.get("options") or []
+    if not isinstance(options, list):
+        raise ValueError(f"{path}.options: list expected")
+    if question_type in CHOICE_TYPES and not options:
+        raise ValueError(f"{path}.options: choice questions need options")
+    if question_type not in CHOICE_TYPES and options:
+        raise ValueError(f"{path}.options: only choice questions have options")
+
+    limit = None
+    if question_type == QuestionType.LIMITED_CHOICE:
+        limit = data.get("limit", 1)
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise ValueError(f"{path}.limit: positive integer expected")
+
+    return {
+        "id": None,
+        "text": _string(data.get("text"), f"{path}.text", MAX_QUESTION_TEXT),
+        "type": question_type,
+        "required": _bool(data.get("required"), f"{path}.required", False),
+        "options": [_string(text, f"{path}.options[{index}]", MAX_OPTION_TEXT) for index, text in enumerate(options)],
+        "option_ids": [None] * len(options),
+        "limit": limit,
+    }
+
+
+def parse_survey_json(data, path="survey"):
+    """
+    Validates a nested survey definition: {"title", "description", "is_active", "require_login", "questions": [...]}.
+    Returns (survey columns, question definitions), raises ValueError with the path of the invalid field.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: object expected")
+    questions = data.get("questions") or []
+    if not isinstance(questions, list):
+        raise ValueError(f"{path}.questions: list expected")
+
+    survey = {
+        "title": _string(data.get("title"), f"{path}.title", MAX_TITLE),
+        "description": _string(data.get("description"), f"{path}.description", 65535, required=False),
+        "is_active": _bool(data.get("is_active"), f"{path}.is_active", True),
+        "require_login": _bool(data.get("require_login"), f"{path}.require_login", False),
+    }
+    definitions = [
+        parse_question_json(question, f"{path}.questions[{index}]") for index, question in enumerate(questions)
+    ]
+    return survey, definitions
+
+
+def insert_questions(db_session, survey_definitions):
+    """
+    Inserts questions with their options for [(survey_id, definitions)] with two bulk statements,
+    sets ids of inserted questions into definitions
+    """
+    pairs = [(survey_id, definition) for survey_id, definitions in survey_definitions for definition in definitions]
+    if not pairs:
+        return
+    question_ids = db_session.scalars(
+        sa.insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        [{
+            "survey_id": survey_id,
+            "text": definition["text"],
+            "type": definition["type"],
+            "is_required": definition["required"],
+            "choice_limit": definition["limit"],
+        } for survey_id, definition in pairs],
+    ).all()
+
+    options = []
+    for (_, definition), question_id in zip(pairs, question_ids):
+        definition["id"] = question_id
+        options.extend({"question_id": question_id, "text": text} for text in definition["options"])
+    if options:
+        db_session.execute(sa.insert(Option), options)
+
+
+def create_surveys(db_session, author_id, surveys):
+    """
+    Creates surveys [(survey columns, definitions)] of the author with bulk inserts, returns their ids.
+    Commit is up to the caller.
+    """
+    if not surveys:
+        return []
+    survey_ids = db_session.scalars(
+        sa.insert(Survey).returning(Survey.id, sort_by_parameter_order=True),
+        [{**columns, "author_id": author_id} for columns, _ in surveys],
+    ).all()
+    insert_questions(db_session, [(survey_id, definitions) for survey_id, (_, definitions) in zip(survey_ids, surveys)])
+    return survey_ids
+
+
+def _delete_answers(db_session, condition):
+    answer_ids = sa.select(Answer.id).where(condition).scalar_subquery()
+    db_session.execute(sa.delete(AnswerOption).where(AnswerOption.answer_id.in_(answer_ids)))
+    db_session.execute(sa.delete(Answer).where(condition))
+
+
+def apply_definitions(db_session, survey_id, definitions):
+    """
+    Makes questions of the survey match definitions (dicts with id, text, type, required, limit, options,
+    option_ids; id and option ids are None for new ones). Commit is up to the caller.
+    Returns counts of inserted, updated and deleted questions and options.
+    """
+    stored_questions, stored_options = _load(db_session, survey_id)
+
+    question_updates = []
+    new_questions = []
+    kept_questions = []
+    kept_question_ids = set()
+    for definition in definitions:
+        question_id = definition.get("id")
+        if question_id not in stored_questions or question_id in kept_question_ids:
+            # Ids of other surveys (or repeated ones) aren't trusted, such questions are created
+            new_questions.append(definition)
+            continue
+        kept_questions.append(definition)
+        kept_question_ids.add(question_id)
+        stored = stored_questions[question_id]
+        changes = {
+            column: definition[field] for field, column in QUESTION_FIELDS.items()
+            if getattr(stored, column) != definition[field]
+        }
+        if changes:
+            question_updates.append({"id": question_id, **changes})
+
+    deleted_question_ids = set(stored_questions) - kept_question_ids
+    if deleted_question_ids:
+        # Answers of removed questions can't be shown anymore
+        _delete_answers(db_session, Answer.question_id.in_(deleted_question_ids))
+        text_analytics.forget_questions(db_session, deleted_question_ids)
+        sketches.forget(db_session, survey_id, "question", [str(question_id) for question_id in deleted_question_ids])
+        bitmaps.forget_options(
+            db_session, sa.select(Option.id).where(Option.question_id.in_(deleted_question_ids)).scalar_subquery(),
+        )
+        db_session.execute(sa.delete(Option).where(Option.question_id.in_(deleted_question_ids)))
+        db_session.execute(sa.delete(Question).where(Question.id.in_(deleted_question_ids)))
+
+    if question_updates:
+        # Bulk update by primary key, rows are grouped by the set of changed columns
+        db_session.execute(sa.update(Question), question_updates)
+        # Answers kept by a question of another type are summarized again (or dropped from analytics)
+        retyped = [update["id"] for update in question_updates if "type" in update]
+        if retyped:
+            text_analytics.rebuild(db_session, retyped)
+            bitmaps.reindex_questions(db_session, retyped)
+
+    insert_questions(db_session, [(survey_id, new_questions)])
+
+    option_updates = []
+    new_options = []
+    kept_option_ids = set()
+    for definition in kept_questions:
+        question_id = definition["id"]
+        option_ids = definition.get("option_ids") or [None] * len(definition["options"])
+        for option_id, text in zip(option_ids, definition["options"]):
+            stored = stored_options.get(option_id)
+            if stored is None or stored.question_id != question_id or option_id in kept_option_ids:
+                new_options.append({"question_id": question_id, "text": text})
+                continue
+            kept_option_ids.add(option_id)
+            if stored.text != text:
+                # Answers reference options by id, renaming doesn't touch them
+                option_updates.append({"id": option_id, "text": text})
+
+    deleted_option_ids = {
+        option_id for option_id, option in stored_options.items()
+        if option_id not in kept_option_ids and option.question_id not in deleted_question_ids
+    }
+    if deleted_option_ids:
+        db_session.execute(sa.delete(AnswerOption).where(AnswerOption.option_id.in_(deleted_option_ids)))
+        bitmaps.forget_options(db_session, deleted_option_ids)
+        db_session.execute(sa.delete(Option).where(Option.id.in_(deleted_option_ids)))
+    if option_updates:
+        db_session.execute(sa.update(Option), option_updates)
+    if new_options:
+        db_session.execute(sa.insert(Option), new_options)
+
+    return {
+        "questions_inserted": len(new_questions),
+        "questions_updated": len(question_updates),
+        "questions_deleted": len(deleted_question_ids),
+        "options_inserted": len(new_options) + sum(len(definition["options"]) for definition in new_questions),
+        "options_updated": len(option_updates),
+        "options_deleted": len(deleted_option_ids),
+    }
@@ -8,6 +8,10 @@ import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Test database, the engine is created with it on first use
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["DB_FILE_PATH"] = os.path.join(tempfile.gettempdir(), "questionnaire_test.sqlite3")
+
 from app import app as flask_app
 from db import global_init, create_session, SqlAlchemyBase
 from ORM.models import User, Survey, Question, QuestionType, Option, Answer
@@ -24,10 +28,6 @@ def get_unique_user_data():
 @pytest.fixture(scope="function", autouse=True)
 def reset_db():
     """Reset database before each test."""
-    # Set environment variables for testing
-    os.environ["DB_TYPE"] = "sqlite"
-    os.environ["DB_FILE_PATH"] = ":memory:"
-
     # Initialize database
     global_init()
 
@@ -51,6 +51,9 @@ def app():
         "UPLOAD_FOLDER": tempfile.mkdtemp(),
         "JWT_ACCESS_TOKEN_EXPIRES": datetime.timedelta(hours=1),
         "JWT_REFRESH_TOKEN_EXPIRES": datetime.timedelta(days=30),
+        "RATELIMIT_ENABLED": False,
+        "JOB_WORKER": False,
+        "ANALYTICS_WORKER": False,
     })
 
     # Create a test context
@@ -1,6 +1,6 @@
 import pytest
 import json
-from ORM.models import Survey, Question, Answer, User
+from ORM.models import Survey, Question, Option, Answer, User
 
 def test_api_get_surveys(client, auth_headers, test_survey):
     """Test GET /api/surveys endpoint."""
@@ -79,6 +79,65 @@ def test_api_create_survey(client, auth_headers):
     assert created_survey["description"] == survey_data["description"]
     assert "id" in created_survey  # Should have an ID
 
+def test_api_create_survey_with_questions(client, auth_headers, db_session):
+    """Test POST /api/surveys stores the nested definition."""
+    response = client.post("/api/surveys", headers=auth_headers, json={
+        "title": "Nested",
+        "questions": [
+            {"text": "Name", "type": "text", "required": True},
+            {"text": "Pick two", "type": "limited_choice", "options": ["A", "B", "C"], "limit": 2},
+        ],
+    })
+
+    assert response.status_code == 201
+    name, pick = response.json["questions"]
+    assert name["is_required"] is True and name["options"] == []
+    assert pick["choice_limit"] == 2
+    assert [option["text"] for option in pick["options"]] == ["A", "B", "C"]
+    assert db_session.query(Option).filter(Option.question_id == pick["id"]).count() == 3
+
+
+def test_api_create_survey_invalid(client, auth_headers, db_session):
+    """Test invalid definitions are rejected with the field path and nothing is stored."""
+    response = client.post("/api/surveys", headers=auth_headers, json={
+        "title": "Broken",
+        "questions": [{"text": "Color", "type": "single_choice"}],
+    })
+
+    assert response.status_code == 400
+    assert response.json["msg"].startswith("survey.questions[0].options")
+    assert db_session.query(Survey).filter(Survey.title == "Broken").count() == 0
+
+
+def test_api_import_surveys(client, auth_headers, test_user, db_session):
+    """Test POST /api/surveys/import creates all surveys of the caller."""
+    surveys = [{
+        "title": f"Imported {index}",
+        "questions": [{"text": "Rate us", "type": "single_choice", "options": ["1", "2", "3"]}],
+    } for index in range(25)]
+
+    response = client.post("/api/surveys/import", headers=auth_headers, json={"surveys": surveys})
+
+    assert response.status_code == 201
+    assert response.json["count"] == 25
+    imported = db_session.query(Survey).filter(Survey.id.in_(response.json["ids"])).order_by(Survey.id).all()
+    assert [survey.title for survey in imported] == [f"Imported {index}" for index in range(25)]
+    assert all(survey.author_id == test_user.id for survey in imported)
+    assert [len(survey.questions[0].options) for survey in imported] == [3] * 25
+
+
+def test_api_import_surveys_all_or_nothing(client, auth_headers, db_session):
+    """Test one invalid survey rejects the whole import."""
+    response = client.post("/api/surveys/import", headers=auth_headers, json=[
+        {"title": "Fine"},
+        {"title": "", "questions": [{"text": "Q", "type": "unknown"}]},
+    ])
+
+    assert response.status_code == 400
+    assert response.json["errors"] == ["surveys[1].title: non-empty string expected"]
+    assert db_session.query(Survey).filter(Survey.title == "Fine").count() == 0
+
+
 def test_api_update_survey(client, auth_headers, test_user, test_survey, db_session):
     """Test PUT /api/surveys/{id} endpoint."""
     # В некоторых реализациях автор опроса может не совпадать из-за различных способов создания тестовых данных
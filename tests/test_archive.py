@@ -0,0 +1,139 @@
+import datetime
+
+import sqlalchemy as sa
+
+import archive
+import stats
+import analytics
+import text_analytics
+from ORM.models import Survey, Answer, AnswerOption, ArchivedAnswer, SurveySnapshot, QuestionType
+
+
+def login(client, user):
+    client.post("/auth/login", data={"username": user.username, "password": user.raw_password})
+
+
+def add_answers(db_session, survey, days_ago=365, analyze=True):
+    """Answers of two respondents, choice ones with answer_options rows."""
+    created_at = datetime.datetime.utcnow() - datetime.timedelta(days=days_ago)
+    text = next(q for q in survey.questions if q.type == QuestionType.TEXT)
+    choice = next(q for q in survey.questions if q.type == QuestionType.SINGLE_CHOICE)
+    for ip, name, color in (("10.0.0.1", "Alice", "Red"), ("10.0.0.2", "Bob", "Blue")):
+        meta = {"ip_address": ip, "browser": "Firefox", "created_at": created_at}
+        db_session.add(Answer(question_id=text.id, text_response=name, **meta))
+        answer = Answer(question_id=choice.id, **meta)
+        db_session.add(answer)
+        db_session.flush()
+        option = next(option for option in choice.options if option.text == color)
+        db_session.add(AnswerOption(answer_id=answer.id, option_id=option.id))
+    survey.is_active = False
+    db_session.commit()
+    if analyze:
+        analytics.run_pending(db_session)
+    return text, choice
+
+
+def test_compute_stats(db_session, test_survey):
+    """Test aggregates computed by queries."""
+    text, choice = add_answers(db_session, test_survey)
+
+    result = stats.compute_stats(db_session, test_survey.id)
+
+    assert result["total_responses"] == 2 and result["answers"] == 4
+    assert result["browsers"] == {"Firefox": 4}
+    by_id = {stat["id"]: stat for stat in result["stats"]}
+    assert by_id[text.id]["text_stats"]["avg_length"] == 4.0
+    assert dict(zip(by_id[choice.id]["chart_labels"], by_id[choice.id]["chart_values"]))["Blue"] == 1
+
+
+def test_archivable_surveys(db_session, test_survey):
+    """Test only inactive surveys without recent answers are archived."""
+    add_answers(db_session, test_survey, days_ago=10)
+
+    assert archive.archivable_surveys(db_session, days=30) == []
+    assert archive.archivable_surveys(db_session, days=5) == [test_survey.id]
+
+    test_survey.is_active = True
+    db_session.commit()
+    assert archive.archivable_surveys(db_session, days=5) == []
+
+
+def test_archived_stats_stay_the_same(client, db_session, test_user, test_survey):
+    """Test answers are moved in batches and stats are served from the snapshot."""
+    add_answers(db_session, test_survey)
+    login(client, test_user)
+    url = f"/api/survey/{test_survey.id}/stats-data"
+    before = client.get(url).json
+
+    assert archive.archive_survey(db_session, test_survey.id, batch_size=3) == 4
+
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(Answer)) == 0
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(AnswerOption)) == 0
+    assert db_session.get(SurveySnapshot, test_survey.id).answers_count == 4
+    after = client.get(url).json
+    assert after.pop("archived_at") is not None
+    before.pop("archived_at")
+    assert after == before
+    assert client.get(f"/survey/{test_survey.id}/stats").status_code == 200
+
+
+def test_pending_answers_analyzed_before_archiving(db_session, test_survey):
+    """Test answers the consumer hasn't got to are in the snapshot and analyzed when restored."""
+    text, _ = add_answers(db_session, test_survey, analyze=False)
+
+    archive.archive_survey(db_session, test_survey.id)
+
+    snapshot = stats.survey_stats(db_session, test_survey.id)
+    text_stats = next(question for question in snapshot["stats"] if question["id"] == text.id)["text_stats"]
+    assert text_stats["unique_responses"] == 2
+    assert archive.restore_survey(db_session, test_survey.id) == 4
+    assert not analytics.pending(db_session, test_survey.id)
+    assert text_analytics.question_stats(db_session, [text.id])[text.id]["unique_responses"] == 2
+
+
+def test_restore(db_session, test_survey):
+    """Test restoring brings answers and answer_options back."""
+    add_answers(db_session, test_survey)
+    answer_ids = db_session.scalars(sa.select(Answer.id).order_by(Answer.id)).all()
+    archive.archive_survey(db_session, test_survey.id)
+
+    assert archive.restore_survey(db_session, test_survey.id, batch_size=3) == 4
+
+    assert db_session.scalars(sa.select(Answer.id).order_by(Answer.id)).all() == answer_ids
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(AnswerOption)) == 2
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(ArchivedAnswer)) == 0
+    assert db_session.get(SurveySnapshot, test_survey.id) is None
+
+
+def test_closed_survey_takes_no_answers(client, db_session, test_survey):
+    """Test inactive surveys can't be taken."""
+    test_survey.is_active = False
+    db_session.commit()
+
+    response = client.post(f"/surveys/{test_survey.id}/take", data={})
+
+    assert response.status_code == 302
+    assert db_session.query(Survey).get(test_survey.id).questions[0].answers == []
+
+
+def test_archived_survey_cant_be_reopened(client, auth_headers, db_session, test_survey):
+    """Test reopening is refused until answers are restored, then new answers show up in live stats."""
+    text, _ = add_answers(db_session, test_survey)
+    archive.archive_survey(db_session, test_survey.id)
+    url = f"/api/surveys/{test_survey.id}"
+    take = f"/surveys/{test_survey.id}/take"
+
+    assert client.put(url, json={"is_active": True}, headers=auth_headers).status_code == 409
+    client.post(take, data={f"q_{text.id}": "Carol"}, environ_base={"REMOTE_ADDR": "10.0.0.3"})
+    db_session.expire_all()
+    assert db_session.get(Survey, test_survey.id).is_active is False
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(Answer)) == 0
+
+    archive.restore_survey(db_session, test_survey.id)
+    assert client.put(url, json={"is_active": True}, headers=auth_headers).status_code == 200
+    client.post(take, data={f"q_{text.id}": "Carol"}, environ_base={"REMOTE_ADDR": "10.0.0.3"})
+
+    result = stats.survey_stats(db_session, test_survey.id)
+    assert result["archived_at"] is None and result["answers"] == 5
+    by_id = {stat["id"]: stat for stat in result["stats"]}
+    assert "Carol" in by_id[text.id]["text_stats"]["responses"]
@@ -0,0 +1,111 @@
+import csv
+import io
+
+import numpy as np
+
+from ORM.models import Answer, QuestionType
+from submissions import persist_submission
+import analytics
+import bitmaps
+
+
+def test_containers_pick_smallest_encoding():
+    """Test chunks are stored as arrays, runs or bitsets, whichever is smallest, and decoded back."""
+    rng = np.random.default_rng(1)
+    cases = {
+        bitmaps.ARRAY: [3, 700, 65535],
+        bitmaps.RUNS: range(10000, 50000),
+        bitmaps.BITSET: np.flatnonzero(rng.random(bitmaps.CHUNK_SIZE) < 0.5),
+    }
+    for kind, ordinals in cases.items():
+        words = bitmaps.Bitmap.from_ordinals(ordinals).chunks[0]
+        container = bitmaps.encode(words)
+        assert container[0] == kind
+        assert np.array_equal(bitmaps.decode(container), words)
+    assert len(bitmaps.encode(bitmaps.Bitmap.from_ordinals(range(10000, 50000)).chunks[0])) == 5
+
+
+def test_bitmap_operations():
+    """Test set operations across chunks."""
+    a = bitmaps.Bitmap.from_ordinals([1, 5, 70000, 140000])
+    b = bitmaps.Bitmap.from_ordinals([5, 140000, 200000])
+
+    assert (a & b).ordinals().tolist() == [5, 140000]
+    assert (a | b).ordinals().tolist() == [1, 5, 70000, 140000, 200000]
+    assert (a - b).ordinals().tolist() == [1, 70000]
+    assert len(bitmaps.Bitmap.universe(70000) - a) == 69998
+    assert len(bitmaps.Bitmap()) == 0
+
+
+def option_ids(survey):
+    return {option.text: option.id for question in survey.questions for option in question.options}
+
+
+def submit(db_session, survey, ip, color, name="Ann", analyze=True):
+    questions = {question.type: question.id for question in survey.questions}
+    rows = [{"question_id": questions[QuestionType.TEXT], "text_response": name, "ip_address": ip}]
+    if color is not None:
+        rows.append({
+            "question_id": questions[QuestionType.SINGLE_CHOICE], "option_ids": [option_ids(survey)[color]],
+            "ip_address": ip,
+        })
+    persist_submission(db_session, rows)
+    db_session.commit()
+    if analyze:
+        analytics.run_pending(db_session)
+
+
+def test_submissions_update_bitmaps(client, admin_auth_headers, db_session, test_survey):
+    """Test submissions number respondents and set option bits, deleted answers clear them."""
+    submit(db_session, test_survey, "10.0.0.1", "Red")
+    submit(db_session, test_survey, "10.0.0.2", "Blue")
+    submit(db_session, test_survey, "10.0.0.3", None)
+    options = option_ids(test_survey)
+
+    assert bitmaps.respondent_count(db_session, test_survey.id) == 3
+    assert bitmaps.matching(db_session, test_survey.id, [(options["Red"], True)]).ordinals().tolist() == [0]
+    not_red = bitmaps.matching(db_session, test_survey.id, [(options["Red"], False), (options["Green"], False)])
+    assert not_red.ordinals().tolist() == [1, 2]
+
+    answer = db_session.query(Answer).filter(Answer.options.any(id=options["Blue"])).one()
+    assert client.delete(f"/api/answers/{answer.id}", headers=admin_auth_headers).status_code == 200
+    assert len(bitmaps.matching(db_session, test_survey.id, [(options["Blue"], True)])) == 0
+
+    bitmaps.rebuild(db_session, test_survey.id)
+    assert bitmaps.respondent_count(db_session, test_survey.id) == 3
+    assert bitmaps.matching(db_session, test_survey.id, [(options["Red"], True)]).ordinals().tolist() == [0]
+
+
+def test_export_filtered_respondents(client, auth_headers, db_session, test_survey):
+    """Test the export streams answers of respondents matching the filter as CSV."""
+    submit(db_session, test_survey, "10.0.0.1", "Red", "Ann")
+    submit(db_session, test_survey, "10.0.0.2", "Blue", "Bob")
+    url = f"/api/surveys/{test_survey.id}/respondents/export"
+
+    response = client.get(url, query_string={"filter": f"-{option_ids(test_survey)['Red']}"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0][:3] == ["respondent", "user_id", "ip_address"]
+    assert len(rows) == 2
+    assert rows[1][:3] == ["1", "", "10.0.0.2"] and "Blue" in rows[1] and "Bob" in rows[1]
+    assert client.get(url, query_string={"filter": "999999"}, headers=auth_headers).status_code == 400
+
+
+def test_consumer_batch_matches_rebuild(db_session, test_survey):
+    """Test bitmaps of answers analyzed in one batch equal the ones rebuilt from answers."""
+    colors = ["Red", "Blue", None, "Red", "Green"]
+    for n, color in enumerate(colors):
+        submit(db_session, test_survey, f"10.0.0.{n}", color, analyze=False)
+    assert analytics.run_pending(db_session) == 9
+    options = option_ids(test_survey)
+    before = {color: bitmaps.matching(db_session, test_survey.id, [(options[color], True)]).ordinals().tolist()
+              for color in ("Red", "Blue", "Green")}
+
+    bitmaps.rebuild(db_session, test_survey.id)
+    db_session.commit()
+
+    assert before == {"Red": [0, 3], "Blue": [1], "Green": [4]}
+    assert {color: bitmaps.matching(db_session, test_survey.id, [(options[color], True)]).ordinals().tolist()
+            for color in before} == before
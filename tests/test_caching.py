@@ -0,0 +1,88 @@
+from ORM.models import Answer, QuestionType
+import analytics
+
+
+def login(client, user):
+    client.post("/auth/login", data={
+        "username": user.username,
+        "password": user.raw_password,
+    })
+
+
+def test_api_survey_not_modified(client, auth_headers, test_survey):
+    """Test conditional GET of a survey returns 304 for the current ETag."""
+    response = client.get(f"/api/surveys/{test_survey.id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get(f"/api/surveys/{test_survey.id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_compressed_survey_not_modified(app, client, auth_headers, test_survey, monkeypatch):
+    """Test 304 repeats the weak ETag of the compressed 200."""
+    monkeypatch.setitem(app.config, "COMPRESS_MIN_SIZE", 0)
+    headers = {**auth_headers, "Accept-Encoding": "gzip"}
+    response = client.get(f"/api/surveys/{test_survey.id}", headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get(f"/api/surveys/{test_survey.id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_api_survey_etag_changes_on_update(client, auth_headers, test_survey):
+    """Test updating a survey invalidates its ETag."""
+    etag = client.get(f"/api/surveys/{test_survey.id}", headers=auth_headers).headers["ETag"]
+
+    response = client.put(f"/api/surveys/{test_survey.id}", headers=auth_headers, json={"title": "Renamed"})
+    assert response.status_code == 200
+
+    response = client.get(f"/api/surveys/{test_survey.id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["title"] == "Renamed"
+    assert response.headers["ETag"] != etag
+
+
+def test_api_survey_not_found_has_no_etag(client, auth_headers):
+    """Test missing surveys are not cached."""
+    response = client.get("/api/surveys/999999", headers=auth_headers)
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+def test_stats_etag_changes_on_new_answer(client, db_session, test_user, test_survey):
+    """Test a new answer invalidates stats ETag."""
+    login(client, test_user)
+    url = f"/api/survey/{test_survey.id}/stats-data"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert "max-age=5" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    question = next(q for q in test_survey.questions if q.type == QuestionType.TEXT)
+    db_session.add(Answer(question_id=question.id, text_response="New", ip_address="127.0.0.1", user_agent="Test"))
+    db_session.commit()
+    # Not cached until the answer is analyzed
+    assert "ETag" not in client.get(url).headers
+    analytics.run_pending(db_session)
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_edit_data_etag_not_shared_with_other_users(client, admin_user, test_survey):
+    """Test edit data of another author is not answered with 304."""
+    login(client, admin_user)
+    response = client.get(f"/api/survey/{test_survey.id}/edit-data", headers={"If-None-Match": "*"})
+    assert response.status_code != 304
+    assert "ETag" not in response.headers
@@ -0,0 +1,75 @@
+import gzip
+import shutil
+
+import pytest
+
+import build_assets
+import compression
+
+
+@pytest.fixture
+def built_static(app, tmp_path, monkeypatch):
+    """Static folder copy with built assets."""
+    static_folder = tmp_path / "static"
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns("uploads", "dist"))
+    manifest = build_assets.build(str(static_folder), log=lambda message: None)
+    monkeypatch.setattr(app, "static_folder", str(static_folder))
+    monkeypatch.setitem(app.config, "ASSET_MANIFEST", manifest)
+    return manifest
+
+
+def test_dynamic_response_gzip(app, client, auth_headers, test_survey, monkeypatch):
+    """Test JSON responses are compressed when the client accepts gzip."""
+    monkeypatch.setitem(app.config, "COMPRESS_MIN_SIZE", 0)
+    plain = client.get(f"/api/surveys/{test_survey.id}", headers=auth_headers)
+    assert "Content-Encoding" not in plain.headers
+
+    response = client.get(f"/api/surveys/{test_survey.id}", headers={**auth_headers, "Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.headers["ETag"].startswith("W/")
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_small_response_not_compressed(client, auth_headers):
+    """Test bodies below COMPRESS_MIN_SIZE are sent as is."""
+    response = client.get("/api/surveys", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_compress_stream():
+    """Test streamed responses are compressed chunk by chunk."""
+    level = {"gzip": 6, "br": 4}
+    chunks = list(compression.compress_stream(iter(["id,text\n", b"1,a\n" * 1000]), "gzip", level))
+
+    assert len(chunks) > 1
+    assert gzip.decompress(b"".join(chunks)) == b"id,text\n" + b"1,a\n" * 1000
+
+
+def test_build_assets(built_static, app):
+    """Test build writes fingerprinted files with precompressed variants."""
+    built = built_static["swagger.json"]
+    assert built.startswith("dist/swagger.") and built.endswith(".json")
+    with open(f"{app.static_folder}/{built}.gz", "rb") as file:
+        with open(f"{app.static_folder}/swagger.json", "rb") as source:
+            assert gzip.decompress(file.read()) == source.read()
+
+
+def test_fingerprinted_asset_served_precompressed(built_static, client):
+    """Test fingerprinted assets are precompressed and cached forever."""
+    response = client.get(f"/static/{built_static['swagger.json']}", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "application/json"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.cache_control.max_age == compression.ASSET_MAX_AGE
+    assert b"swagger" in gzip.decompress(response.get_data())
+
+
+def test_asset_url(built_static, app):
+    """Test asset_url resolves names through the manifest."""
+    with app.test_request_context():
+        assert compression.asset_url("main.js") == f"/static/{built_static['main.js']}"
+        assert compression.asset_url("unknown.js") == "/static/unknown.js"
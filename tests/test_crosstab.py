@@ -0,0 +1,95 @@
+import os
+import sys
+import subprocess
+
+from ORM.models import Option, Question, QuestionType
+from submissions import persist_submission
+import analytics
+import crosstab
+
+
+def add_color_question(db_session, survey):
+    question = Question(survey_id=survey.id, type=QuestionType.MULTIPLE_CHOICE, text="Pets?")
+    db_session.add(question)
+    db_session.flush()
+    db_session.add_all(Option(question_id=question.id, text=text) for text in ("Cat", "Dog"))
+    db_session.commit()
+    return question
+
+
+def option_id(survey, text):
+    return next(option.id for question in survey.questions for option in question.options if option.text == text)
+
+
+def submit(db_session, survey, ip, color, pets):
+    questions = {question.text: question for question in survey.questions}
+    rows = [
+        {"question_id": questions["What is your favorite color?"].id, "option_ids": [option_id(survey, color)]},
+        {"question_id": questions["Pets?"].id, "option_ids": [option_id(survey, pet) for pet in pets]},
+    ]
+    persist_submission(db_session, [{**row, "ip_address": ip} for row in rows])
+    db_session.commit()
+    analytics.run_pending(db_session)
+
+
+def test_matrix_filters_and_crosstabs(db_session, test_survey):
+    """Test segment filters and crosstabs over the respondent x option matrix."""
+    pets = add_color_question(db_session, test_survey)
+    color = next(q for q in test_survey.questions if q.type == QuestionType.SINGLE_CHOICE)
+    submit(db_session, test_survey, "10.0.0.1", "Red", ["Cat", "Dog"])
+    submit(db_session, test_survey, "10.0.0.2", "Red", ["Dog"])
+    submit(db_session, test_survey, "10.0.0.3", "Blue", ["Cat"])
+    matrix = crosstab.load_matrix(db_session, test_survey.id)
+
+    terms = crosstab.parse_filter(f"{option_id(test_survey, 'Red')},-{option_id(test_survey, 'Cat')}")
+    red_without_cat = matrix.mask(terms)
+    assert red_without_cat.sum() == 1
+    assert matrix.distribution(pets.id, red_without_cat)[1].tolist() == [0, 1]
+
+    result = crosstab.crosstab(matrix, color.id, pets.id, [])
+    assert result["respondents"] == 3
+    assert [option["text"] for option in result["rows"]["options"]] == ["Red", "Green", "Blue", "Yellow"]
+    assert result["counts"] == [[1, 2], [0, 0], [1, 0], [0, 0]]
+    assert result["row_percentages"][0] == [50.0, 100.0]
+
+
+def test_crosstab_endpoint_adds_new_answers(client, auth_headers, db_session, test_survey):
+    """Test the cached matrix picks up new submissions and is reloaded after edits."""
+    pets = add_color_question(db_session, test_survey)
+    color = next(q for q in test_survey.questions if q.type == QuestionType.SINGLE_CHOICE)
+    url = f"/api/surveys/{test_survey.id}/crosstab"
+    query = {"rows": color.id, "columns": pets.id}
+    submit(db_session, test_survey, "10.0.0.1", "Red", ["Cat"])
+    assert client.get(url, query_string=query, headers=auth_headers).json["respondents"] == 1
+
+    submit(db_session, test_survey, "10.0.0.2", "Blue", ["Cat"])
+    response = client.get(url, query_string={**query, "filter": option_id(test_survey, "Blue")}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json["respondents"] == 1 and response.json["counts"][2] == [1, 0]
+    assert client.get(url, query_string={**query, "filter": "x"}, headers=auth_headers).status_code == 400
+    assert client.get(url, query_string={"rows": color.id, "columns": 0}, headers=auth_headers).status_code == 404
+
+
+def test_filtered_stats(client, db_session, test_user, test_survey):
+    """Test the stats endpoint limits choice stats to respondents matching the filter."""
+    add_color_question(db_session, test_survey)
+    submit(db_session, test_survey, "10.0.0.1", "Red", ["Cat"])
+    submit(db_session, test_survey, "10.0.0.2", "Blue", ["Dog"])
+    client.post("/auth/login", data={"username": test_user.username, "password": test_user.raw_password})
+
+    data = client.get(f"/api/survey/{test_survey.id}/stats-data",
+                      query_string={"filter": option_id(test_survey, "Dog")}).json
+
+    assert data["total_responses"] == 1
+    by_text = {stat["text"]: stat for stat in data["stats"]}
+    assert by_text["What is your favorite color?"]["chart_values"] == [0, 0, 1, 0]
+    assert "What is your name?" not in by_text
+    assert client.get(f"/survey/{test_survey.id}/stats", query_string={"filter": "-1"}).status_code == 200
+
+
+def test_app_import_skips_numpy():
+    """Test NumPy isn't imported with the app, only when a matrix or bitmap is used."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, app; sys.exit(int('numpy' in sys.modules))"
+    assert subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True).returncode == 0
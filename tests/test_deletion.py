@@ -0,0 +1,123 @@
+import sqlalchemy as sa
+
+import deletion
+from ORM.models import User, Survey, Question, Option, Answer, AnswerOption, Job
+
+
+def add_answers(db_session, survey, count, user_id=None):
+    """Adds choice answers with answer_options rows."""
+    question = next(q for q in survey.questions if q.options)
+    answers = [Answer(question_id=question.id, text_response="Red", user_id=user_id) for _ in range(count)]
+    db_session.add_all(answers)
+    db_session.flush()
+    db_session.add_all(AnswerOption(answer_id=answer.id, option_id=question.options[0].id) for answer in answers)
+    db_session.commit()
+
+
+def count(db_session, model):
+    return db_session.scalar(sa.select(sa.func.count()).select_from(model))
+
+
+def test_delete_survey_in_batches(db_session, test_survey):
+    """Test answers are deleted in committed batches and nothing is left."""
+    add_answers(db_session, test_survey, 25)
+    survey_id = test_survey.id
+    total = deletion.count_survey_rows(db_session, survey_id)
+    progress = []
+
+    done = deletion.delete_survey(db_session, survey_id, batch_size=10, on_batch=progress.append)
+
+    assert done == total == 25 + 9 + 3 + 1
+    assert progress == [10, 20, total]
+    for model in (Survey, Question, Option, Answer, AnswerOption):
+        assert count(db_session, model) == 0
+
+
+def test_delete_user_keeps_answers_to_other_surveys(db_session, test_survey, admin_user):
+    """Test surveys of the user are deleted and their other answers are anonymized."""
+    author_id = test_survey.author_id
+    other = Survey(title="Other", author_id=admin_user.id)
+    db_session.add(other)
+    db_session.flush()
+    question = Question(survey_id=other.id, text="Why?")
+    db_session.add(question)
+    db_session.add(Answer(question=question, text_response="Because", user_id=author_id))
+    db_session.commit()
+
+    deletion.delete_user(db_session, author_id, batch_size=10)
+
+    assert db_session.get(User, author_id) is None
+    assert db_session.scalars(sa.select(Survey.title)).all() == ["Other"]
+    assert db_session.scalars(sa.select(Answer.user_id)).all() == [None]
+
+
+def test_api_delete_big_survey_in_background(app, client, auth_headers, db_session, test_survey, monkeypatch):
+    """Test big surveys are deleted by a job whose progress is readable."""
+    monkeypatch.setitem(app.config, "JOB_INLINE_MAX", 10)
+    add_answers(db_session, test_survey, 20)
+    survey_id = test_survey.id
+
+    response = client.delete(f"/api/surveys/{survey_id}", headers=auth_headers)
+
+    assert response.status_code == 202
+    job = response.json["job"]
+    assert job["status"] == "pending" and job["total"] == 20 + 9 + 3 + 1
+    assert response.headers["Location"].endswith(f"/api/jobs/{job['id']}")
+    assert db_session.get(Survey, survey_id) is not None
+
+    assert app.extensions["jobs"].run_pending() == 1
+
+    status = client.get(f"/api/jobs/{job['id']}", headers=auth_headers).json
+    assert status["status"] == "done" and status["progress"] == 1
+    db_session.expire_all()
+    assert db_session.get(Survey, survey_id) is None
+
+
+def test_stale_job_is_taken_over(app, db_session, test_survey):
+    """Test running jobs without progress are claimed again."""
+    job = Job(kind="delete_survey", target_id=test_survey.id, status="running", total=1, done=0)
+    db_session.add(job)
+    db_session.commit()
+    runner = app.extensions["jobs"]
+
+    assert runner.claim(db_session) is None
+    db_session.execute(sa.update(Job).values(updated_at=job.updated_at.replace(year=2000)))
+    db_session.commit()
+
+    assert runner.claim(db_session) == job.id
+
+
+def test_taken_over_job_keeps_progress(app, db_session, test_survey):
+    """Test a job resumed by another worker counts on from its saved progress."""
+    add_answers(db_session, test_survey, 5)
+    job = Job(kind="delete_survey", target_id=test_survey.id, status="running", total=100, done=60)
+    db_session.add(job)
+    db_session.commit()
+
+    app.extensions["jobs"].run(db_session, job.id)
+
+    db_session.refresh(job)
+    assert job.status == "done" and job.done == 60 + 5 + 9 + 3 + 1
+
+
+def test_one_job_per_target(app, client, auth_headers, db_session, test_survey, monkeypatch):
+    """Test deleting a survey again returns the job already queued for it."""
+    monkeypatch.setitem(app.config, "JOB_INLINE_MAX", 10)
+    add_answers(db_session, test_survey, 20)
+    url = f"/api/surveys/{test_survey.id}"
+
+    first = client.delete(url, headers=auth_headers)
+    second = client.delete(url, headers=auth_headers)
+
+    assert first.status_code == second.status_code == 202
+    assert second.json["job"]["id"] == first.json["job"]["id"]
+    assert count(db_session, Job) == 1
+
+
+def test_job_of_other_user_hidden(client, auth_headers, db_session, admin_user):
+    """Test users can't read jobs they didn't start."""
+    job = Job(kind="delete_user", target_id=1, created_by=admin_user.id, total=1, done=0)
+    db_session.add(job)
+    db_session.commit()
+
+    assert client.get(f"/api/jobs/{job.id}", headers=auth_headers).status_code == 404
@@ -0,0 +1,59 @@
+import logging
+from instrumentation import parse_budgets
+
+
+def login(client, user):
+    client.post("/auth/login", data={
+        "username": user.username,
+        "password": user.raw_password,
+    })
+
+
+def test_parse_budgets():
+    """Test parsing of per-endpoint query budgets."""
+    assert parse_budgets("survey.take_survey=30, api.get_answers=5") == {
+        "survey.take_survey": 30,
+        "api.get_answers": 5,
+    }
+    assert parse_budgets(None) == {}
+
+
+def test_server_timing_header(app, client, monkeypatch, test_user, test_survey):
+    """Test that statement count and timings are returned in Server-Timing header."""
+    monkeypatch.setitem(app.config, "SERVER_TIMING", True)
+    login(client, test_user)
+
+    response = client.get("/surveys/my")
+
+    assert response.status_code == 200
+    server_timing = response.headers["Server-Timing"]
+    assert "db;dur=" in server_timing
+    assert "tpl;dur=" in server_timing
+    assert "app;dur=" in server_timing
+    # At least the survey list query
+    queries = int(server_timing.split('desc="')[1].split(" ")[0])
+    assert queries >= 1
+
+
+def test_server_timing_disabled(app, client, monkeypatch):
+    """Test that Server-Timing header is not sent when disabled (production)."""
+    monkeypatch.setitem(app.config, "SERVER_TIMING", False)
+
+    response = client.get("/")
+
+    assert "Server-Timing" not in response.headers
+
+
+def test_query_budget_warning(app, client, monkeypatch, caplog, test_user, test_survey):
+    """Test that exceeding the per-route query budget logs a warning."""
+    monkeypatch.setitem(app.config, "QUERY_BUDGETS", {"survey.user_surveys": 0})
+    login(client, test_user)
+
+    with caplog.at_level(logging.INFO, logger="questionnaire.requests"):
+        client.get("/surveys/my")
+
+    warnings = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert warnings[0].endpoint == "survey.user_surveys"
+    assert warnings[0].query_budget == 0
+    assert warnings[0].db_queries > 0
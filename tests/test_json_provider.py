@@ -0,0 +1,77 @@
+import json
+import decimal
+import datetime
+
+import pytest
+
+import json_provider
+from ORM.models import QuestionType
+
+PAYLOAD = {
+    "created_at": datetime.datetime(2025, 1, 2, 3, 4, 5),
+    "day": datetime.date(2025, 1, 2),
+    "type": QuestionType.SINGLE_CHOICE,
+    "price": decimal.Decimal("1.50"),
+    "text": "Привет",
+}
+
+EXPECTED = {
+    "created_at": "2025-01-02T03:04:05",
+    "day": "2025-01-02",
+    "type": "single_choice",
+    "price": "1.50",
+    "text": "Привет",
+}
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def provider(request, app, monkeypatch):
+    """JSON provider with and without orjson."""
+    if request.param == "stdlib":
+        monkeypatch.setattr(json_provider, "orjson", None)
+    elif json_provider.orjson is None:
+        pytest.skip("orjson is not installed")
+    return json_provider.FastJSONProvider(app)
+
+
+def test_dumps(provider):
+    """Test encoding of datetimes, enums, Decimal and non-string keys."""
+    assert json.loads(provider.dumps(PAYLOAD)) == EXPECTED
+    assert json.loads(provider.dumps_bytes(PAYLOAD)) == EXPECTED
+
+
+def test_dumps_indent_and_sort_keys(provider):
+    """Test that stdlib-compatible formatting arguments are honored."""
+    assert provider.dumps({"b": 1, "a": [1]}, sort_keys=True, indent=2) == '{\n  "a": [\n    1\n  ],\n  "b": 1\n}'
+
+
+def test_dumps_big_int(provider):
+    """Test that values orjson can't encode fall back to stdlib json."""
+    assert json.loads(provider.dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+    assert json.loads(provider.dumps_bytes({"n": 2 ** 70})) == {"n": 2 ** 70}
+
+
+def test_dumps_none_keys(app):
+    """Test that stats dicts with None keys (unknown browser) are encoded by orjson."""
+    if json_provider.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    provider = json_provider.FastJSONProvider(app)
+
+    assert json.loads(provider.dumps_bytes({"Chrome": 2, None: 1})) == {"null": 1, "Chrome": 2}
+
+
+def test_loads(provider):
+    """Test decoding."""
+    assert provider.loads('{"a": [1, 2.5, null]}') == {"a": [1, 2.5, None]}
+
+
+def test_jsonify_uses_provider(app):
+    """Test that the app responses are encoded by the provider."""
+    assert isinstance(app.json, json_provider.FastJSONProvider)
+
+    with app.test_request_context():
+        response = app.json.response(PAYLOAD)
+
+    assert response.json == EXPECTED
+    assert app.jinja_env.filters["tojson"]({"type": QuestionType.TEXT}) == '{"type":"text"}'
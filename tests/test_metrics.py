@@ -0,0 +1,45 @@
+from ORM.models import QuestionType
+
+
+def get_metric(client, line_prefix):
+    """Returns value of the first metrics line starting with line_prefix."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_endpoint(client):
+    """Test that /metrics exposes Prometheus text format."""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert "http_request_duration_seconds" in response.get_data(as_text=True)
+    assert "db_pool_checked_out" in response.get_data(as_text=True)
+
+
+def test_request_latency_per_endpoint(client):
+    """Test that request latency is recorded with blueprint and endpoint labels."""
+    prefix = 'http_request_duration_seconds_count{blueprint="auth",endpoint="auth.login",method="GET"}'
+    before = get_metric(client, prefix)
+
+    client.get("/auth/login")
+
+    assert get_metric(client, prefix) == before + 1
+
+
+def test_submission_counter(client, db_session, test_survey):
+    """Test that accepted survey submissions are counted per survey."""
+    prefix = f'survey_submissions_total{{survey_id="{test_survey.id}"}}'
+    before = get_metric(client, prefix)
+
+    text_question = next(q for q in test_survey.questions if q.type == QuestionType.TEXT)
+    client.post(f"/surveys/{test_survey.id}/take", data={
+        f"q_{text_question.id}": "Metrics",
+        "timezone": "UTC",
+    })
+
+    assert get_metric(client, prefix) == before + 1
@@ -0,0 +1,183 @@
+import sqlalchemy as sa
+
+import bitmaps
+import migrations
+import sketches
+from migrations import v0011_option_bitmaps as option_bitmaps_migration
+from db import SqlAlchemyBase
+
+
+def make_engine(tmp_path):
+    return sa.create_engine(f"sqlite:///{tmp_path / 'migrations.sqlite3'}")
+
+
+def version(engine):
+    with engine.connect() as connection:
+        return migrations.current_version(connection)
+
+
+def test_upgrade_empty_database(tmp_path):
+    """Test migrations create the current schema on an empty database."""
+    engine = make_engine(tmp_path)
+    assert version(engine) == 0
+
+    assert migrations.upgrade(engine) == migrations.head_version()
+
+    inspector = sa.inspect(engine)
+    assert set(SqlAlchemyBase.metadata.tables) <= set(inspector.get_table_names())
+    assert "version" in {column["name"] for column in inspector.get_columns("surveys")}
+    assert "ix_answers_question_ip" in {index["name"] for index in inspector.get_indexes("answers")}
+    assert version(engine) == migrations.head_version()
+
+
+def test_downgrade_and_upgrade_again(tmp_path):
+    """Test migrations are reverted down to the target and applied again."""
+    engine = make_engine(tmp_path)
+    migrations.upgrade(engine)
+
+    assert migrations.downgrade(engine, 1) == 1
+    inspector = sa.inspect(engine)
+    assert "version" not in {column["name"] for column in inspector.get_columns("surveys")}
+    assert not inspector.get_indexes("answers")
+
+    assert migrations.upgrade(engine, 2) == 2
+    assert migrations.upgrade(engine) == migrations.head_version()
+
+
+def test_upgrade_database_created_by_create_all(tmp_path):
+    """Test existing databases created by create_all are adopted by migrations."""
+    engine = make_engine(tmp_path)
+    SqlAlchemyBase.metadata.create_all(engine)
+
+    assert migrations.upgrade(engine) == migrations.head_version()
+
+
+def test_check_schema_without_upgrade(tmp_path):
+    """Test check mode only reads the version."""
+    engine = make_engine(tmp_path)
+
+    assert migrations.check_schema(engine, auto_upgrade=False) == 0
+    assert "surveys" not in sa.inspect(engine).get_table_names()
+
+
+def test_text_analytics_backfilled(tmp_path):
+    """Test existing answers to text questions are summarized by the migration and count as analyzed."""
+    engine = make_engine(tmp_path)
+    migrations.upgrade(engine, 8)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO questions (id, type, text) VALUES (1, 'TEXT', 'Why?')"))
+        connection.execute(sa.text(
+            "INSERT INTO answers (id, question_id, text_response) VALUES "
+            "(1, 1, 'Fast delivery'), (2, 1, 'fast delivery'), (3, 1, 'Fast delivery'), (4, 1, ' '), (5, 1, NULL)",
+        ))
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(sa.text(
+            "SELECT responses, total_length, tokens, distinct_responses FROM text_stats WHERE question_id = 1",
+        )).one() == (3, 39, 6, 2)
+        assert connection.execute(sa.text("SELECT bucket, count FROM text_length_buckets")).all() == [(1, 3)]
+        assert connection.execute(sa.text("SELECT term, count, error FROM text_terms ORDER BY term")).all() == [
+            ("delivery", 3, 0), ("fast", 3, 0),
+        ]
+        assert connection.execute(sa.text("SELECT count(*) FROM answers WHERE NOT analyzed")).scalar() == 0
+
+
+def test_respondent_sketches_backfilled(tmp_path):
+    """Test respondents of existing answers are sketched by the migration."""
+    engine = make_engine(tmp_path)
+    migrations.upgrade(engine, 9)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO questions (id, survey_id, type, text) VALUES (1, 1, 'TEXT', 'Why?')"))
+        connection.execute(sa.text(
+            "INSERT INTO answers (id, question_id, ip_address, browser, created_at) VALUES "
+            "(1, 1, '10.0.0.1', 'Firefox', '2026-01-01 10:00:00'), (2, 1, '10.0.0.2', NULL, '2026-01-02 10:00:00'), "
+            "(3, 1, '10.0.0.1', 'Firefox', '2026-01-02 11:00:00')",
+        ))
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        counts = {
+            (kind, key): sketches.HyperLogLog.from_bytes(registers).count() for kind, key, registers in
+            connection.execute(sa.text("SELECT kind, key, registers FROM respondent_sketches WHERE survey_id = 1"))
+        }
+    assert counts == {
+        ("survey", ""): 2, ("question", "1"): 2, ("day", "2026-01-01"): 1, ("day", "2026-01-02"): 2,
+        ("browser", "Firefox"): 1,
+    }
+
+
+def test_option_bitmaps_backfilled(tmp_path):
+    """Test respondents of existing answers are numbered and their options indexed by the migration."""
+    engine = make_engine(tmp_path)
+    migrations.upgrade(engine, 10)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO surveys (id, title) VALUES (1, 'Pets')"))
+        connection.execute(sa.text(
+            "INSERT INTO questions (id, survey_id, type, text) VALUES (1, 1, 'MULTIPLE_CHOICE', 'Pets?'), "
+            "(2, 1, 'TEXT', 'Name?')",
+        ))
+        connection.execute(sa.text("INSERT INTO options (id, question_id, text) VALUES (1, 1, 'Cat'), (2, 1, 'Dog')"))
+        connection.execute(sa.text(
+            "INSERT INTO answers (id, question_id, text_response, user_id, ip_address) VALUES "
+            "(1, 2, 'Ann', NULL, '10.0.0.1'), (2, 1, 'Cat', NULL, '10.0.0.1'), (3, 1, 'Dog', NULL, '10.0.0.1'), "
+            "(4, 1, 'Dog', NULL, '10.0.0.2'), (5, 1, NULL, 7, '10.0.0.1')",
+        ))
+        connection.execute(sa.text("INSERT INTO answer_options (answer_id, option_id) VALUES (5, 1)"))
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(sa.text("SELECT ordinal, key FROM respondents ORDER BY ordinal")).all() == [
+            (0, "ip:10.0.0.1"), (1, "ip:10.0.0.2"), (2, "user:7"),
+        ]
+        containers = connection.execute(sa.text("SELECT option_id, chunk, container FROM option_bitmaps")).all()
+    assert {
+        option_id: bitmaps.Bitmap({chunk: bitmaps.decode(container)}).ordinals().tolist()
+        for option_id, chunk, container in containers
+    } == {1: [0, 2], 2: [0, 1]}
+
+
+def test_bitmap_containers_of_migration_match():
+    """Test the pure Python containers of the migration are the ones bitmaps.encode picks."""
+    for ordinals in ([3, 700, 65535], range(10000, 50000), range(0, bitmaps.CHUNK_SIZE, 3)):
+        bitset = bytearray(bitmaps.CHUNK_SIZE >> 3)
+        for ordinal in ordinals:
+            bitset[ordinal >> 3] |= 1 << (ordinal & 7)
+        kind, data = option_bitmaps_migration._container(bitset)
+        assert bytes([kind]) + data == bitmaps.encode(bitmaps.Bitmap.from_ordinals(ordinals).chunks[0])
+
+
+def test_choice_answers_backfilled_as_answer_options(tmp_path):
+    """Test text-copied choice answers are merged into one answer with answer_options rows and copied back."""
+    engine = make_engine(tmp_path)
+    migrations.upgrade(engine, 11)
+    created_at = "2026-01-01 10:00:00"
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            "INSERT INTO questions (id, type, text) VALUES (1, 'MULTIPLE_CHOICE', 'Pets?'), (2, 'TEXT', 'Name?')",
+        ))
+        connection.execute(sa.text("INSERT INTO options (id, question_id, text) VALUES (1, 1, 'Cat'), (2, 1, 'Dog')"))
+        connection.execute(sa.text(
+            "INSERT INTO answers (id, question_id, text_response, ip_address, created_at) VALUES "
+            f"(1, 2, 'Ann', '10.0.0.1', '{created_at}'), (2, 1, 'Cat', '10.0.0.1', '{created_at}'), "
+            f"(3, 1, 'Dog', '10.0.0.1', '{created_at}'), (4, 1, 'Dog', '10.0.0.2', '{created_at}')",
+        ))
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(sa.text("SELECT id, text_response FROM answers ORDER BY id")).all() == [
+            (1, "Ann"), (2, None), (4, None),
+        ]
+        assert connection.execute(sa.text("SELECT * FROM answer_options ORDER BY answer_id, option_id")).all() == [
+            (2, 1), (2, 2), (4, 2),
+        ]
+
+    migrations.downgrade(engine, 11)
+
+    with engine.connect() as connection:
+        rows = connection.execute(sa.text("SELECT ip_address, text_response FROM answers WHERE question_id = 1")).all()
+        assert sorted(rows) == [("10.0.0.1", "Cat"), ("10.0.0.1", "Dog"), ("10.0.0.2", "Dog")]
@@ -0,0 +1,58 @@
+import os
+import pstats
+
+
+def test_profile_requested_by_admin(app, client, monkeypatch, tmp_path, admin_auth_headers):
+    """Test that an admin can profile a request with X-Profile header and list the profiles."""
+    monkeypatch.setitem(app.config, "PROFILE_DIR", str(tmp_path))
+
+    response = client.get("/api/surveys", headers={**admin_auth_headers, "X-Profile": "1"})
+
+    assert response.status_code == 200
+    name = response.headers["X-Profile"]
+    assert pstats.Stats(os.path.join(tmp_path, name)).total_calls > 0
+
+    response = client.get("/api/profiles", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert response.json[0]["name"] == name
+    assert response.json[0]["endpoint"] == "api_get_surveys"
+
+    response = client.get(f"/api/profiles/{name}", headers=admin_auth_headers)
+    assert response.status_code == 200
+
+
+def test_foreign_files_not_listed(app, client, monkeypatch, tmp_path, admin_auth_headers):
+    """Test files in the profile directory not named like profiles are skipped."""
+    monkeypatch.setitem(app.config, "PROFILE_DIR", str(tmp_path))
+    for name in ("slow.pstats", "yesterday-api_get_surveys-1.pstats"):
+        (tmp_path / name).write_bytes(b"")
+
+    response = client.get("/api/profiles", headers=admin_auth_headers)
+
+    assert response.status_code == 200
+    assert response.json == []
+
+
+def test_profile_ignored_for_regular_user(app, client, monkeypatch, tmp_path, auth_headers):
+    """Test that regular users can't trigger profiling or list profiles."""
+    monkeypatch.setitem(app.config, "PROFILE_DIR", str(tmp_path))
+
+    response = client.get("/api/surveys?_profile=1", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert "X-Profile" not in response.headers
+    assert os.listdir(tmp_path) == []
+
+    response = client.get("/api/profiles", headers=auth_headers)
+    assert response.status_code == 403
+
+
+def test_profile_sampling(app, client, monkeypatch, tmp_path):
+    """Test that every request is profiled with sample rate 1."""
+    monkeypatch.setitem(app.config, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setitem(app.config, "PROFILE_SAMPLE_RATE", 1)
+
+    response = client.get("/")
+
+    assert response.headers["X-Profile"].endswith(".pstats")
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+import ratelimit
+
+
+@pytest.fixture
+def limited_app(app, monkeypatch):
+    """App with rate limits enabled and fresh in-memory buckets."""
+    monkeypatch.setitem(app.config, "RATELIMIT_ENABLED", True)
+    monkeypatch.setitem(app.extensions, "ratelimit", ratelimit.MemoryBackend())
+    return app
+
+
+def test_parse_limit():
+    """Test rate limit parsing."""
+    assert ratelimit.parse_limit("10/minute") == (10, 10 / 60)
+    with pytest.raises(ValueError):
+        ratelimit.parse_limit("10/fortnight")
+
+
+def test_memory_backend_token_bucket():
+    """Test buckets allow bursts up to capacity and refill over time."""
+    backend = ratelimit.MemoryBackend()
+    assert backend.consume("key", 2, 1, now=0) == 0
+    assert backend.consume("key", 2, 1, now=0) == 0
+    assert backend.consume("key", 2, 1, now=0) == pytest.approx(1)
+    assert backend.consume("key", 2, 1, now=1) == 0
+    assert backend.consume("other", 2, 1, now=1) == 0
+
+
+def test_login_rate_limited_per_user(limited_app, client, test_user, monkeypatch):
+    """Test API logins of one account are limited with 429 and Retry-After."""
+    monkeypatch.setitem(limited_app.config, "RATELIMITS", {"api.login": {"user": "2/minute"}})
+    credentials = {"username": test_user.username, "password": "wrong"}
+
+    assert client.post("/api/token", json=credentials).status_code == 401
+    assert client.post("/api/token", json=credentials).status_code == 401
+    response = client.post("/api/token", json=credentials)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json["msg"] == "Too many requests"
+    # Another account has its own bucket
+    assert client.post("/api/token", json={"username": "other", "password": "x"}).status_code == 401
+
+
+def test_submissions_rate_limited_per_survey(limited_app, client, test_survey, monkeypatch):
+    """Test survey submissions are limited per survey, GET isn't limited."""
+    monkeypatch.setitem(limited_app.config, "RATELIMITS", {"survey.take_survey": {"survey": "1/hour"}})
+
+    assert client.post(f"/surveys/{test_survey.id}/take", data={}).status_code != 429
+    assert client.post(f"/surveys/{test_survey.id}/take", data={}).status_code == 429
+    assert client.get(f"/surveys/{test_survey.id}/take").status_code != 429
+
+
+def test_throttled_ip_keeps_survey_tokens(limited_app, client, test_survey, monkeypatch):
+    """Test requests rejected by the IP limit don't use up the bucket shared by all respondents of the survey."""
+    monkeypatch.setitem(limited_app.config, "RATELIMITS", {"survey.take_survey": {"ip": "1/hour", "survey": "3/hour"}})
+    take = f"/surveys/{test_survey.id}/take"
+
+    assert client.post(take, data={}).status_code != 429
+    for _ in range(5):
+        assert client.post(take, data={}).status_code == 429
+
+    # Two tokens are left for other respondents
+    for address in ("10.0.0.2", "10.0.0.3"):
+        assert client.post(take, data={}, environ_base={"REMOTE_ADDR": address}).status_code != 429
+    assert client.post(take, data={}, environ_base={"REMOTE_ADDR": "10.0.0.4"}).status_code == 429
+
+
+def test_concurrency_limit_divided_between_workers(app, monkeypatch):
+    """Test the configured limits are global, every worker gets its share."""
+    monkeypatch.setitem(app.config, "MAX_CONCURRENT_REQUESTS", 10)
+    monkeypatch.setitem(app.config, "MAX_QUEUED_REQUESTS", 3)
+    monkeypatch.setitem(app.config, "WORKERS", 4)
+    monkeypatch.setattr(app, "extensions", dict(app.extensions))
+    monkeypatch.setattr(app, "before_request", lambda f: f)
+    monkeypatch.setattr(app, "teardown_request", lambda f: f)
+
+    ratelimit.init_app(app)
+    limiter = app.extensions["concurrency_limiter"]
+    assert (limiter.limit, limiter.queue) == (3, 1)
+
+
+def test_concurrency_limiter():
+    """Test requests over the limit wait in the queue or are rejected."""
+    limiter = ratelimit.ConcurrencyLimiter(1, queue=1, timeout=5)
+    assert limiter.acquire()
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+    while limiter.waiting == 0:
+        pass
+    # Queue is full
+    assert not limiter.acquire()
+
+    limiter.release()
+    waiter.join()
+    assert results == [True]
+
+
+def test_overloaded_app_returns_503(app, client, monkeypatch):
+    """Test requests are shed with 503 when no slot is free."""
+    limiter = ratelimit.ConcurrencyLimiter(1)
+    limiter.acquire()
+    monkeypatch.setitem(app.extensions, "concurrency_limiter", limiter)
+
+    response = client.get("/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.config["OVERLOAD_RETRY_AFTER"])
+    assert client.get("/metrics").status_code == 200
+
+    limiter.release()
+    assert client.get("/").status_code == 200
+    assert limiter.active == 0
@@ -0,0 +1,96 @@
+from ORM.models import Answer, Question, QuestionType
+import search
+import stats
+
+
+def add_responses(db_session, survey, texts):
+    question = next(q for q in survey.questions if q.type == QuestionType.TEXT)
+    db_session.add_all(Answer(question_id=question.id, text_response=text) for text in texts)
+    db_session.commit()
+    return question
+
+
+def test_fts5_query_quotes_input():
+    """Test operators and punctuation in user input can't break FTS5 syntax."""
+    assert search.fts5_query('slow "delivery" OR-') == '"slow" "delivery" "OR"*'
+    assert search.fts5_query("?!") is None
+
+
+def test_search_ranked_and_paginated(db_session, test_survey):
+    """Test FTS5 search matches words and prefixes, pages don't overlap."""
+    question = add_responses(db_session, test_survey, [
+        "Delivery was slow", "Great support", "slow slow delivery again", "Deliveries are fine", "ok",
+    ])
+
+    rows, has_more = search.search_responses(db_session, question.id, "deliver", per_page=2)
+    assert has_more
+    assert {row[1] for row in rows} <= {"Delivery was slow", "slow slow delivery again", "Deliveries are fine"}
+    assert all(row[3] is not None for row in rows)
+
+    last_page, has_more = search.search_responses(db_session, question.id, "deliver", page=2, per_page=2)
+    assert not has_more
+    assert len(last_page) == 1 and last_page[0] not in rows
+
+
+def test_search_follows_updates(db_session, test_survey):
+    """Test the FTS5 mirror table is kept in sync by triggers."""
+    question = add_responses(db_session, test_survey, ["old text"])
+    answer = db_session.query(Answer).filter(Answer.question_id == question.id).one()
+    answer.text_response = "new text"
+    db_session.commit()
+
+    assert search.search_responses(db_session, question.id, "old")[0] == []
+    assert search.search_responses(db_session, question.id, "new")[0][0][1] == "new text"
+
+
+def test_responses_endpoint(client, auth_headers, db_session, test_user, test_survey):
+    """Test the endpoint with JWT and session auth and access checks."""
+    question = add_responses(db_session, test_survey, ["Blue sky", "Green grass"])
+    url = f"/api/surveys/{test_survey.id}/questions/{question.id}/responses"
+
+    response = client.get(url, query_string={"q": "sky"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert [item["text"] for item in response.json["items"]] == ["Blue sky"]
+    assert response.json["has_more"] is False
+
+    assert client.get(url, query_string={"q": "sky"}).status_code == 401
+    choice = next(q for q in test_survey.questions if q.type == QuestionType.SINGLE_CHOICE)
+    other_url = f"/api/surveys/{test_survey.id}/questions/{choice.id}/responses"
+    assert client.get(other_url, headers=auth_headers).status_code == 404
+
+    client.post("/auth/login", data={"username": test_user.username, "password": test_user.raw_password})
+    assert client.get(url, query_string={"q": "grass"}).json["items"][0]["text"] == "Green grass"
+
+
+def test_stats_include_first_page(db_session, test_survey):
+    """Test stats carry only the first page of responses and a cursor to the rest."""
+    add_responses(db_session, test_survey, [f"Answer {n}" for n in range(stats.RESPONSES_PAGE + 5)])
+
+    text_stats = next(stat for stat in stats.survey_stats(db_session, test_survey.id)["stats"] if "text_stats" in stat)
+
+    assert len(text_stats["text_stats"]["responses"]) == stats.RESPONSES_PAGE
+    assert text_stats["text_stats"]["next"] is not None
+
+
+def test_responses_endpoint_keyset_pages(client, auth_headers, db_session, test_survey):
+    """Test responses are listed page by page after the returned cursor, file answers too."""
+    question = add_responses(db_session, test_survey, [f"Answer {n}" for n in range(5)])
+    url = f"/api/surveys/{test_survey.id}/questions/{question.id}/responses"
+
+    texts, after = [], None
+    while True:
+        page = client.get(url, query_string={"per_page": 2, "after": after}, headers=auth_headers).json
+        texts += [item["text"] for item in page["items"]]
+        after = page["next_after"]
+        if not page["has_more"]:
+            break
+    assert texts == [f"Answer {n}" for n in range(5)]
+
+    upload = Question(survey_id=test_survey.id, type=QuestionType.FILE, text="Photo")
+    db_session.add(upload)
+    db_session.flush()
+    db_session.add(Answer(question_id=upload.id, file_path="photo.png"))
+    db_session.commit()
+    file_url = f"/api/surveys/{test_survey.id}/questions/{upload.id}/responses"
+    assert client.get(file_url, headers=auth_headers).json["items"][0]["file_path"] == "photo.png"
+    assert client.get(file_url, query_string={"q": "photo"}, headers=auth_headers).status_code == 400
@@ -0,0 +1,73 @@
+import pytest
+from db import SqlAlchemyBase
+from ORM.models import User, Survey, Question, QuestionType, Option, Answer, TextStat
+from seed import generate, parse_questions_spec
+from submissions import dedup_key
+import analytics
+
+
+def dump_answers(db_session):
+    return db_session.query(
+        Answer.question_id, Answer.text_response, Answer.ip_address, Answer.browser, Answer.timezone,
+    ).order_by(Answer.id).all()
+
+
+def test_parse_questions_spec():
+    """Test parsing of the per-type question counts."""
+    assert parse_questions_spec("text=2, single_choice=3,file") == {
+        QuestionType.TEXT: 2,
+        QuestionType.SINGLE_CHOICE: 3,
+        QuestionType.FILE: 1,
+    }
+
+    with pytest.raises(ValueError):
+        parse_questions_spec("unknown=1")
+
+
+def test_generate_dataset(db_session):
+    """Test that the generator creates the requested amount of data."""
+    result = generate(
+        db_session,
+        users=5,
+        surveys=3,
+        questions={QuestionType.TEXT: 1, QuestionType.MULTIPLE_CHOICE: 2},
+        options=4,
+        answers=500,
+        batch_size=100,
+    )
+
+    assert db_session.query(User).count() == 5
+    assert db_session.query(Survey).count() == 3
+    assert db_session.query(Question).count() == 9
+    assert db_session.query(Option).count() == 24
+    assert db_session.query(Answer).count() == result["answers"] >= 500
+
+
+def test_generate_is_deterministic(db_session):
+    """Test that the same seed produces the same dataset."""
+    generate(db_session, users=3, surveys=2, answers=300, seed=42)
+    first = dump_answers(db_session)
+
+    SqlAlchemyBase.metadata.drop_all(bind=db_session.get_bind())
+    SqlAlchemyBase.metadata.create_all(bind=db_session.get_bind())
+
+    generate(db_session, users=3, surveys=2, answers=300, seed=42)
+    assert dump_answers(db_session) == first
+
+
+def test_generated_answers_follow_survey_rules(db_session):
+    """Test answers go to active surveys only, once per respondent, logged in where required, and are analyzed."""
+    generate(db_session, users=20, surveys=12, answers=3000, seed=7)
+
+    surveys = {survey.id: survey for survey in db_session.query(Survey)}
+    submissions = {}
+    for survey_id, user_id, ip_address, created_at in db_session.query(
+        Question.survey_id, Answer.user_id, Answer.ip_address, Answer.created_at,
+    ).join(Question, Question.id == Answer.question_id):
+        assert surveys[survey_id].is_active
+        assert user_id is not None or not surveys[survey_id].require_login
+        submissions.setdefault((survey_id, dedup_key(user_id, ip_address)), set()).add(created_at)
+    assert all(len(times) == 1 for times in submissions.values())
+    assert any(surveys[survey_id].require_login for survey_id, _ in submissions)
+    assert not any(analytics.pending(db_session, survey_id) for survey_id in surveys)
+    assert db_session.query(TextStat).count() > 0
@@ -0,0 +1,99 @@
+import pytest
+from sqlalchemy import event
+
+from db import get_engine
+from ORM.models import Answer, AnswerOption, QuestionType
+from serializers import SURVEY, ANSWER, dump_survey_graph
+
+
+@pytest.fixture
+def statements():
+    """Collects SQL statements executed during the test."""
+    collected = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(get_engine(), "before_cursor_execute", collect)
+    yield collected
+    event.remove(get_engine(), "before_cursor_execute", collect)
+
+
+@pytest.fixture
+def choice_answer(db_session, test_survey, test_user):
+    """An answer to the multiple choice question with two selected options."""
+    question = next(q for q in test_survey.questions if q.type == QuestionType.MULTIPLE_CHOICE)
+    answer = Answer(
+        question_id=question.id,
+        user_id=test_user.id,
+        ip_address="127.0.0.1",
+        user_agent="Test",
+    )
+    db_session.add(answer)
+    db_session.flush()
+    for option in question.options[:2]:
+        db_session.add(AnswerOption(answer_id=answer.id, option_id=option.id))
+    db_session.commit()
+    return answer
+
+
+def test_parse_fields():
+    """Test sparse fieldset parsing."""
+    assert SURVEY.parse_fields(None) == SURVEY.fields
+    assert SURVEY.parse_fields("is_active,title") == ("id", "title", "is_active")
+    assert "selected_options" not in ANSWER.parse_fields("text_response")
+
+    with pytest.raises(ValueError):
+        SURVEY.parse_fields("title,password")
+
+
+def test_surveys_sparse_fieldset(client, auth_headers, test_survey, statements):
+    """Test that ?fields= limits both the response and the selected columns."""
+    expected = [{"id": test_survey.id, "title": test_survey.title}]
+    statements.clear()
+
+    response = client.get("/api/surveys?fields=title", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json == expected
+    survey_queries = [statement for statement in statements if "FROM surveys" in statement]
+    assert len(survey_queries) == 1
+    assert "description" not in survey_queries[0]
+
+
+def test_surveys_unknown_field(client, auth_headers):
+    """Test that unknown fields are rejected."""
+    response = client.get("/api/surveys?fields=title,secret", headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "secret" in response.json["msg"]
+
+
+def test_answers_column_projection(client, auth_headers, choice_answer, statements):
+    """Test that answers listing skips unserialized columns and loads options in one query."""
+    response = client.get("/api/answers", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [len(answer["selected_options"]) for answer in response.json] == [2]
+    answer_queries = [statement for statement in statements if "FROM answers" in statement]
+    assert len(answer_queries) == 1
+    assert "user_agent" not in answer_queries[0]
+    assert sum("FROM answer_options" in statement for statement in statements) == 1
+
+
+def test_answers_sparse_fieldset(client, auth_headers, choice_answer):
+    """Test that selected options are not loaded unless requested."""
+    response = client.get("/api/answers?fields=question_id", headers=auth_headers)
+
+    assert response.json == [{"id": choice_answer.id, "question_id": choice_answer.question_id}]
+
+
+def test_dump_survey_graph(db_session, test_survey):
+    """Test survey graph serialization."""
+    survey = dump_survey_graph(db_session, test_survey.id)
+
+    assert survey["title"] == test_survey.title
+    assert [question["id"] for question in survey["questions"]] == [q.id for q in test_survey.questions]
+    assert [len(question["options"]) for question in survey["questions"]] == [0, 4, 5]
+    assert survey["questions"][1]["type"] == QuestionType.SINGLE_CHOICE
+    assert dump_survey_graph(db_session, 9999) is None
@@ -0,0 +1,75 @@
+import datetime
+
+from ORM.models import QuestionType
+from submissions import persist_submission
+import analytics
+import sketches
+import stats
+
+
+def submit(db_session, survey, respondents, browser="Firefox", day=datetime.datetime(2026, 1, 1)):
+    question = next(q for q in survey.questions if q.type == QuestionType.TEXT)
+    persist_submission(db_session, [
+        {"question_id": question.id, "text_response": "ok", "ip_address": ip, "browser": browser, "created_at": day}
+        for ip in respondents
+    ])
+    db_session.commit()
+    analytics.run_pending(db_session)
+
+
+def test_hyperloglog_estimate():
+    """Test estimates stay within a few standard errors and survive merging and serialization."""
+    first, second = sketches.HyperLogLog(), sketches.HyperLogLog()
+    for n in range(30000):
+        (first if n % 2 else second).add(f"10.{n // 65536}.{n // 256 % 256}.{n % 256}")
+        first.add("10.0.0.1")
+
+    merged = sketches.HyperLogLog.from_bytes(first.merge(second).to_bytes())
+
+    assert abs(merged.count() - 30000) < 30000 * 4 * sketches.ERROR
+    assert sketches.HyperLogLog().count() == 0
+
+
+def test_sketches_follow_submissions(db_session, test_survey, monkeypatch):
+    """Test big surveys are counted from sketches, per day and segment too."""
+    submit(db_session, test_survey, [f"10.0.0.{n}" for n in range(50)])
+    submit(db_session, test_survey, [f"10.0.1.{n}" for n in range(20)], browser="Chrome",
+           day=datetime.datetime(2026, 1, 2))
+    monkeypatch.setattr(sketches, "EXACT_MAX", 10)
+
+    total, exact = sketches.count_respondents(db_session, test_survey.id)
+    assert abs(total[""] - 70) <= 2 and exact is False
+    browsers = sketches.count_respondents(db_session, test_survey.id, "browser")[0]
+    assert abs(browsers["Chrome"] - 20) <= 1 and abs(browsers["Firefox"] - 50) <= 2
+    assert sketches.count_respondents(db_session, test_survey.id, "day", exact=True)[0] == {
+        "2026-01-01": 50, "2026-01-02": 20,
+    }
+    result = stats.compute_stats(db_session, test_survey.id)
+    assert result["total_responses"] == total[""] and result["respondents_exact"] is False
+
+
+def test_respondents_endpoint(client, auth_headers, db_session, test_survey):
+    """Test respondents grouped by day, estimated on request."""
+    submit(db_session, test_survey, ["10.0.0.1", "10.0.0.2"])
+    url = f"/api/surveys/{test_survey.id}/respondents"
+
+    response = client.get(url, headers=auth_headers)
+    assert response.json == {"by": "survey", "exact": True, "error": 0, "respondents": 2}
+
+    response = client.get(url, query_string={"by": "day", "exact": "0"}, headers=auth_headers)
+    assert response.json["respondents"] == {"2026-01-01": 2} and response.json["error"] == sketches.ERROR
+    assert client.get(url, query_string={"by": "password"}, headers=auth_headers).status_code == 400
+    assert client.get(url).status_code == 401
+
+
+def test_rebuild_matches_incremental(db_session, test_survey):
+    """Test sketches merged batch by batch equal the ones rebuilt from answers."""
+    submit(db_session, test_survey, [f"10.0.0.{n}" for n in range(30)])
+    submit(db_session, test_survey, [f"10.0.0.{n}" for n in range(20, 60)], browser="Chrome")
+    before = {kind: sketches.estimate(db_session, test_survey.id, kind) for kind in ("survey",) + sketches.KINDS}
+
+    sketches.rebuild(db_session, test_survey.id, batch_size=7)
+    db_session.commit()
+
+    assert {kind: sketches.estimate(db_session, test_survey.id, kind) for kind in ("survey",) + sketches.KINDS} == before
+    assert before["browser"] == {"Chrome": 40, "Firefox": 30}
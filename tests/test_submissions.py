@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+
+from ORM.models import Answer, QuestionType
+from submissions import SubmissionJournal, SubmissionBuffer, dedup_key, persist_submission
+
+
+@pytest.fixture
+def buffer(app, tmp_path, monkeypatch):
+    """Write-behind buffer without the flusher thread, flushed explicitly by tests."""
+    buffer = SubmissionBuffer(SubmissionJournal(str(tmp_path / "journal.sqlite3")), batch_size=2)
+    monkeypatch.setitem(app.extensions, "submission_buffer", buffer)
+    return buffer
+
+
+def answer_rows(survey, user_id=None, ip_address="10.0.0.1"):
+    question = next(q for q in survey.questions if q.type == QuestionType.TEXT)
+    return [{
+        "question_id": question.id,
+        "text_response": "Buffered",
+        "file_path": None,
+        "user_id": user_id,
+        "ip_address": ip_address,
+        "user_agent": "Test",
+        "created_at": datetime.datetime(2024, 1, 1, 12, 0),
+    }]
+
+
+def test_journal_rejects_duplicates(tmp_path):
+    """Test journal keeps one pending submission per respondent and survey."""
+    journal = SubmissionJournal(str(tmp_path / "journal.sqlite3"))
+    rows = [{"question_id": 1, "created_at": datetime.datetime(2024, 1, 1)}]
+
+    assert journal.append(1, "ip:10.0.0.1", rows)
+    assert not journal.append(1, "ip:10.0.0.1", rows)
+    assert journal.append(2, "ip:10.0.0.1", rows)
+    assert journal.is_pending(1, "ip:10.0.0.1")
+    assert journal.stats()[0] == 2
+    assert journal.pending(1)[0][3] == rows
+
+
+def test_flush_in_batches(buffer, db_session, test_survey):
+    """Test pending submissions are moved to the database in batches."""
+    for number in range(3):
+        buffer.append(test_survey.id, f"ip:10.0.0.{number}", answer_rows(test_survey, ip_address=f"10.0.0.{number}"))
+
+    assert buffer.flush() == 2
+    buffer.flush_all()
+
+    assert buffer.journal.stats() == (0, None)
+    assert db_session.query(Answer).filter(Answer.text_response == "Buffered").count() == 3
+
+
+def test_flush_after_crash_skips_committed(buffer, db_session, test_survey, test_user):
+    """Test submissions committed before a crash (journal not cleaned) aren't written twice."""
+    rows = answer_rows(test_survey, user_id=test_user.id)
+    buffer.append(test_survey.id, dedup_key(test_user.id, None), rows)
+    persist_submission(db_session, rows)
+    db_session.commit()
+
+    # A new buffer over the same journal, as after restart
+    SubmissionBuffer(SubmissionJournal(buffer.journal.path)).flush_all()
+
+    assert buffer.journal.stats()[0] == 0
+    assert db_session.query(Answer).filter(Answer.user_id == test_user.id).count() == 1
+
+
+def test_take_survey_write_behind(client, buffer, db_session, test_survey):
+    """Test submissions are acknowledged from the journal and duplicates are still detected."""
+    question = next(q for q in test_survey.questions if q.type == QuestionType.TEXT)
+    data = {f"q_{question.id}": "Write-behind", "timezone": "UTC"}
+
+    response = client.post(f"/surveys/{test_survey.id}/take", data=data, follow_redirects=True)
+    assert b"Thank you for your participation!" in response.data
+    assert db_session.query(Answer).filter(Answer.text_response == "Write-behind").count() == 0
+
+    response = client.post(f"/surveys/{test_survey.id}/take", data=data, follow_redirects=True)
+    assert b"You have already taken this survey" in response.data
+
+    buffer.flush_all()
+    assert db_session.query(Answer).filter(Answer.text_response == "Write-behind").count() == 1
+
+
+def test_lagging_buffer_writes_directly(client, buffer, db_session, test_survey):
+    """Test submissions bypass the journal when the flusher falls behind."""
+    buffer.max_pending = 0
+    question = next(q for q in test_survey.questions if q.type == QuestionType.TEXT)
+
+    client.post(f"/surveys/{test_survey.id}/take", data={f"q_{question.id}": "Direct"})
+
+    assert buffer.journal.stats()[0] == 0
+    assert db_session.query(Answer).filter(Answer.text_response == "Direct").count() == 1
+
+
+def test_choice_answers_reference_options(client, buffer, db_session, test_survey):
+    """Test a choice question is stored as one answer with answer_options rows, also through the journal."""
+    question = next(q for q in test_survey.questions if q.type == QuestionType.MULTIPLE_CHOICE)
+    picked = [option.id for option in question.options[:2]]
+
+    client.post(f"/surveys/{test_survey.id}/take", data={f"q_{question.id}": picked, "timezone": "UTC"})
+    buffer.flush_all()
+
+    answer = db_session.query(Answer).filter(Answer.question_id == question.id).one()
+    assert answer.text_response is None
+    assert sorted(option.id for option in answer.options) == sorted(picked)
+
+
+def test_flush_drops_choice_answers_without_options(client, buffer, db_session, test_survey):
+    """Test a pending choice answer whose options were all deleted isn't stored as an empty answer."""
+    question = next(q for q in test_survey.questions if q.type == QuestionType.MULTIPLE_CHOICE)
+    picked = question.options[0]
+
+    client.post(f"/surveys/{test_survey.id}/take", data={f"q_{question.id}": [picked.id], "timezone": "UTC"})
+    db_session.delete(picked)
+    db_session.commit()
+    buffer.flush_all()
+
+    assert db_session.query(Answer).filter(Answer.question_id == question.id).count() == 0
+    assert db_session.query(Answer).count() > 0
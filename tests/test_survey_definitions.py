@@ -0,0 +1,100 @@
+from werkzeug.datastructures import MultiDict
+
+from ORM.models import Question, Option, Answer, QuestionType
+from survey import parse_questions_form
+from survey_definitions import apply_definitions
+
+
+def definitions_of(survey):
+    """Definitions of the stored survey, as the edit form submits them."""
+    return [{
+        "id": question.id,
+        "text": question.text,
+        "type": question.type,
+        "required": question.is_required,
+        "limit": question.choice_limit,
+        "options": [option.text for option in question.options],
+        "option_ids": [option.id for option in question.options],
+    } for question in survey.questions]
+
+
+def test_parse_form_with_ids_and_gaps():
+    """Test ids are parsed and removed question cards don't cut off the rest."""
+    form = MultiDict([
+        ("questions[0][id]", "7"), ("questions[0][text]", "Color"), ("questions[0][type]", "single_choice"),
+        ("questions[0][option_ids][]", "3"), ("questions[0][options][]", "Red"),
+        ("questions[0][option_ids][]", ""), ("questions[0][options][]", "Blue"),
+        ("questions[0][option_ids][]", "4"), ("questions[0][options][]", " "),
+        ("questions[2][id]", ""), ("questions[2][text]", "Name"), ("questions[2][type]", "text"),
+    ])
+
+    color, name = parse_questions_form(form)
+
+    assert color["id"] == 7
+    assert color["options"] == ["Red", "Blue"]
+    assert color["option_ids"] == [3, None]
+    assert name["id"] is None and name["text"] == "Name"
+
+
+def test_unchanged_survey_issues_no_writes(db_session, test_survey):
+    """Test saving an unchanged survey changes nothing."""
+    summary = apply_definitions(db_session, test_survey.id, definitions_of(test_survey))
+
+    assert not any(summary.values())
+
+
+def test_edit_keeps_ids_and_answers(db_session, test_survey):
+    """Test a text fix, an option rename, a new option and a removed question."""
+    text_question = next(q for q in test_survey.questions if q.type == QuestionType.TEXT)
+    choice_question = next(q for q in test_survey.questions if q.type == QuestionType.SINGLE_CHOICE)
+    removed_question = next(q for q in test_survey.questions if q.type == QuestionType.MULTIPLE_CHOICE)
+    red = choice_question.options[0]
+    db_session.add_all([
+        Answer(question_id=text_question.id, text_response="Alice"),
+        Answer(question_id=choice_question.id, options=[choice_question.options[0]]),
+        Answer(question_id=removed_question.id, text_response="Python"),
+    ])
+    db_session.commit()
+    ids = (text_question.id, choice_question.id, removed_question.id, red.id)
+
+    definitions = [d for d in definitions_of(test_survey) if d["id"] != removed_question.id]
+    definitions[0]["text"] = "What is your full name?"
+    definitions[1]["options"][0] = "Crimson"
+    definitions[1]["options"].append("Purple")
+    definitions[1]["option_ids"].append(None)
+
+    summary = apply_definitions(db_session, test_survey.id, definitions)
+    db_session.commit()
+    db_session.expire_all()
+
+    assert summary == {
+        "questions_inserted": 0, "questions_updated": 1, "questions_deleted": 1,
+        "options_inserted": 1, "options_updated": 1, "options_deleted": 0,
+    }
+    text_id, choice_id, removed_id, red_id = ids
+    assert db_session.get(Question, text_id).text == "What is your full name?"
+    assert db_session.get(Question, removed_id) is None
+    assert db_session.get(Option, red_id).text == "Crimson"
+    assert [o.text for o in db_session.get(Question, choice_id).options][-1] == "Purple"
+    # Answers stay attached, choice answers follow the renamed option
+    assert db_session.query(Answer).filter(Answer.question_id == text_id).one().text_response == "Alice"
+    choice_answer = db_session.query(Answer).filter(Answer.question_id == choice_id).one()
+    assert [option.text for option in choice_answer.options] == ["Crimson"]
+    assert db_session.query(Answer).filter(Answer.question_id == removed_id).count() == 0
+
+
+def test_new_question_with_options(db_session, test_survey):
+    """Test new questions get their options, foreign ids are treated as new."""
+    definitions = definitions_of(test_survey)
+    definitions.append({
+        "id": 999999, "text": "Pets", "type": QuestionType.MULTIPLE_CHOICE, "required": False, "limit": None,
+        "options": ["Cat", "Dog"], "option_ids": [1, 2],
+    })
+
+    summary = apply_definitions(db_session, test_survey.id, definitions)
+    db_session.commit()
+
+    assert summary["questions_inserted"] == 1 and summary["options_inserted"] == 2
+    pets = db_session.query(Question).filter(Question.text == "Pets").one()
+    assert pets.survey_id == test_survey.id
+    assert [option.text for option in pets.options] == ["Cat", "Dog"]
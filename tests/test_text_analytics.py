@@ -0,0 +1,101 @@
+from collections import Counter
+
+from ORM.models import QuestionType
+from submissions import persist_submission
+import analytics
+import text_analytics
+
+
+def submit(db_session, question, texts, analyze=True):
+    persist_submission(db_session, [
+        {"question_id": question.id, "text_response": text, "ip_address": f"10.0.0.{n}"} for n, text in enumerate(texts)
+    ])
+    db_session.commit()
+    if analyze:
+        analytics.run_pending(db_session)
+
+
+def text_question(survey):
+    return next(q for q in survey.questions if q.type == QuestionType.TEXT)
+
+
+def test_space_saving_bounds():
+    """Test a frequent term survives eviction and its count is an upper bound."""
+    counters = text_analytics.space_saving({}, Counter({"a": 1, "b": 1}), capacity=2)
+    counters = text_analytics.space_saving(counters, Counter({"c": 1}), capacity=2)
+    counters = text_analytics.space_saving(counters, Counter({"a": 5}), capacity=2)
+
+    assert len(counters) == 2
+    count, error = counters["a"]
+    assert count - error <= 6 <= count
+
+
+def test_submissions_update_stats(db_session, test_survey):
+    """Test stats come from analytics updated by every submission."""
+    question = text_question(test_survey)
+    submit(db_session, question, ["Fast delivery", "fast delivery", "Fast delivery"])
+    submit(db_session, question, ["Slow support", "", None])
+
+    stats = text_analytics.question_stats(db_session, [question.id])[question.id]
+
+    assert stats["avg_length"] == round((13 * 3 + 12) / 4, 1)
+    assert stats["tokens"] == 8
+    assert stats["unique_responses"] == 3 and stats["duplicates"] == 1
+    assert stats["length_histogram"]["10-24"] == 4
+    assert stats["top_terms"][:2] == [
+        {"term": "delivery", "count": 3, "error": 0}, {"term": "fast", "count": 3, "error": 0},
+    ]
+
+
+def test_edit_and_delete_answers(client, admin_auth_headers, db_session, test_survey):
+    """Test edited and deleted answers are taken back out of analytics."""
+    question = text_question(test_survey)
+    submit(db_session, question, ["Blue", "Blue"])
+    answer_ids = [answer.id for answer in question.answers]
+
+    edited = client.put(f"/api/answers/{answer_ids[0]}", json={"text_response": "Green"}, headers=admin_auth_headers)
+    assert edited.status_code == 200
+    assert client.delete(f"/api/answers/{answer_ids[1]}", headers=admin_auth_headers).status_code == 200
+
+    stats = text_analytics.question_stats(db_session, [question.id])[question.id]
+    assert stats["unique_responses"] == 1 and stats["duplicates"] == 0
+    assert [term["term"] for term in stats["top_terms"]] == ["green"]
+
+
+def test_edit_pending_answer(client, admin_auth_headers, db_session, test_survey):
+    """Test an answer edited before the consumer gets to it is analyzed once, as edited."""
+    question = text_question(test_survey)
+    submit(db_session, question, ["Blue"], analyze=False)
+    answer_id = question.answers[0].id
+    assert text_analytics.question_stats(db_session, [question.id]) == {}
+
+    edited = client.put(f"/api/answers/{answer_id}", json={"text_response": "Green"}, headers=admin_auth_headers)
+    assert edited.status_code == 200
+    assert analytics.run_pending(db_session) == 1
+
+    stats = text_analytics.question_stats(db_session, [question.id])[question.id]
+    assert stats["unique_responses"] == 1
+    assert [term["term"] for term in stats["top_terms"]] == ["green"]
+
+
+def test_edit_rejects_non_string_text(client, admin_auth_headers, db_session, test_survey):
+    """Test a text response that isn't a string is rejected."""
+    question = text_question(test_survey)
+    submit(db_session, question, ["Blue"])
+
+    response = client.put(
+        f"/api/answers/{question.answers[0].id}", json={"text_response": ["Green"]}, headers=admin_auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_rebuild_matches_incremental(db_session, test_survey):
+    """Test rebuilding from answers gives the incrementally maintained stats."""
+    question = text_question(test_survey)
+    submit(db_session, question, ["one two", "two three", "one two"])
+    before = text_analytics.question_stats(db_session, [question.id])
+
+    text_analytics.rebuild(db_session, [question.id], batch_size=2)
+    db_session.commit()
+
+    assert text_analytics.question_stats(db_session, [question.id]) == before
@@ -0,0 +1,73 @@
+import datetime
+
+from ORM.models import Answer, QuestionType
+import timeseries
+
+NOW = datetime.datetime(2026, 1, 1, 12, 30)
+
+
+def add_answers(db_session, survey, moments):
+    question = next(q for q in survey.questions if q.type == QuestionType.TEXT)
+    db_session.add_all(
+        Answer(question_id=question.id, text_response="ok", ip_address=f"10.0.0.{n}", created_at=moment)
+        for n, moment in enumerate(moments)
+    )
+    db_session.commit()
+
+
+def test_floor():
+    """Test bucket starts."""
+    assert timeseries.floor(NOW, "hour") == datetime.datetime(2026, 1, 1, 12)
+    assert timeseries.floor(NOW, "day") == datetime.datetime(2026, 1, 1)
+
+
+def test_finished_buckets_are_cached(app, db_session, test_survey, monkeypatch):
+    """Test finished buckets are counted once, the current one every time."""
+    add_answers(db_session, test_survey, [NOW - datetime.timedelta(hours=2), NOW - datetime.timedelta(minutes=20)])
+    queries = []
+    count_buckets = timeseries.count_buckets
+
+    def counting(db_session, survey_id, bucket, since, until, archived=False):
+        queries.append((since, until))
+        return count_buckets(db_session, survey_id, bucket, since, until, archived)
+
+    monkeypatch.setattr(timeseries, "count_buckets", counting)
+    since = NOW - datetime.timedelta(hours=3)
+
+    with app.app_context():
+        first = timeseries.series(db_session, test_survey.id, 1, "hour", since, NOW, now=NOW)
+        add_answers(db_session, test_survey, [NOW])
+        second = timeseries.series(db_session, test_survey.id, 1, "hour", since, NOW, now=NOW)
+
+    assert [point[1] for point in first] == [0, 1, 0, 1]
+    assert [point[1] for point in second] == [0, 1, 0, 2]
+    # The finished hours once, the current one for every request
+    assert queries == [(datetime.datetime(2026, 1, 1, 9), datetime.datetime(2026, 1, 1, 12))] + [
+        (datetime.datetime(2026, 1, 1, 12), datetime.datetime(2026, 1, 1, 13)),
+    ] * 2
+
+
+def test_timeseries_endpoint(client, auth_headers, db_session, test_survey):
+    """Test the endpoint returns every bucket of the window and validates arguments."""
+    add_answers(db_session, test_survey, [datetime.datetime(2026, 1, 1, 10, 5), datetime.datetime(2026, 1, 3, 8)])
+    url = f"/api/surveys/{test_survey.id}/timeseries"
+
+    response = client.get(url, query_string={"bucket": "day", "since": "2026-01-01", "until": "2026-01-03"},
+                          headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [(point["start"][:10], point["answers"]) for point in response.json["points"]] == [
+        ("2026-01-01", 1), ("2026-01-02", 0), ("2026-01-03", 1),
+    ]
+    # Dates with an offset are converted to UTC
+    response = client.get(url, query_string={"bucket": "day", "since": "2026-01-01T00:00:00Z",
+                                             "until": "2026-01-03T02:00:00+02:00"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert [point["answers"] for point in response.json["points"]] == [1, 0, 1]
+    response = client.get(url, query_string={"bucket": "hour", "since": "2026-01-01T12:00:00+02:00"},
+                          headers=auth_headers)
+    assert response.status_code == 400
+    assert client.get(url, query_string={"bucket": "week"}, headers=auth_headers).status_code == 400
+    assert client.get(url, query_string={"bucket": "minute", "since": "2020-01-01"},
+                      headers=auth_headers).status_code == 400
+    assert client.get(url).status_code == 401
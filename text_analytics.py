@@ -0,0 +1,309 @@
+# text_analytics.py
+"""
+Text analytics module.
+Answers to text, word and string questions are summarized by the analytics consumer (see analytics.py) and taken
+back out when they are edited or deleted, so stats never rescan raw text. Per question it keeps the number of
+responses, their total length and tokens, a length histogram, distinct responses (by a 64-bit blake2b digest,
+the rest are exact duplicates) and top terms. Top terms use the space-saving algorithm with at most
+TOP_TERMS_CAPACITY counters per question: a term occurs at most `count` and at least `count - error` times.
+Updates of a question are serialized by locking its text_stats row.
+
+Analytics of questions are summarized from scratch with:
+    python text_analytics.py rebuild
+    python text_analytics.py rebuild --survey 42
+"""
+import re
+import bisect
+import hashlib
+import argparse
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+from db import create_session
+from ORM.models import Question, TEXT_TYPES, Answer, TextStat, TextLengthBucket, TextTerm, TextResponseHash
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my no not of on or so that the this to was we "
+    "were with you your".split(),
+)
+MAX_TERM = 64
+# Lower bounds of response length buckets, in characters
+LENGTH_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000)
+TOP_TERMS_CAPACITY = 100
+TOP_TERMS = 10
+REBUILD_BATCH_SIZE = 5000
+
+
+def digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def bucket_label(bucket):
+    if bucket + 1 < len(LENGTH_BUCKETS):
+        return f"{LENGTH_BUCKETS[bucket]}-{LENGTH_BUCKETS[bucket + 1] - 1}"
+    return f"{LENGTH_BUCKETS[bucket]}+"
+
+
+class Summary:
+    """
+    Aggregates of a batch of responses to one question
+    """
+    def __init__(self, texts=()):
+        self.responses = 0
+        self.total_length = 0
+        self.tokens = 0
+        self.buckets = Counter()
+        self.terms = Counter()
+        self.digests = Counter()
+        for text in texts:
+            self.add(text)
+
+    def add(self, text):
+        tokens = TOKEN.findall(text.lower())
+        self.responses += 1
+        self.total_length += len(text)
+        self.tokens += len(tokens)
+        self.buckets[bisect.bisect_right(LENGTH_BUCKETS, len(text)) - 1] += 1
+        self.terms.update(token for token in tokens if token not in STOPWORDS and len(token) <= MAX_TERM)
+        self.digests[digest(text)] += 1
+
+
+def space_saving(counters, terms, capacity=TOP_TERMS_CAPACITY):
+    """
+    Merges term counts of a batch into space-saving counters {term: (count, error)}: a new term takes over
+    the smallest counter when all of them are used
+    """
+    for term, count in terms.most_common():
+        if term in counters:
+            counters[term] = (counters[term][0] + count, counters[term][1])
+        elif len(counters) < capacity:
+            counters[term] = (count, 0)
+        else:
+            evicted = min(counters, key=lambda key: counters[key][0])
+            floor = counters.pop(evicted)[0]
+            counters[term] = (floor + count, floor)
+    return counters
+
+
+def _lock(db_session, question_id):
+    """
+    Locks the text_stats row of the question, creating it on the first response
+    """
+    query = (
+        sa.select(TextStat).where(TextStat.question_id == question_id)
+        .with_for_update().execution_options(populate_existing=True)
+    )
+    stat = db_session.scalars(query).first()
+    if stat is None:
+        try:
+            with db_session.begin_nested():
+                stat = TextStat(question_id=question_id, responses=0, total_length=0, tokens=0, distinct_responses=0)
+                db_session.add(stat)
+        except IntegrityError:
+            # Created by a concurrent transaction
+            stat = db_session.scalars(query).one()
+    return stat
+
+
+def _save(db_session, model, key, question_id, before, after):
+    """
+    Writes changed counters of the question: {key: {column: value}} before and after the update
+    """
+    column = getattr(model, key)
+    gone = [value for value in before if value not in after]
+    if gone:
+        db_session.execute(sa.delete(model).where(model.question_id == question_id, column.in_(gone)))
+    added = [
+        {"question_id": question_id, key: value, **values} for value, values in after.items() if value not in before
+    ]
+    if added:
+        db_session.execute(sa.insert(model), added)
+    changed = [
+        {"b_key": value, **{f"b_{name}": number for name, number in values.items()}}
+        for value, values in after.items() if value in before and before[value] != values
+    ]
+    if changed:
+        db_session.execute(
+            sa.update(model.__table__)
+            .where(model.question_id == question_id, column == sa.bindparam("b_key"))
+            .values({name: sa.bindparam(f"b_{name}") for name in after[changed[0]["b_key"]]}),
+            changed,
+        )
+
+
+def _apply(db_session, question_id, summary, sign):
+    stat = _lock(db_session, question_id)
+    stat.responses += sign * summary.responses
+    stat.total_length += sign * summary.total_length
+    stat.tokens += sign * summary.tokens
+
+    buckets = dict(db_session.execute(
+        sa.select(TextLengthBucket.bucket, TextLengthBucket.count).where(TextLengthBucket.question_id == question_id),
+    ).all())
+    updated = {bucket: buckets.get(bucket, 0) + sign * count for bucket, count in summary.buckets.items()}
+    _save(db_session, TextLengthBucket, "bucket", question_id,
+          {bucket: {"count": count} for bucket, count in buckets.items() if bucket in updated},
+          {bucket: {"count": count} for bucket, count in updated.items() if count > 0})
+
+    digests = dict(db_session.execute(
+        sa.select(TextResponseHash.digest, TextResponseHash.count)
+        .where(TextResponseHash.question_id == question_id, TextResponseHash.digest.in_(summary.digests)),
+    ).all())
+    updated = {value: digests.get(value, 0) + sign * count for value, count in summary.digests.items()}
+    stat.distinct_responses += (
+        sum(1 for value, count in updated.items() if count > 0 and value not in digests)
+        - sum(1 for value, count in updated.items() if count <= 0 and value in digests)
+    )
+    _save(db_session, TextResponseHash, "digest", question_id,
+          {value: {"count": count} for value, count in digests.items()},
+          {value: {"count": count} for value, count in updated.items() if count > 0})
+
+    counters = {
+        term: (count, error) for term, count, error in db_session.execute(
+            sa.select(TextTerm.term, TextTerm.count, TextTerm.error).where(TextTerm.question_id == question_id),
+        )
+    }
+    if sign > 0:
+        updated = space_saving(dict(counters), summary.terms)
+    else:
+        # Counts of removed responses are taken back from tracked terms, evicted ones are already approximate
+        updated = dict(counters)
+        for term, count in summary.terms.items():
+            if term in updated:
+                remaining = updated[term][0] - count
+                updated[term] = (remaining, min(updated[term][1], remaining))
+        updated = {term: values for term, values in updated.items() if values[0] > 0}
+    _save(db_session, TextTerm, "term", question_id,
+          {term: {"count": count, "error": error} for term, (count, error) in counters.items()},
+          {term: {"count": count, "error": error} for term, (count, error) in updated.items()})
+
+
+def record(db_session, rows, sign=1):
+    """
+    Adds answer rows (dicts with question_id and text_response) to analytics of their text questions,
+    sign=-1 takes them back out for deleted or edited answers. Blank responses are skipped. Commit is up to the caller.
+    """
+    texts = {}
+    for row in rows:
+        if row.get("text_response") and row["text_response"].strip():
+            texts.setdefault(row["question_id"], []).append(row["text_response"])
+    if not texts:
+        return
+    question_ids = db_session.scalars(
+        sa.select(Question.id).where(Question.id.in_(texts), Question.type.in_(TEXT_TYPES)),
+    ).all()
+    # Same lock order in every transaction
+    for question_id in sorted(question_ids):
+        _apply(db_session, question_id, Summary(texts[question_id]), sign)
+
+
+def forget_questions(db_session, question_ids):
+    """
+    Deletes analytics of the questions
+    """
+    for model in (TextLengthBucket, TextTerm, TextResponseHash, TextStat):
+        db_session.execute(sa.delete(model).where(model.question_id.in_(question_ids)))
+
+
+def rebuild(db_session, question_ids, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Summarizes analyzed answers of the questions from scratch by reading them in batches (the consumer adds
+    the others). Commit is up to the caller.
+    """
+    forget_questions(db_session, question_ids)
+    after = 0
+    while question_ids:
+        rows = db_session.execute(
+            sa.select(Answer.id, Answer.question_id, Answer.text_response)
+            .where(
+                Answer.question_id.in_(question_ids), Answer.text_response.isnot(None), Answer.analyzed == sa.true(),
+                Answer.id > after,
+            )
+            .order_by(Answer.id)
+            .limit(batch_size),
+        ).mappings().all()
+        if not rows:
+            break
+        record(db_session, rows)
+        after = rows[-1]["id"]
+
+
+EMPTY_STATS = {
+    "avg_length": 0,
+    "tokens": 0,
+    "unique_responses": 0,
+    "duplicates": 0,
+    "length_histogram": {bucket_label(bucket): 0 for bucket in range(len(LENGTH_BUCKETS))},
+    "top_terms": [],
+}
+
+
+def question_stats(db_session, question_ids):
+    """
+    Analytics of the questions: {question_id: {avg_length, tokens, unique_responses, duplicates,
+    length_histogram, top_terms}}; questions without responses are missing (see EMPTY_STATS)
+    """
+    if not question_ids:
+        return {}
+    stats = {}
+    for stat in db_session.execute(
+        sa.select(TextStat.question_id, TextStat.responses, TextStat.total_length, TextStat.tokens,
+                  TextStat.distinct_responses)
+        .where(TextStat.question_id.in_(question_ids)),
+    ):
+        if stat.responses <= 0:
+            continue
+        stats[stat.question_id] = {
+            "avg_length": round(stat.total_length / stat.responses, 1),
+            "tokens": stat.tokens,
+            "unique_responses": stat.distinct_responses,
+            "duplicates": stat.responses - stat.distinct_responses,
+            "length_histogram": {bucket_label(bucket): 0 for bucket in range(len(LENGTH_BUCKETS))},
+            "top_terms": [],
+        }
+    for question_id, bucket, count in db_session.execute(
+        sa.select(TextLengthBucket.question_id, TextLengthBucket.bucket, TextLengthBucket.count)
+        .where(TextLengthBucket.question_id.in_(stats)),
+    ):
+        stats[question_id]["length_histogram"][bucket_label(bucket)] = count
+    for question_id, term, count, error in db_session.execute(
+        sa.select(TextTerm.question_id, TextTerm.term, TextTerm.count, TextTerm.error)
+        .where(TextTerm.question_id.in_(stats))
+        .order_by(TextTerm.question_id, TextTerm.count.desc(), TextTerm.term),
+    ):
+        terms = stats[question_id]["top_terms"]
+        if len(terms) < TOP_TERMS:
+            terms.append({"term": term, "count": count, "error": error})
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text analytics of answers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_command = commands.add_parser("rebuild", help="summarize existing answers to text questions")
+    rebuild_command.add_argument("--survey", type=int, help="only questions of this survey")
+    rebuild_command.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE, help="answers per query")
+    args = parser.parse_args()
+
+    db_session = create_session()
+    try:
+        query = sa.select(Question.survey_id, Question.id).where(Question.type.in_(TEXT_TYPES))
+        if args.survey is not None:
+            query = query.where(Question.survey_id == args.survey)
+        questions = {}
+        for survey_id, question_id in db_session.execute(query.order_by(Question.survey_id, Question.id)):
+            questions.setdefault(survey_id, []).append(question_id)
+        # One transaction per survey
+        for survey_id, question_ids in questions.items():
+            rebuild(db_session, question_ids, args.batch_size)
+            db_session.commit()
+            print(f"Survey {survey_id}: {len(question_ids)} text questions summarized")
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# timeseries.py
+"""
+Response time series module.
+Answers of a survey are counted per minute, hour or day with SQL date bucketing over answers.created_at.
+Finished buckets (older than TIMESERIES_SETTLE seconds, so late write-behind submissions are in) never change
+until the survey version is bumped by an edit, deletion or archiving, so they are cached per process and
+only buckets after the cached ones are queried again.
+"""
+import os
+import datetime
+import threading
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ORM.models import Question, Answer, ArchivedAnswer
+import metrics
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+# Window returned when `since` isn't given
+DEFAULT_SPANS = {
+    "minute": datetime.timedelta(hours=6),
+    "hour": datetime.timedelta(days=7),
+    "day": datetime.timedelta(days=90),
+}
+MAX_BUCKETS = 5000
+EPOCH = datetime.datetime(1970, 1, 1)
+FORMATS = {
+    "sqlite": {"minute": "%Y-%m-%d %H:%M:00", "hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"},
+    "mysql": {"minute": "%Y-%m-%d %H:%i:00", "hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"},
+}
+
+
+def parse_time(value):
+    """
+    Parses an ISO 8601 date, dates with an offset (or Z) are converted to naive UTC like answers.created_at
+    """
+    # Python 3.10 doesn't accept the Z suffix
+    moment = datetime.datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith(("Z", "z")) else value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def floor(moment, bucket):
+    """
+    Start of the bucket containing the moment
+    """
+    return moment - (moment - EPOCH) % datetime.timedelta(seconds=BUCKETS[bucket])
+
+
+def _bucket_start(dialect, bucket, column):
+    if dialect in ("mysql", "mariadb"):
+        return sa.func.date_format(column, FORMATS["mysql"][bucket])
+    return sa.func.strftime(FORMATS["sqlite"][bucket], column)
+
+
+def count_buckets(db_session, survey_id, bucket, since, until, archived=False):
+    """
+    Answers and unique respondents (by IP address) per bucket in [since, until): {bucket start: (answers, respondents)}
+    """
+    source = ArchivedAnswer if archived else Answer
+    if archived:
+        condition = source.survey_id == survey_id
+    else:
+        condition = source.question_id.in_(sa.select(Question.id).where(Question.survey_id == survey_id))
+    start = _bucket_start(db_session.get_bind().dialect.name, bucket, source.created_at).label("start")
+    rows = db_session.execute(
+        sa.select(start, sa.func.count(source.id), sa.func.count(sa.distinct(source.ip_address)))
+        .where(condition, source.created_at >= since, source.created_at < until)
+        .group_by(start),
+    )
+    return {datetime.datetime.fromisoformat(start): (answers, respondents) for start, answers, respondents in rows}
+
+
+class BucketCache:
+    """
+    Finished buckets per (survey, bucket size, survey version): counts from `start` up to `finished`
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def series(db_session, survey_id, version, bucket, since, until, archived=False, now=None):
+    """
+    Buckets of the survey from since to until (both rounded down to a bucket start):
+    [(bucket start, answers, respondents)] with empty buckets included
+    """
+    now = now or datetime.datetime.utcnow()
+    since, until = floor(since, bucket), floor(until, bucket)
+    size = datetime.timedelta(seconds=BUCKETS[bucket])
+    # Buckets ending before this are finished, all of them once answers are archived
+    finished = until + size
+    if not archived:
+        settle = datetime.timedelta(seconds=current_app.config["TIMESERIES_SETTLE"])
+        finished = min(finished, floor(now - settle, bucket))
+
+    cache = current_app.extensions["timeseries"]
+    key = (survey_id, bucket, version, archived)
+    entry = cache.get(key)
+    hit = entry is not None and entry["start"] <= since
+    metrics.record_cache("timeseries", hit)
+    if not hit:
+        entry = {"start": since, "finished": since, "counts": {}}
+    if entry["finished"] < finished:
+        # Immutable from now on, counted once
+        counts = count_buckets(db_session, survey_id, bucket, entry["finished"], finished, archived)
+        counts.update(entry["counts"])
+        entry = {"start": entry["start"], "finished": finished, "counts": counts}
+        cache.put(key, entry)
+
+    counts = entry["counts"]
+    if entry["finished"] <= until:
+        counts = {**counts, **count_buckets(db_session, survey_id, bucket, entry["finished"], until + size, archived)}
+
+    points = []
+    moment = since
+    while moment <= until:
+        points.append((moment, *counts.get(moment, (0, 0))))
+        moment += size
+    return points
+
+
+def init_app(app):
+    """
+    Creates the bucket cache. Configuration:
+    TIMESERIES_SETTLE - seconds after which a bucket is finished (env TIMESERIES_SETTLE, default SUBMISSION_MAX_LAG)
+    TIMESERIES_CACHE_SIZE - cached series per process (env TIMESERIES_CACHE_SIZE)
+    """
+    app.config.setdefault(
+        "TIMESERIES_SETTLE", float(os.environ.get("TIMESERIES_SETTLE", app.config["SUBMISSION_MAX_LAG"])),
+    )
+    app.config.setdefault("TIMESERIES_CACHE_SIZE", int(os.environ.get("TIMESERIES_CACHE_SIZE", 256)))
+    app.extensions["timeseries"] = BucketCache(app.config["TIMESERIES_CACHE_SIZE"])